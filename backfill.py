@@ -2,8 +2,12 @@
 Skips the 'already seen' filter so these get durations, details, quality filter,
 Gemini scoring, notifications, and auto-contact."""
 
+import atexit
+
 from flathunter.config import Config
-from flathunter.googlecloud_idmaintainer import GoogleCloudIdMaintainer
+from flathunter.detail_cache import detail_cache
+from flathunter.expose import Expose
+from flathunter.idmaintainer import create_id_maintainer
 from flathunter.logging import configure_logging, logger
 from flathunter.processor import ProcessorChain
 
@@ -30,7 +34,9 @@ for e in EXPOSES:
 config = Config("config.yaml")
 configure_logging(config)
 config.init_searchers()
-id_watch = GoogleCloudIdMaintainer(config)
+detail_cache.configure(config)
+id_watch = create_id_maintainer(config)
+atexit.register(id_watch.close)
 
 # Pipeline: durations → details → quality filter → Gemini → notify → auto-contact
 # No save_all, no filter_already_seen
@@ -48,8 +54,9 @@ chain = (
 )
 
 results = []
-for expose in chain.process(iter(EXPOSES)):
+for expose in chain.process(Expose(e) for e in EXPOSES):
     logger.info("Backfilled: %s (score=%s)", expose["title"], expose.get("gemini_score", "N/A"))
     results.append(expose)
 
+detail_cache.log_stats()
 logger.info("Done. %d exposes passed quality filter and were processed.", len(results))
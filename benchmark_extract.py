@@ -0,0 +1,66 @@
+"""Benchmark of result page extraction: times the BeautifulSoup and the lxml
+backend of every crawler with an extractor on the result pages of a recorded
+run, and checks that both extract the same exposes.
+
+    python flathunt.py --record run.jsonl.gz
+    python benchmark_extract.py run.jsonl.gz"""
+
+import argparse
+import time
+
+from flathunter.cassette import REPLAY, Cassette
+from flathunter.config import YamlConfig
+
+
+def crawlers(parser):
+    """The crawlers with an extractor, parsing with the given backend"""
+    config = YamlConfig({'crawl': {'parser': parser}})
+    config.init_searchers()
+    return {crawler.get_name(): crawler for crawler in config.searchers()
+            if crawler.EXTRACTOR is not None}
+
+
+def timed(crawler, response, rounds):
+    """Exposes extracted from the response, and milliseconds per page"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        entries = crawler.extract_data(crawler.parse_page(response))
+    return entries, (time.perf_counter() - start) * 1000 / rounds
+
+
+def main():
+    """Run the benchmark on the cassette given on the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', maxsplit=1)[0])
+    parser.add_argument('cassette', help='cassette recorded with flathunt.py --record')
+    parser.add_argument('--rounds', type=int, default=10, help='parses per page')
+    args = parser.parse_args()
+
+    bs4_crawlers = crawlers('bs4')
+    lxml_crawlers = crawlers('lxml')
+    timings = {}
+    for response in Cassette(args.cassette, REPLAY).responses():
+        if response.status_code != 200:
+            continue
+        for name, crawler in bs4_crawlers.items():
+            if crawler.URL_PATTERN.search(response.url):
+                break
+        else:
+            continue
+        expected, bs4_ms = timed(crawler, response, args.rounds)
+        if not expected:
+            # Not a result page
+            continue
+        entries, lxml_ms = timed(lxml_crawlers[name], response, args.rounds)
+        if entries != expected:
+            print(f"{name}: backends disagree on {response.url}")
+        pages, bs4_total, lxml_total = timings.get(name, (0, 0.0, 0.0))
+        timings[name] = (pages + 1, bs4_total + bs4_ms, lxml_total + lxml_ms)
+
+    print(f"{'crawler':<16}{'pages':>6}{'bs4 ms':>10}{'lxml ms':>10}{'speedup':>9}")
+    for name, (pages, bs4_total, lxml_total) in sorted(timings.items()):
+        print(f"{name:<16}{pages:>6}{bs4_total / pages:>10.2f}{lxml_total / pages:>10.2f}"
+              f"{bs4_total / lxml_total:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,44 @@
 """Interface for webcrawlers. Crawler implementations should subclass this"""
 from abc import ABC
+import asyncio
+import codecs
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import re
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 import backoff
+import httpx
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree
 
+from flathunter.http_client import http_client
 from flathunter.logging import logger
+from flathunter.detail_cache import detail_cache
+from flathunter.expose import Expose
+from flathunter.extractors import Extractor, select, text as node_text
+from flathunter.page_cache import CachedPage, page_cache
+
+
+_HEADER_CHARSET = re.compile(r'charset=["\']?([\w-]+)', re.IGNORECASE)
+_META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+def page_encoding(resp: requests.Response) -> str:
+    """The encoding of a page: from the Content-Type header, else from the
+    <meta charset> (or http-equiv) tag near the top of the page, else UTF-8"""
+    charset = _HEADER_CHARSET.search(resp.headers.get('Content-Type', ''))
+    if charset is not None:
+        encoding = charset.group(1)
+    else:
+        meta = _META_CHARSET.search(resp.content[:4096])
+        encoding = meta.group(1).decode('ascii') if meta else 'utf-8'
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return 'utf-8'
 
 
 class Crawler(ABC):
@@ -14,6 +46,22 @@ class Crawler(ABC):
 
     URL_PATTERN: re.Pattern
     BASE_URL: str | None = None
+    # Number of result pages of one search fetched at the same time
+    PAGE_CONCURRENCY = 4
+    # Number of expose detail pages of this crawler fetched at the same time
+    DETAIL_CONCURRENCY = 4
+    # Expose fields get_expose_details sets. With lazy details, the detail
+    # page is only fetched once an expose reaches a stage that needs one of
+    # them that is missing, unless the Warmmiete is among them.
+    DETAIL_FIELDS: frozenset = frozenset({'detail_description', 'detail_photos',
+                                          'detail_total_photos'})
+    # CSS selector of the pagination links on search result pages, for
+    # crawlers whose page URLs cannot be built from a page number
+    PAGINATION_SELECTOR: str | None = None
+    # Declarative description of the result items (see flathunter.extractors).
+    # Result pages of crawlers with an extractor are parsed into lxml trees,
+    # unless the 'bs4' parser is configured.
+    EXTRACTOR: Extractor | None = None
 
     HEADERS = {
         'Connection': 'keep-alive',
@@ -32,6 +80,20 @@ class Crawler(ABC):
 
     def __init__(self, config):
         self.config = config
+        # Store for the validators of search result pages (see fetch_page).
+        # Set by the Hunter when conditional requests are enabled.
+        self.page_state = None
+        # Validators of the pages fetched in this run, stored by
+        # commit_page_states once the run has processed their exposes
+        self._pending_page_states: List[Tuple[str, Dict]] = []
+        self._page_state_lock = threading.Lock()
+        # Id maintainer whose processed state is prefetched for every result
+        # page, and used to stop paging once a page has only known exposes.
+        # Set by the Hunter.
+        self.id_watch = None
+        # Process pool that result pages are parsed in (see extract_results).
+        # Set by the Hunter when crawl.parse_processes is configured.
+        self.parse_pool = None
 
     def _abs(self, href):
         """Make a relative URL absolute using this crawler's BASE_URL."""
@@ -58,44 +120,334 @@ class Crawler(ABC):
 
     def get_page(self, search_url, page_no=None) -> BeautifulSoup:
         """Applies a page number to a formatted search URL and fetches the exposes at that page"""
-        return self.get_soup_from_url(search_url)
+        url = self.get_page_url(search_url, page_no or 1) or search_url
+        return self.parse_page(self.request_page(url, {}))
+
+    def get_page_url(self, search_url, page_no) -> Optional[str]:
+        """URL of the given result page of a search, or None if this crawler
+        cannot build page URLs. Subclasses with paginated results override this."""
+        return search_url if page_no == 1 else None
+
+    def get_page_count(self, soup) -> int:
+        """Number of result pages, as shown by the first page's pagination"""
+        return 1
+
+    @staticmethod
+    def _max_page_number(soup, selector) -> int:
+        """Highest page number among the texts of the pagination elements"""
+        numbers = [int(text) for text in
+                   (node_text(el, strip_parts=True) for el in select(soup, selector))
+                   if text.isdigit()]
+        return max(numbers, default=1)
+
+    def page_limit(self, max_pages: Optional[int] = None) -> int:
+        """Number of result pages crawled per search URL: max_pages if given
+        (e.g. on the command line), otherwise the configured crawl.max_pages"""
+        return max_pages if max_pages is not None else self.config.crawl_max_pages()
+
+    def get_page_urls(self, search_url, soup, max_pages=None) -> List[str]:
+        """URLs of the result pages after the first one, up to max_pages (or the
+        configured crawl.max_pages). Built from get_page_url and get_page_count,
+        or collected from the PAGINATION_SELECTOR links on the first page."""
+        limit = self.page_limit(max_pages)
+        if limit <= 1:
+            return []
+        if self.get_page_url(search_url, 2) is not None:
+            last_page = min(self.get_page_count(soup), limit)
+            return [self.get_page_url(search_url, page_no) for page_no in range(2, last_page + 1)]
+        if self.PAGINATION_SELECTOR is None:
+            return []
+        urls = []
+        for link in select(soup, self.PAGINATION_SELECTOR):
+            href = link.get('href', '')
+            if not href or href.startswith('#'):
+                continue
+            url = self._abs(href)
+            if url != search_url and url not in urls:
+                urls.append(url)
+        return urls[:limit - 1]
+
+    def fetch_detail_page(self, url: str, load: Callable[[], requests.Response]) -> CachedPage:
+        """Fetches an expose page through the per-run page cache, which in turn
+        is backed by the on-disk detail cache"""
+        return page_cache.fetch(url, lambda: detail_cache.fetch(url, self.get_name(), load))
 
     @backoff.on_exception(wait_gen=backoff.constant,
                           exception=requests.exceptions.RequestException,
                           max_tries=3)
     def get_soup_from_url(self, url: str) -> BeautifulSoup:
-        """Creates a Soup object from the HTML at the provided URL"""
-        resp = requests.get(url, headers=self.HEADERS, timeout=30)
-        if resp.status_code not in (200, 405):
-            logger.error("Got response (%i): %s", resp.status_code, resp.content)
+        """Creates a Soup object from the HTML at the provided URL. The page is
+        shared with other stages through the per-run page cache."""
+        page = self.fetch_detail_page(
+            url, lambda: http_client.get(url, headers=self.HEADERS, timeout=30))
+        if page.status_code not in (200, 405):
+            logger.error("Got response (%i): %s", page.status_code, page.content)
+
+        return page.soup
+
+    @backoff.on_exception(wait_gen=backoff.constant,
+                          exception=requests.exceptions.RequestException,
+                          max_tries=3)
+    def request_page(self, url: str, headers: Dict[str, str]) -> requests.Response:
+        """Requests a search result page. `headers` holds the conditional request
+        headers, subclasses that need special headers or sessions override this"""
+        return http_client.get(url, headers={**self.HEADERS, **headers}, timeout=30)
+
+    def parse_page(self, resp: requests.Response):
+        """Parses a search result page response. With the default 'lxml'
+        parser, crawlers with an EXTRACTOR get an lxml tree of the whole page;
+        parsing it all in C is faster than building only parts of it from
+        Python callbacks. With the 'bs4' parser, or for crawlers without an
+        EXTRACTOR, a Soup object is created."""
+        encoding = page_encoding(resp)
+        if self.EXTRACTOR is not None and self.config.crawl_parser() == 'lxml':
+            if resp.content.strip():
+                tree = etree.fromstring(resp.content, etree.HTMLParser(encoding=encoding))
+                if tree is not None:
+                    return tree
+            return BeautifulSoup('', 'lxml')
+        return BeautifulSoup(resp.content, 'lxml', from_encoding=encoding)
+
+    def skips_unchanged(self, search_url, max_pages: Optional[int] = None) -> bool:
+        """True if an unchanged first result page means that the search has no
+        new exposes: only the first page is crawled (see page_limit), or the
+        search is sorted newest first, so new exposes show up on the first
+        page. Otherwise new exposes may be on later pages, which have to be
+        fetched anyway."""
+        return self.page_limit(max_pages) <= 1 or self.is_sorted_newest_first(search_url)
 
-        return BeautifulSoup(resp.content, 'lxml')
+    def fetch_page(self, url: str, state_key: Optional[str] = None,
+                   request=None, skip_unchanged: bool = True) -> Optional[requests.Response]:
+        """Fetches the first result page of a search with a conditional request.
+        Returns None if the page has not changed since the last run, either
+        because the site says so (304) or because the body is byte-identical.
+        `request` is called with the conditional headers and defaults to
+        `request_page` for the URL. With skip_unchanged false (see
+        skips_unchanged), the page is always fetched and returned."""
+        if request is None:
+            request = lambda headers: self.request_page(url, headers)  # pylint: disable=unnecessary-lambda-assignment
+        conditional = self.conditional_request(url, state_key, skip_unchanged)
+        if conditional is None:
+            return request({})
+        key, state, headers = conditional
+        return self.check_unchanged(key, state, request(headers))
+
+    def conditional_request(self, url: str, state_key: Optional[str] = None,
+                            skip_unchanged: bool = True) -> Optional[Tuple[str, Dict, Dict]]:
+        """The state key, the stored validators and the conditional request
+        headers of a first result page, or None if the page is to be fetched
+        unconditionally (see fetch_page)"""
+        if self.page_state is None or not skip_unchanged:
+            return None
+        key = state_key or url
+        return (key, *self.conditional_headers(key))
+
+    def conditional_headers(self, key: str) -> Tuple[Dict, Dict[str, str]]:
+        """The stored validators of a search page, and the conditional
+        request headers built from them"""
+        state = self.page_state.get_page_state(key) or {}
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+        return state, headers
+
+    def check_unchanged(self, key: str, state: Dict, resp):
+        """The response to a conditional request, or None if the page has not
+        changed since the validators in `state` were stored"""
+        if resp.status_code == 304:
+            logger.debug("Search page %s not modified since the last run", key)
+            return None
+        if resp.status_code != 200:
+            if resp.status_code != 405:
+                logger.error("Got response (%i): %s", resp.status_code, resp.content)
+            return resp
+
+        digest = hashlib.sha256(resp.content).hexdigest()
+        if digest == state.get('hash'):
+            logger.debug("Search page %s unchanged since the last run", key)
+            return None
+        resp.page_state = (key, {  # type: ignore[attr-defined]
+            'etag': resp.headers.get('ETag'),
+            'last_modified': resp.headers.get('Last-Modified'),
+            'hash': digest,
+        })
+        return resp
+
+    def keep_page_state(self, resp: requests.Response):
+        """Remembers the validators of a fetched page once its search has been
+        crawled. They are only stored by commit_page_states."""
+        page_state = getattr(resp, 'page_state', None)
+        if self.page_state is not None and page_state is not None:
+            with self._page_state_lock:
+                self._pending_page_states.append(page_state)
+
+    def commit_page_states(self):
+        """Stores the validators of the pages crawled in this run. Called by the
+        Hunter once the processor chain is through with their exposes, so that
+        a run that dies halfway does not skip unprocessed pages next time."""
+        with self._page_state_lock:
+            pending, self._pending_page_states = self._pending_page_states, []
+        for page_state in pending:
+            self.page_state.save_page_state(*page_state)
+
+    def page_concurrency(self) -> int:
+        """Number of result pages fetched at once, from the config or PAGE_CONCURRENCY"""
+        return self.config.crawl_page_concurrency(self.get_name(), self.PAGE_CONCURRENCY)
+
+    def fetch_pages(self, fetch: Callable, pages: Iterable,
+                    stop: Optional[Callable] = None) -> List:
+        """Calls fetch for every page (number or URL), up to page_concurrency()
+        at a time, and returns the results in page order. If `stop` is given,
+        pages are fetched in batches of page_concurrency(), and paging ends at
+        the first result for which stop returns true (that result is dropped)."""
+        pages = list(pages)
+        if not pages:
+            return []
+        results: List = []
+        with ThreadPoolExecutor(max_workers=min(self.page_concurrency(), len(pages)),
+                                thread_name_prefix=f"{self.get_name()}-pages") as executor:
+            for batch in self.page_batches(pages, stop):
+                if self.take_pages(results, executor.map(fetch, batch), stop):
+                    break
+        return results
+
+    def page_batches(self, pages: List, stop: Optional[Callable]) -> List[List]:
+        """The pages in the batches fetch_pages fetches at once: all of them,
+        or page_concurrency() at a time if paging can stop early"""
+        batch_size = self.page_concurrency() if stop is not None else len(pages)
+        return [pages[start:start + batch_size] for start in range(0, len(pages), batch_size)]
+
+    def take_pages(self, results: List, batch: Iterable, stop: Optional[Callable]) -> bool:
+        """Appends the results of a batch of pages to `results`, up to the
+        first one that `stop` returns true for. True if paging stops there."""
+        for result in batch:
+            if stop is not None and stop(result):
+                logger.debug("%s: stopped paging after %d more pages",
+                             self.get_name(), len(results))
+                return True
+            results.append(result)
+        return False
+
+    def detail_concurrency(self) -> int:
+        """Number of detail pages fetched at once, from the config or DETAIL_CONCURRENCY"""
+        return self.config.crawl_detail_concurrency(self.get_name(), self.DETAIL_CONCURRENCY)
+
+    def is_sorted_newest_first(self, search_url) -> bool:
+        """True if the search results are sorted by date, newest first. Only then
+        can paging stop at the first page with only known exposes."""
+        return False
+
+    def stop_condition(self, search_url) -> Optional[Callable]:
+        """Returns is_page_seen if paging this search can stop early, else None"""
+        if self.id_watch is None or not self.config.crawl_early_stop() \
+                or not self.is_sorted_newest_first(search_url):
+            return None
+        return self.is_page_seen
+
+    def prefetch_seen(self, entries):
+        """Loads the processed state and the saved fingerprints of the
+        exposes with batched lookups, if the id maintainer supports it"""
+        if not entries:
+            return
+        ids = [entry['id'] for entry in entries]
+        for name in ('prefetch_processed', 'prefetch_saved'):
+            prefetch = getattr(self.id_watch, name, None)
+            if prefetch is not None:
+                prefetch(ids)
+
+    def further_pages(self, search_url, entries,
+                      pages: Iterable) -> Tuple[List, Optional[Callable]]:
+        """The result pages to fetch after the first page of a search, none if
+        the first page has only known exposes, and the stop condition for
+        paging through them"""
+        stop = self.stop_condition(search_url)
+        if stop is not None and stop(entries):
+            logger.debug("First page of %s has only known exposes", search_url)
+            return [], stop
+        pages = list(pages)
+        if pages:
+            logger.debug("Fetching up to %d more result pages for %s", len(pages), search_url)
+        return pages, stop
+
+    def collect_results(self, first_page, entries: List[Dict], pages: Iterable[List[Dict]]):
+        """The exposes of the first result page followed by the new ones of
+        the further pages, once the validators of the first page are kept"""
+        seen = {entry['id'] for entry in entries}
+        for page in pages:
+            for entry in page:
+                # listings can move to the next page while we are paging
+                if entry['id'] not in seen:
+                    seen.add(entry['id'])
+                    entries.append(entry)
+        logger.debug('Number of found entries: %d', len(entries))
+        self.keep_page_state(first_page)
+        return entries
+
+    def is_page_seen(self, entries) -> bool:
+        """True if every expose of a result page has already been processed"""
+        if not entries:
+            return False
+        self.prefetch_seen(entries)
+        return all(self.id_watch.is_processed(entry['id']) for entry in entries)
 
     def extract_data(self, raw_data):
         """Should be implemented in subclass"""
         raise NotImplementedError
 
+    def extract_page(self, resp: requests.Response, search_url: Optional[str] = None,
+                     max_pages=None) -> Tuple[List[Dict], List[str]]:
+        """Parses a result page and returns its exposes and, if the search URL
+        is given, the URLs of the further result pages (see get_page_urls)"""
+        page = self.parse_page(resp)
+        entries = self.extract_data(page)
+        page_urls = self.get_page_urls(search_url, page, max_pages) if search_url else []
+        return entries, page_urls
+
+    def extract_results(self, resp: requests.Response, search_url: Optional[str] = None,
+                        max_pages=None) -> Tuple[List[Dict], List[str]]:
+        """extract_page, run in the parse pool if there is one"""
+        if self.parse_pool is not None:
+            return self.parse_pool.extract_page(self, resp, search_url, max_pages)
+        return self.extract_page(resp, search_url, max_pages)
+
     def get_results(self, search_url, max_pages=None):
         """Loads the exposes from the site, starting at the provided URL"""
         logger.debug("Got search URL %s", search_url)
 
-        soup = self.get_page(search_url)
-        entries = self.extract_data(soup)
-        logger.debug('Number of found entries: %d', len(entries))
+        resp = self.fetch_page(search_url,
+                               skip_unchanged=self.skips_unchanged(search_url, max_pages))
+        if resp is None:
+            return []
+        entries, page_urls = self.extract_results(resp, search_url, max_pages)
+        page_urls, stop = self.further_pages(search_url, entries, page_urls)
+        pages = self.fetch_pages(
+            lambda url: self.extract_results(self.request_page(url, {}))[0], page_urls, stop)
+        return self.collect_results(resp, entries, pages)
 
-        return entries
+    def matches_url(self, url) -> bool:
+        """Returns true if this crawler is responsible for the provided URL"""
+        return re.search(self.URL_PATTERN, url) is not None
 
     def crawl(self, url, max_pages=None):
-        """Load as many exposes as possible from the provided URL"""
-        if re.search(self.URL_PATTERN, url):
+        """Load as many exposes as possible from the provided URL, as Expose records"""
+        if self.matches_url(url):
             try:
-                return self.get_results(url, max_pages)
+                entries = self.get_results(url, max_pages)
+                self.prefetch_seen(entries)
+                return [Expose.of(entry) for entry in entries]
             except requests.exceptions.ConnectionError:
                 logger.warning(
                     "Connection to %s failed. Retrying.", url.split('/')[2])
                 return []
         return []
 
+    def connection_urls(self, search_url) -> List[str]:
+        """URLs whose hosts this crawler talks to when crawling the search URL.
+        Used to warm up connections at startup."""
+        return [search_url]
+
     def get_name(self):
         """Returns the name of this crawler"""
         return type(self).__name__
@@ -104,3 +456,132 @@ class Crawler(ABC):
         """Enrich expose with detail_description, detail_photos, detail_total_photos,
         and optionally detail_contact_name / warmmiete. Subclasses should override."""
         return expose
+
+
+class AsyncCrawler(Crawler):
+    """A crawler that also implements the coroutine interface of the async
+    engine. Under the sync engine it is used like any other Crawler. Under the
+    async engine, result and detail pages are fetched through the shared
+    client's async transport on the event loop, and only parsing and the id
+    maintainer lookups are run on threads.
+
+    Subclasses implement parse_details, and request_detail / arequest_detail
+    if detail pages need other headers, instead of get_expose_details."""
+
+    async def arequest_page(self, url: str, headers: Dict[str, str]) -> httpx.Response:
+        """Coroutine variant of request_page"""
+        return await http_client.aget(url, headers={**self.HEADERS, **headers}, timeout=30)
+
+    async def afetch_page(self, url: str, state_key: Optional[str] = None,
+                          request=None, skip_unchanged: bool = True) -> Optional[httpx.Response]:
+        """Coroutine variant of fetch_page; `request` is a coroutine function"""
+        if request is None:
+            request = lambda headers: self.arequest_page(url, headers)  # pylint: disable=unnecessary-lambda-assignment
+        conditional = await asyncio.to_thread(self.conditional_request, url, state_key,
+                                              skip_unchanged)
+        if conditional is None:
+            return await request({})
+        key, state, headers = conditional
+        return self.check_unchanged(key, state, await request(headers))
+
+    async def afetch_pages(self, fetch: Callable, pages: Iterable,
+                           stop: Optional[Callable] = None) -> List:
+        """Coroutine variant of fetch_pages; `fetch` is a coroutine function"""
+        pages = list(pages)
+        if not pages:
+            return []
+        slots = asyncio.Semaphore(self.page_concurrency())
+
+        async def fetch_one(page):
+            async with slots:
+                return await fetch(page)
+
+        results: List = []
+        for batch in self.page_batches(pages, stop):
+            fetched = await asyncio.gather(*(fetch_one(page) for page in batch))
+            if await asyncio.to_thread(self.take_pages, results, fetched, stop):
+                break
+        return results
+
+    async def aget_results(self, search_url, max_pages=None):
+        """Coroutine variant of get_results"""
+        logger.debug("Got search URL %s", search_url)
+
+        resp = await self.afetch_page(search_url,
+                                      skip_unchanged=self.skips_unchanged(search_url, max_pages))
+        if resp is None:
+            return []
+        entries, page_urls = await asyncio.to_thread(self.extract_results, resp,
+                                                     search_url, max_pages)
+        page_urls, stop = await asyncio.to_thread(self.further_pages, search_url,
+                                                  entries, page_urls)
+
+        async def fetch(url):
+            page = await self.arequest_page(url, {})
+            return (await asyncio.to_thread(self.extract_results, page))[0]
+
+        pages = await self.afetch_pages(fetch, page_urls, stop)
+        return self.collect_results(resp, entries, pages)
+
+    async def acrawl(self, url, max_pages=None):
+        """Coroutine variant of crawl"""
+        if self.matches_url(url):
+            try:
+                entries = await self.aget_results(url, max_pages)
+                await asyncio.to_thread(self.prefetch_seen, entries)
+                return [Expose.of(entry) for entry in entries]
+            except httpx.ConnectError:
+                logger.warning("Connection to %s failed.", url.split('/')[2])
+                return []
+        return []
+
+    def detail_url(self, expose) -> str:
+        """URL of the expose's detail page"""
+        return expose.get('url', '')
+
+    def request_detail(self, url: str) -> requests.Response:
+        """Requests a detail page"""
+        return http_client.get(url, headers=self.HEADERS, timeout=15)
+
+    async def arequest_detail(self, url: str) -> httpx.Response:
+        """Coroutine variant of request_detail"""
+        return await http_client.aget(url, headers=self.HEADERS, timeout=15)
+
+    async def afetch_detail_page(self, url: str) -> CachedPage:
+        """Coroutine variant of fetch_detail_page. Concurrent fetches of a page
+        that is not cached yet are not merged, unlike in the page cache."""
+        page = page_cache.get(url)
+        if page is not None:
+            return page
+        if detail_cache.enabled:
+            page = await asyncio.to_thread(detail_cache.get, url, self.get_name())
+        if page is None:
+            page = CachedPage.from_response(await self.arequest_detail(url))
+            if page.ok and detail_cache.enabled:
+                await asyncio.to_thread(detail_cache.put, url, self.get_name(), page)
+        return page_cache.fetch(url, lambda: page)
+
+    def parse_details(self, expose, page: Optional[CachedPage]):
+        """Enrich the expose from its detail page. `page` is None if the page
+        could not be fetched; it may also be an error page (see page.ok).
+        Should be implemented in the subclass."""
+        return expose
+
+    def get_expose_details(self, expose):
+        url = self.detail_url(expose)
+        try:
+            page = self.fetch_detail_page(url, lambda: self.request_detail(url))
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.debug("Failed to fetch details for %s: %s", url, exc)
+            page = None
+        return self.parse_details(expose, page)
+
+    async def aget_expose_details(self, expose):
+        """Coroutine variant of get_expose_details"""
+        url = self.detail_url(expose)
+        try:
+            page = await self.afetch_detail_page(url)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.debug("Failed to fetch details for %s: %s", url, exc)
+            page = None
+        return await asyncio.to_thread(self.parse_details, expose, page)
@@ -1,10 +1,44 @@
-"""Abstract class defining the 'Processor' interface"""
-from typing import Dict
+"""Abstract classes defining the 'Processor' interfaces"""
+from typing import AsyncIterator, Dict, FrozenSet, Optional
+
+from flathunter.utils.concurrency import astream_map
+
+# Relative per-expose costs of processors, used to plan the processor chain
+COST_LOCAL = 0
+COST_STORE = 5
+COST_FETCH = 10
+COST_API = 50
+COST_LLM = 100
+
 
 class Processor:
     """Processor interface. Flathunter runs sequences of exposes through
        a set of processors that stack on each other"""
 
+    # Planning hints for ProcessorChainBuilder, which runs cheap filters
+    # before expensive stages. COST is the relative cost per expose.
+    COST = COST_LOCAL
+    # Expose fields the processor reads and writes
+    REQUIRES: FrozenSet[str] = frozenset()
+    PROVIDES: FrozenSet[str] = frozenset()
+    # Processors with side effects keep their place, and no processor is
+    # moved across them
+    SIDE_EFFECT = False
+    # True if the processor only drops exposes
+    FILTER = False
+    # True for filters that can also run on list-page data, ahead of the
+    # stages providing their fields: an expose they drop then would be
+    # dropped later as well
+    PRECHECK = False
+    # Fields the processor may leave deferred on the exposes (see
+    # Expose.defer). plan_stages adds the stage returned by load_deferred
+    # before the first stage that requires one of them.
+    DEFERS: FrozenSet[str] = frozenset()
+
+    def load_deferred(self) -> Optional['Processor']:
+        """The stage loading the fields in DEFERS"""
+        return None
+
     def process_expose(self, expose: Dict) -> Dict:
         """Mutate the expose. Should be implemented in the subclass"""
         return expose
@@ -12,3 +46,21 @@ class Processor:
     def process_exposes(self, exposes):
         """Apply the processor to every expose in the sequence"""
         return map(self.process_expose, exposes)
+
+
+class AsyncProcessor:
+    """Processor interface for the async engine. process_expose is awaited
+       for up to CONCURRENCY exposes at once; returning None drops the expose"""
+
+    CONCURRENCY = 32
+
+    async def process_expose(self, expose: Dict) -> Optional[Dict]:
+        """Mutate the expose. Should be implemented in the subclass"""
+        return expose
+
+    async def process_exposes(self, exposes: AsyncIterator[Dict]) -> AsyncIterator[Dict]:
+        """Apply the processor to every expose in the async sequence,
+           yielding results in completion order"""
+        async for expose in astream_map(self.process_expose, exposes, self.CONCURRENCY):
+            if expose is not None:
+                yield expose
@@ -23,4 +23,13 @@ def parse():
                         default=default_config_path,
                         help=f'Config file to use. If not set, try to use "{default_config_path}"'
                         )
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument('--record', metavar='CASSETTE',
+                          help='Record all outbound requests of the run to this file')
+    cassette.add_argument('--replay', metavar='CASSETTE',
+                          help='Serve all outbound requests from a recorded file, offline')
+    parser.add_argument('--explain', action='store_true',
+                        help='Print the resolved order of the processing stages and exit')
+    parser.add_argument('--compact', action='store_true',
+                        help='Apply the retention policy to the database and exit')
     return parser.parse_args()
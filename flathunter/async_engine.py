@@ -0,0 +1,267 @@
+"""Asyncio execution engine. Runs the crawls and the processor chain on one
+event loop, so that many requests can be in flight without a thread per
+request. Native `AsyncCrawler` and `AsyncProcessor` plugins run directly on
+the loop; existing sync plugins are run through adapters on a bounded
+thread pool. Sync processors with side effects (notifiers, contactors, the
+saving stages) handle one expose at a time, as under the sync engine."""
+import asyncio
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+import requests
+
+from flathunter.abstract_crawler import AsyncCrawler, Crawler
+from flathunter.abstract_processor import AsyncProcessor, Processor
+from flathunter.default_processors import CrawlExposeDetails, LoadDeferredDetails
+from flathunter.expose import Expose
+from flathunter.http_client import http_client
+from flathunter.logging import logger
+
+_END = object()
+
+
+class SyncCrawlerAdapter:
+    """Exposes a sync Crawler through the AsyncCrawler coroutine interface"""
+
+    crawler: Crawler
+
+    def __init__(self, crawler: Crawler, executor: ThreadPoolExecutor):
+        self.crawler = crawler
+        self.executor = executor
+
+    def __getattr__(self, name):
+        return getattr(self.crawler, name)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def aget_results(self, search_url, max_pages=None):
+        """Run the sync get_results on the thread pool"""
+        return await self._run(self.crawler.get_results, search_url, max_pages)
+
+    async def acrawl(self, url, max_pages=None):
+        """Run the sync crawl on the thread pool"""
+        return await self._run(self.crawler.crawl, url, max_pages)
+
+    async def aget_expose_details(self, expose):
+        """Run the sync get_expose_details on the thread pool"""
+        return await self._run(self.crawler.get_expose_details, expose)
+
+
+def adapt_crawler(crawler: Crawler, executor: ThreadPoolExecutor):
+    """Return the crawler itself if it is async-native, otherwise an adapter"""
+    if isinstance(crawler, AsyncCrawler):
+        return crawler
+    return SyncCrawlerAdapter(crawler, executor)
+
+
+class SyncProcessorAdapter(AsyncProcessor):
+    """Runs a sync Processor inside the async chain. Processors that only
+    implement process_expose run on the thread pool, one call per expose.
+    Processors that override process_exposes (filters, batching stages) get
+    a dedicated thread that consumes a bridged iterator, so their streaming
+    behaviour is preserved."""
+
+    def __init__(self, processor: Processor, executor: ThreadPoolExecutor, concurrency: int):
+        self.processor = processor
+        self.executor = executor
+        # Side effects (messages, contact requests) are not run in parallel
+        self.CONCURRENCY = 1 if processor.SIDE_EFFECT else concurrency  # pylint: disable=invalid-name
+
+    def _overrides_process_exposes(self) -> bool:
+        return type(self.processor).process_exposes is not Processor.process_exposes
+
+    async def process_expose(self, expose):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.processor.process_expose, expose)
+
+    async def process_exposes(self, exposes):
+        if not self._overrides_process_exposes():
+            async for expose in super().process_exposes(exposes):
+                yield expose
+            return
+
+        loop = asyncio.get_running_loop()
+        inbox: queue.Queue = queue.Queue()
+        outbox: asyncio.Queue = asyncio.Queue()
+        # Set when the consumer stops early; the thread then takes no more
+        # inputs and stops iterating the processor
+        stopped = threading.Event()
+
+        def inputs():
+            while not stopped.is_set() and (item := inbox.get()) is not _END:
+                yield item
+
+        def run():
+            try:
+                for result in self.processor.process_exposes(inputs()):
+                    if stopped.is_set():
+                        return
+                    loop.call_soon_threadsafe(outbox.put_nowait, (True, result))
+                loop.call_soon_threadsafe(outbox.put_nowait, (True, _END))
+            except BaseException as exc:  # pylint: disable=broad-exception-caught
+                if not stopped.is_set():
+                    loop.call_soon_threadsafe(outbox.put_nowait, (False, exc))
+
+        async def pump():
+            try:
+                async for expose in exposes:
+                    inbox.put(expose)
+            finally:
+                inbox.put(_END)
+
+        worker = threading.Thread(target=run, daemon=True,
+                                  name=f"bridge-{type(self.processor).__name__}")
+        worker.start()
+        pump_task = asyncio.create_task(pump())
+        try:
+            while True:
+                ok, item = await outbox.get()
+                if not ok:
+                    raise item
+                if item is _END:
+                    break
+                yield item
+            await pump_task
+        finally:
+            pump_task.cancel()
+            stopped.set()
+            inbox.put(_END)
+            await asyncio.to_thread(worker.join)
+
+
+class AsyncCrawlExposeDetails(AsyncProcessor):
+    """Async counterpart of CrawlExposeDetails. Awaits each crawler's
+    get_expose_details, natively for async crawlers and on the thread pool
+    for sync ones, with at most detail_concurrency() at a time per crawler.
+    Lazy details are deferred like in CrawlExposeDetails, and fetched the
+    same way by AsyncLoadDeferredDetails."""
+
+    def __init__(self, config, crawlers: Dict[str, object], concurrency: int):
+        self.config = config
+        self.crawlers = crawlers
+        self.CONCURRENCY = concurrency  # pylint: disable=invalid-name
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self.sync_details = CrawlExposeDetails(config)
+
+    async def fetch_details(self, expose):
+        """Enrich the expose from its detail page"""
+        name = expose.get('crawler', '')
+        crawler = self.crawlers.get(name)
+        if crawler:
+            if name not in self._slots:
+                self._slots[name] = asyncio.Semaphore(crawler.detail_concurrency())
+            async with self._slots[name]:
+                expose = await crawler.aget_expose_details(expose)
+        return CrawlExposeDetails.apply_warmmiete(expose)
+
+    async def process_expose(self, expose):
+        crawler = self.crawlers.get(expose.get('crawler', ''))
+        searcher = crawler.crawler if isinstance(crawler, SyncCrawlerAdapter) else crawler
+        if searcher is not None and self.sync_details.defer_details(searcher, expose):
+            return expose
+        return await self.fetch_details(expose)
+
+
+class AsyncLoadDeferredDetails(AsyncProcessor):
+    """Async counterpart of LoadDeferredDetails. Takes over the deferred
+    fetch of the exposes, so that it is awaited like in AsyncCrawlExposeDetails
+    instead of being loaded on a thread."""
+
+    def __init__(self, details: AsyncCrawlExposeDetails, concurrency: int):
+        self.details = details
+        self.CONCURRENCY = concurrency  # pylint: disable=invalid-name
+
+    async def process_expose(self, expose):
+        if isinstance(expose, Expose) and expose.undefer():
+            return await self.details.fetch_details(expose)
+        return expose
+
+
+class AsyncProcessorChain:
+    """Chain of async processors, each streaming into the next"""
+    processors: List[AsyncProcessor]
+
+    def __init__(self, processors: List[AsyncProcessor]):
+        self.processors = processors
+
+    def process(self, exposes: AsyncIterator[Dict]) -> AsyncIterator[Dict]:
+        """Process the async sequence of exposes with the processor chain"""
+        for processor in self.processors:
+            exposes = processor.process_exposes(exposes)
+        return exposes
+
+
+class AsyncEngine:
+    """Runs a crawl and a processor chain on the running event loop"""
+
+    def __init__(self, config, max_threads: int, concurrency: int):
+        self.config = config
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='async-sync')
+        self.crawlers = {
+            searcher.get_name(): adapt_crawler(searcher, self.executor)
+            for searcher in config.searchers()
+        }
+        self.details: Optional[AsyncCrawlExposeDetails] = None
+
+    def adapt_processor(self, processor) -> AsyncProcessor:
+        """Wrap a processor of a sync ProcessorChain for the async chain"""
+        if isinstance(processor, AsyncProcessor):
+            return processor
+        if isinstance(processor, CrawlExposeDetails):
+            self.details = AsyncCrawlExposeDetails(self.config, self.crawlers, self.concurrency)
+            return self.details
+        if isinstance(processor, LoadDeferredDetails) and self.details is not None:
+            return AsyncLoadDeferredDetails(self.details, self.concurrency)
+        return SyncProcessorAdapter(processor, self.executor, self.concurrency)
+
+    def adapt_chain(self, chain) -> AsyncProcessorChain:
+        """Build an async chain from a sync ProcessorChain"""
+        return AsyncProcessorChain([self.adapt_processor(p) for p in chain.processors])
+
+    async def crawl(self, urls: Iterable[str], max_pages=None,
+                    per_host_limit: Optional[int] = None) -> AsyncIterator[Dict]:
+        """Crawl all URLs concurrently, up to crawl.max_workers at a time, and
+        yield exposes as each crawl completes"""
+        host_slots: Dict[str, asyncio.Semaphore] = {}
+        workers = asyncio.Semaphore(self.config.crawl_max_workers())
+
+        async def crawl_one(crawler, url):
+            host = urlparse(url).netloc
+            slots = host_slots.setdefault(host, asyncio.Semaphore(per_host_limit or self.concurrency))
+            async with slots, workers:
+                try:
+                    return await crawler.acrawl(url, max_pages)
+                except (requests.exceptions.RequestException, httpx.HTTPError):
+                    logger.info("Error while scraping url %s:\n%s", url, traceback.format_exc())
+                except Exception:  # pylint: disable=broad-exception-caught
+                    logger.warning("Unexpected error while scraping url %s:\n%s",
+                                   url, traceback.format_exc())
+                return []
+
+        tasks = [
+            asyncio.create_task(crawl_one(crawler, url))
+            for crawler in self.crawlers.values()
+            for url in urls
+            if crawler.matches_url(url)
+        ]
+        for finished in asyncio.as_completed(tasks):
+            for expose in await finished:
+                yield expose
+
+    async def run(self, chain, urls: Iterable[str], max_pages=None,
+                  per_host_limit: Optional[int] = None) -> AsyncIterator[Dict]:
+        """Crawl the URLs and stream the exposes through the adapted chain"""
+        async_chain = self.adapt_chain(chain)
+        try:
+            async for expose in async_chain.process(self.crawl(urls, max_pages, per_host_limit)):
+                yield expose
+        finally:
+            await http_client.aclose()
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,228 @@
+"""Record and replay of a run's outbound traffic. In record mode every HTTP
+request sent through `http_client` and every read of the id maintainer is
+written to a cassette file. In replay mode the run is served from that file
+instead, so the whole pipeline can be rerun offline and deterministically,
+e.g. to profile crawlers and processors against realistic traffic.
+
+A cassette is a gzipped file with one JSON object per interaction. Responses
+to the same request are replayed in the order they were recorded. Credentials
+in the URLs and bodies (API keys, bot tokens, passwords) are redacted before
+the requests are keyed, so they are never written to the cassette, and
+parameters that change from run to run are left out of the key."""
+import base64
+import gzip
+import hashlib
+import json
+import re
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from flathunter.logging import logger
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# Never store cookies set by the sites
+SKIPPED_HEADERS = frozenset({'set-cookie'})
+
+REDACTED = 'REDACTED'
+# Query parameters and body fields holding credentials
+SECRET_PARAMS = frozenset({'key', 'api_key', 'apikey', 'token', 'access_token',
+                           'password', 'login_password', 'secret', 'signature'})
+# Query parameters that change from run to run, e.g. the arrival time of the
+# Google Maps requests, which is always next Monday
+VOLATILE_PARAMS = frozenset({'arrival_time', 'departure_time'})
+# Path segments holding credentials, e.g. the bot token in the Telegram URLs
+SECRET_SEGMENT = re.compile(r'^bot\d+:[\w-]+$')
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """A replayed run sent a request that was not recorded"""
+
+
+def redact_url(url: str) -> str:
+    """The URL with credentials redacted and volatile query parameters removed"""
+    parts = urlsplit(url)
+    path = '/'.join(REDACTED if SECRET_SEGMENT.match(segment) else segment
+                    for segment in parts.path.split('/'))
+    query = urlencode([(name, REDACTED if name.lower() in SECRET_PARAMS else value)
+                       for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if name.lower() not in VOLATILE_PARAMS])
+    return urlunsplit((parts.scheme, parts.netloc, path, query, parts.fragment))
+
+
+def _redact_fields(value: Any) -> Any:
+    if not isinstance(value, dict):
+        return value
+    return {name: REDACTED if str(name).lower() in SECRET_PARAMS else field
+            for name, field in value.items()
+            if str(name).lower() not in VOLATILE_PARAMS}
+
+
+def request_key(method: str, url: str, kwargs: Dict[str, Any]) -> str:
+    """Identifies a request by method, URL, query parameters and body, with
+    credentials redacted"""
+    body = json.dumps({name: _redact_fields(kwargs.get(name))
+                       for name in ('params', 'data', 'json', 'content')},
+                      sort_keys=True, default=str)
+    digest = hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+    return f"{method.upper()} {redact_url(url)} {digest}"
+
+
+class Cassette:
+    """The recorded interactions of one run"""
+
+    def __init__(self, path: str, mode: str):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode {mode}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._recorded: List[Dict[str, Any]] = []
+        self._responses: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._calls: Dict[str, Deque[Any]] = defaultdict(deque)
+        if mode == REPLAY:
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        """True if requests are served from the cassette"""
+        return self.mode == REPLAY
+
+    @property
+    def recording(self) -> bool:
+        """True if requests are written to the cassette"""
+        return self.mode == RECORD
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as cassette_file:
+            for line in cassette_file:
+                entry = json.loads(line)
+                if entry['type'] == 'http':
+                    self._responses[entry['key']].append(entry)
+                else:
+                    self._calls[entry['key']].append(entry['result'])
+        logger.info("Replaying %d requests and %d calls from %s",
+                    sum(map(len, self._responses.values())),
+                    sum(map(len, self._calls.values())), self.path)
+
+    def save(self):
+        """Write the recorded interactions to the cassette file"""
+        if not self.recording:
+            return
+        with self._lock:
+            entries = list(self._recorded)
+        with gzip.open(self.path, 'wt', encoding='utf-8') as cassette_file:
+            for entry in entries:
+                cassette_file.write(json.dumps(entry, separators=(',', ':'), default=str) + '\n')
+        logger.info("Recorded %d interactions to %s", len(entries), self.path)
+
+    def _append(self, entry: Dict[str, Any]):
+        with self._lock:
+            self._recorded.append(entry)
+
+    def _next(self, queues: Dict[str, Deque], key: str) -> Tuple[bool, Any]:
+        """Pop the next recorded entry for the key; the last one is repeated"""
+        with self._lock:
+            entries = queues.get(key)
+            if not entries:
+                return False, None
+            return True, entries.popleft() if len(entries) > 1 else entries[0]
+
+    def record_response(self, method: str, url: str, kwargs: Dict[str, Any],
+                        status_code: int, headers, content: bytes):
+        """Store the response to a request"""
+        self._append({
+            'type': 'http',
+            'key': request_key(method, url, kwargs),
+            'status': status_code,
+            'headers': {name: value for name, value in headers.items()
+                        if name.lower() not in SKIPPED_HEADERS},
+            'content': base64.b64encode(content).decode('ascii'),
+        })
+
+    def _replay_entry(self, method: str, url: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        found, entry = self._next(self._responses, request_key(method, url, kwargs))
+        if not found:
+            raise CassetteMiss(f"No recorded response for {method} {redact_url(url)}")
+        return entry
+
+    def replay(self, method: str, url: str, kwargs: Dict[str, Any]) -> requests.Response:
+        """The recorded response to a request, as a requests response"""
+        return self._response(method, url, self._replay_entry(method, url, kwargs))
+
+    @staticmethod
+    def _response(method: str, url: str, entry: Dict[str, Any]) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = base64.b64decode(entry['content'])  # pylint: disable=protected-access
+        response.url = url
+        response.request = requests.Request(method, url).prepare()
+        return response
+
+    def responses(self) -> Iterator[requests.Response]:
+        """Every recorded response, as requests responses"""
+        with self._lock:
+            entries = [entry for queue in self._responses.values() for entry in queue]
+        for entry in entries:
+            method, url, _ = entry['key'].split(' ')
+            yield self._response(method, url, entry)
+
+    def areplay(self, method: str, url: str, kwargs: Dict[str, Any]) -> httpx.Response:
+        """The recorded response to a request, as an httpx response"""
+        entry = self._replay_entry(method, url, kwargs)
+        return httpx.Response(entry['status'], headers=entry['headers'],
+                              content=base64.b64decode(entry['content']),
+                              request=httpx.Request(method, url))
+
+    def record_call(self, name: str, args: tuple, result: Any):
+        """Store the result of a call to an external service"""
+        self._append({'type': 'call', 'key': f"{name}{json.dumps(args, default=str)}",
+                      'result': result})
+
+    def replay_call(self, name: str, args: tuple) -> Any:
+        """The recorded result of a call, or None if it was not recorded"""
+        return self._next(self._calls, f"{name}{json.dumps(args, default=str)}")[1]
+
+
+class CassetteIdMaintainer:
+    """Wraps an id maintainer for record and replay. Reads are recorded with
+    their results. On replay they are answered from the cassette, writes are
+    dropped, and no id maintainer is needed at all."""
+
+    READS = frozenset({'is_processed', 'is_contacted', 'get_page_state'})
+
+    def __init__(self, id_watch, cassette: Cassette):
+        self.id_watch = id_watch
+        self.cassette = cassette
+
+    def __getattr__(self, name):
+        if self.cassette.replaying:
+            if name in self.READS:
+                return lambda *args: self.cassette.replay_call(name, args)
+            return lambda *args, **kwargs: None
+        attr = getattr(self.id_watch, name)
+        if name not in self.READS:
+            return attr
+
+        def recorded(*args):
+            result = attr(*args)
+            self.cassette.record_call(name, args, result)
+            return result
+        return recorded
+
+
+def open_cassette(record: Optional[str], replay: Optional[str]) -> Optional[Cassette]:
+    """The cassette selected on the command line, if any"""
+    if record:
+        return Cassette(record, RECORD)
+    if replay:
+        return Cassette(replay, REPLAY)
+    return None
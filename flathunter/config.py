@@ -127,6 +127,170 @@ Preis: {price}
         """Return true if logging should be verbose"""
         return self._read_yaml_path('verbose', None) is not None
 
+    def crawl_max_workers(self) -> int:
+        """Maximum number of target URLs crawled at the same time"""
+        return int(self._read_yaml_path('crawl.max_workers', 8))
+
+    def crawl_per_host_concurrency(self) -> int:
+        """Maximum number of concurrent crawls against the same host"""
+        return int(self._read_yaml_path('crawl.per_host_concurrency', 2))
+
+    def crawl_page_concurrency(self, crawler_name: str, default: int) -> int:
+        """Number of result pages of one search the given crawler fetches at once.
+        Either a single number, or a mapping from crawler name to number."""
+        setting = self._read_yaml_path('crawl.page_concurrency', None)
+        if isinstance(setting, dict):
+            setting = setting.get(crawler_name)
+        return max(1, int(setting)) if setting is not None else default
+
+    def crawl_detail_workers(self) -> int:
+        """Maximum number of expose detail pages fetched at the same time"""
+        return max(1, int(self._read_yaml_path('crawl.detail_workers', 16)))
+
+    def crawl_detail_concurrency(self, crawler_name: str, default: int) -> int:
+        """Number of expose detail pages the given crawler fetches at once.
+        Either a single number, or a mapping from crawler name to number."""
+        setting = self._read_yaml_path('crawl.detail_concurrency', None)
+        if isinstance(setting, dict):
+            setting = setting.get(crawler_name)
+        return max(1, int(setting)) if setting is not None else default
+
+    def crawl_lazy_details(self) -> bool:
+        """Whether expose detail pages are only fetched once an expose reaches
+        a stage that needs a detail field"""
+        return bool(self._read_yaml_path('crawl.lazy_details', True))
+
+    def crawl_detail_ordered(self) -> bool:
+        """Whether enriched exposes are passed on in crawl order instead of
+        as soon as their details are in"""
+        return bool(self._read_yaml_path('crawl.detail_ordered', False))
+
+    def crawl_max_pages(self) -> int:
+        """Maximum number of result pages crawled per search URL. Only the
+        first page by default; every further page is one more request per
+        search URL and run."""
+        return int(self._read_yaml_path('crawl.max_pages', 1))
+
+    def crawl_result_limit(self, crawler_name: str,
+                           default: Optional[int] = None) -> Optional[int]:
+        """Maximum number of results fetched per search URL by the API crawlers.
+        Either a single number, or a mapping from crawler name to number."""
+        setting = self._read_yaml_path('crawl.result_limit', None)
+        if isinstance(setting, dict):
+            setting = setting.get(crawler_name)
+        return int(setting) if setting is not None else default
+
+    def crawl_conditional_requests(self) -> bool:
+        """True if search pages should be skipped when unchanged since the last run"""
+        return bool(self._read_yaml_path('crawl.conditional_requests', True))
+
+    def crawl_parse_processes(self) -> int:
+        """Number of worker processes result pages are parsed in; 0 parses
+        them in the crawl threads"""
+        return int(self._read_yaml_path('crawl.parse_processes', 0))
+
+    def crawl_parser(self) -> str:
+        """Parser backend for result pages: 'lxml' runs the crawlers' compiled
+        extractors on lxml trees, 'bs4' runs them on BeautifulSoup trees"""
+        return self._read_yaml_path('crawl.parser', 'lxml')
+
+    def crawl_early_stop(self) -> bool:
+        """True if paging a newest-first search should stop at the first page
+        that contains only already processed exposes"""
+        return bool(self._read_yaml_path('crawl.early_stop', True))
+
+    def detail_cache_path(self) -> Optional[str]:
+        """SQLite file for the on-disk detail page cache; no cache if unset"""
+        return self._read_yaml_path('detail_cache.path', None)
+
+    def detail_cache_ttl(self, crawler_name: str) -> float:
+        """Seconds for which cached detail pages of the crawler are used.
+        Either a single number, or a mapping from crawler name to number."""
+        setting = self._read_yaml_path('detail_cache.ttl', None)
+        if isinstance(setting, dict):
+            setting = setting.get(crawler_name, setting.get('default'))
+        return float(setting) if setting is not None else 24 * 3600
+
+    def detail_cache_max_size(self) -> int:
+        """Maximum size of the detail cache in megabytes"""
+        return int(self._read_yaml_path('detail_cache.max_size_mb', 256))
+
+    def id_maintainer(self) -> str:
+        """Storage back-end for processed exposes: 'firestore', 'sqlite' or
+        'memory'. Defaults to Firestore if a Google Cloud project is set."""
+        default = 'firestore' if self.google_cloud_project_id() else 'sqlite'
+        return self._read_yaml_path('id_maintainer', None) or default
+
+    def database_location(self) -> str:
+        """Directory of the SQLite database of processed exposes"""
+        return self._read_yaml_path('database_location', None) or '.'
+
+    def retention_days(self, collection: str) -> Optional[float]:
+        """Days after which data of the collection ('processed', 'exposes' or
+        'contacted') is compacted or deleted; None keeps it forever"""
+        days = self._read_yaml_path(f'retention.{collection}', None)
+        return float(days) if days is not None else None
+
+    def firestore_write_behind(self) -> bool:
+        """Whether Firestore writes are queued and committed in batches"""
+        return bool(self._read_yaml_path('firestore.write_behind', True))
+
+    def firestore_batch_size(self) -> int:
+        """Maximum number of documents committed in one Firestore batch"""
+        return int(self._read_yaml_path('firestore.batch_size', 500))
+
+    def firestore_flush_interval(self) -> float:
+        """Seconds after which queued Firestore writes are committed"""
+        return float(self._read_yaml_path('firestore.flush_interval', 1.0))
+
+    def firestore_seen_snapshot(self) -> bool:
+        """Whether processed IDs are kept in a local snapshot in front of Firestore"""
+        return bool(self._read_yaml_path('firestore.seen_snapshot', True))
+
+    def firestore_seen_snapshot_file(self) -> Optional[str]:
+        """File to keep the seen-ID snapshot in instead of Firestore"""
+        return self._read_yaml_path('firestore.seen_snapshot_file', None)
+
+    def wg_gesucht_cookie_file(self) -> Optional[str]:
+        """File to persist WG-Gesucht filter cookies in between runs"""
+        return self._read_yaml_path('wg_gesucht.cookie_file', None)
+
+    def wg_gesucht_cookie_max_age(self) -> float:
+        """Seconds for which persisted WG-Gesucht cookies are reused"""
+        return float(self._read_yaml_path('wg_gesucht.cookie_max_age', 12 * 3600))
+
+    def engine(self) -> str:
+        """Execution engine for the pipeline: 'sync' (default) or 'async'"""
+        return str(self._read_yaml_path('engine', 'sync')).lower()
+
+    def async_max_threads(self) -> int:
+        """Size of the thread pool that runs sync plugins under the async engine"""
+        return int(self._read_yaml_path('async.max_threads', 16))
+
+    def async_concurrency(self) -> int:
+        """Number of exposes each stage of the async engine processes at once"""
+        return int(self._read_yaml_path('async.concurrency', 32))
+
+    def http_pool_connections(self) -> int:
+        """Number of per-host connection pools kept by the shared HTTP client"""
+        return int(self._read_yaml_path('http.pool_connections', 32))
+
+    def http_pool_maxsize(self) -> int:
+        """Maximum number of keep-alive connections kept open per host"""
+        return int(self._read_yaml_path('http.pool_maxsize', 16))
+
+    def http_host_settings(self) -> dict:
+        """Per-host default 'headers', 'timeout' and 'rate_limit' for outgoing requests"""
+        return self._read_yaml_path('http.hosts', {})
+
+    def http_rate_limit(self) -> dict:
+        """Default rate limit policy for all hosts, see flathunter.rate_limit"""
+        return self._read_yaml_path('http.rate_limit', {}) or {}
+
+    def http_warmup(self) -> bool:
+        """True if connections to all known hosts should be opened at startup"""
+        return bool(self._read_yaml_path('http.warmup', True))
+
     def google_cloud_project_id(self):
         """Google Cloud project ID for App Engine / Cloud Run deployments"""
         return self._read_yaml_path('google_cloud_project_id', None)
@@ -2,10 +2,11 @@
 import random
 from time import sleep
 
-from flathunter.abstract_processor import Processor
+from flathunter.abstract_processor import COST_FETCH, Processor
 from flathunter.contactors.wggesucht import WgGesuchtContactor
 from flathunter.notifiers import send_telegram_alert
 from flathunter.logging import logger
+from flathunter.utils.concurrency import ready_batches
 
 # Crawlers where we send the draft message via Telegram instead of auto-contacting
 # (ImmoScout WAF blocks all automation on expose pages)
@@ -19,6 +20,12 @@ CONTACTOR_MAP = {
 class AutoContactProcessor(Processor):
     """Processor that auto-contacts landlords using Gemini-generated messages"""
 
+    COST = COST_FETCH
+    SIDE_EFFECT = True
+    # Maximum number of exposes whose contacted state is looked up in one
+    # batch; a batch holds the exposes that have already arrived
+    PREFETCH_SIZE = 20
+
     def __init__(self, config, id_watch):
         self.config = config
         self.id_watch = id_watch
@@ -43,6 +50,14 @@ class AutoContactProcessor(Processor):
             text,
         )
 
+    def process_exposes(self, exposes):
+        prefetch = getattr(self.id_watch, 'prefetch_contacted', None)
+        for chunk in ready_batches(exposes, self.PREFETCH_SIZE, thread_name='auto-contact'):
+            if prefetch is not None:
+                prefetch([(expose.get('id'), expose.get('crawler', '')) for expose in chunk])
+            for expose in chunk:
+                yield self.process_expose(expose)
+
     def process_expose(self, expose):
         expose_id = expose.get('id')
         crawler = expose.get('crawler', '')
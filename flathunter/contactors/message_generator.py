@@ -1,11 +1,10 @@
 """Score listings and generate contact messages using Gemini"""
 import json
-from typing import Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-import requests
+from typing import Iterable, Iterator, Optional
 
+from flathunter.http_client import http_client
 from flathunter.logging import logger
+from flathunter.utils.concurrency import stream_map
 
 GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1alpha/models/gemini-3-flash-preview:generateContent"
 
@@ -98,7 +97,7 @@ Respond with JSON: score, pros, cons, summary, message."""
     parts = [{"text": prompt}]
 
     try:
-        resp = requests.post(
+        resp = http_client.post(
             f"{GEMINI_API_URL}?key={api_key}",
             json={
                 "contents": [{"parts": parts}],
@@ -134,26 +133,35 @@ Respond with JSON: score, pros, cons, summary, message."""
         return None
 
 
+def _apply_score(expose: dict, config) -> dict:
+    """Score one listing and store the result on the expose dict"""
+    try:
+        result = score_listing(expose, config)
+    except Exception as e:
+        logger.error("Parallel scoring error: %s", e)
+        return expose
+    if result:
+        expose['gemini_score'] = result.get('score', 0)
+        expose['gemini_pros'] = result.get('pros', [])
+        expose['gemini_cons'] = result.get('cons', [])
+        expose['gemini_summary'] = result.get('summary', '')
+        expose['gemini_message'] = result.get('message')
+    return expose
+
+
+def score_listings_stream(exposes: Iterable[dict], config, max_workers: int = 10) -> Iterator[dict]:
+    """Score listings in parallel as they arrive, yielding each expose as soon as
+    its score is in. Adds gemini_score, gemini_pros, gemini_cons, gemini_summary,
+    gemini_message to each expose dict."""
+    if not config.auto_contact_gemini_api_key():
+        yield from exposes
+        return
+    yield from stream_map(lambda expose: _apply_score(expose, config), exposes,
+                          max_workers, thread_name_prefix='gemini')
+
+
 def score_listings_parallel(exposes: list, config, max_workers: int = 10) -> None:
     """Score multiple listings in parallel. Mutates each expose dict in-place,
     adding gemini_score, gemini_pros, gemini_cons, gemini_summary, gemini_message."""
-    api_key = config.auto_contact_gemini_api_key()
-    if not api_key:
-        return
-
-    def _score_one(expose):
-        result = score_listing(expose, config)
-        if result:
-            expose['gemini_score'] = result.get('score', 0)
-            expose['gemini_pros'] = result.get('pros', [])
-            expose['gemini_cons'] = result.get('cons', [])
-            expose['gemini_summary'] = result.get('summary', '')
-            expose['gemini_message'] = result.get('message')
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(_score_one, e) for e in exposes]
-        for future in as_completed(futures):
-            try:
-                future.result()
-            except Exception as e:
-                logger.error("Parallel scoring error: %s", e)
+    for _ in score_listings_stream(exposes, config, max_workers):
+        pass
@@ -1,20 +1,23 @@
 """Processor that scores listings with Gemini — parallelized for speed"""
-from flathunter.abstract_processor import Processor
-from flathunter.contactors.message_generator import score_listings_parallel
-from flathunter.logging import logger
+from flathunter.abstract_processor import COST_LLM, Processor
+from flathunter.contactors.message_generator import score_listings_stream
 
 
 class GeminiScoreProcessor(Processor):
     """Enriches exposes with Gemini score, pros, cons, summary, and draft message.
     Parallelizes API calls. Overrides process_exposes (not process_expose)
-    because scoring is batched for parallelism."""
+    because scoring runs on a thread pool; scored exposes are streamed
+    downstream in completion order."""
+
+    COST = COST_LLM
+    REQUIRES = frozenset({'title', 'price', 'size', 'rooms', 'address', 'crawler', 'from',
+                          'durations', 'detail_description', 'detail_total_photos',
+                          'detail_contact_name'})
+    PROVIDES = frozenset({'gemini_score', 'gemini_pros', 'gemini_cons', 'gemini_summary',
+                          'gemini_message'})
 
     def __init__(self, config):
         self.config = config
 
     def process_exposes(self, exposes):
-        eligible = list(exposes)
-        if eligible:
-            logger.info("Scoring %d listings with Gemini (parallel)", len(eligible))
-            score_listings_parallel(eligible, self.config)
-        return iter(eligible)
+        return score_listings_stream(exposes, self.config)
@@ -1,11 +1,12 @@
 """WG-Gesucht contactor — pure requests-based session login + API messaging"""
 import re
 
-import requests
 from bs4 import BeautifulSoup
 
 from flathunter.contactors import AbstractContactor
+from flathunter.http_client import http_client
 from flathunter.logging import logger
+from flathunter.page_cache import page_cache
 
 
 class WgGesuchtContactor(AbstractContactor):
@@ -23,13 +24,19 @@ class WgGesuchtContactor(AbstractContactor):
         'Origin': 'https://www.wg-gesucht.de',
     }
 
+    FORM_TOKENS = ('user_id', 'ad_type', 'ad_id', 'csrf_token')
+    # Tokens tied to the listing, not to the session: these may be read from
+    # the page the crawler fetched anonymously
+    LISTING_TOKENS = ('ad_type', 'ad_id')
+
     def __init__(self, config):
         creds = config.auto_contact_wg_gesucht()
         self.email = creds.get('email', '')
         self.password = creds.get('password', '')
-        self.session = requests.Session()
-        self.session.headers.update(self.HEADERS)
+        self.session = http_client.create_session(self.HEADERS)
         self._logged_in = False
+        self._user_id = None
+        self._csrf_token = None
 
     def is_logged_in(self) -> bool:
         return self._logged_in
@@ -40,9 +47,9 @@ class WgGesuchtContactor(AbstractContactor):
             return False
         try:
             # Load homepage first to get cookies
-            self.session.get("https://www.wg-gesucht.de/", timeout=15)
+            http_client.get("https://www.wg-gesucht.de/", session=self.session, timeout=15)
 
-            resp = self.session.post(self.LOGIN_URL, json={
+            resp = http_client.post(self.LOGIN_URL, session=self.session, json={
                 "login_email_username": self.email,
                 "login_password": self.password,
                 "login_form_auto_login": "1",
@@ -53,6 +60,8 @@ class WgGesuchtContactor(AbstractContactor):
                 data = resp.json()
                 if data.get("user_id"):
                     self._logged_in = True
+                    self._user_id = str(data["user_id"])
+                    self._csrf_token = None
                     logger.info("WG-Gesucht: logged in as user %s", data["user_id"])
                     return True
                 logger.error("WG-Gesucht login failed: %s", data)
@@ -62,18 +71,41 @@ class WgGesuchtContactor(AbstractContactor):
             logger.error("WG-Gesucht login error: %s", e)
         return False
 
-    def _get_form_tokens(self, expose_url: str) -> dict:
-        """Load the listing page and extract messaging form tokens"""
-        resp = self.session.get(expose_url, timeout=15)
-        soup = BeautifulSoup(resp.content, 'lxml')
+    def _session_csrf_token(self):
+        """The CSRF token of the logged-in session, read once per login from
+        the homepage"""
+        if self._csrf_token is None:
+            resp = http_client.get("https://www.wg-gesucht.de/", session=self.session, timeout=15)
+            tokens = self._parse_form_tokens(BeautifulSoup(resp.content, 'lxml'), '')
+            self._csrf_token = tokens.get('csrf_token', '')
+        return self._csrf_token
 
+    def _get_form_tokens(self, expose_url: str) -> dict:
+        """Extract the messaging form tokens. The page the crawler fetched
+        earlier in the run was loaded without the logged-in session, so only
+        the listing tokens are taken from it; the user id and CSRF token come
+        from the session. If either source lacks a token, the listing page is
+        loaded again with the logged-in session."""
+        page = page_cache.get(expose_url)
+        if page is not None and self._user_id:
+            cached = self._parse_form_tokens(page.soup, expose_url)
+            tokens = {k: cached[k] for k in self.LISTING_TOKENS if cached.get(k)}
+            tokens['user_id'] = self._user_id
+            tokens['csrf_token'] = self._session_csrf_token()
+            if all(tokens.get(k) for k in self.FORM_TOKENS):
+                return tokens
+            logger.debug("WG-Gesucht: form tokens incomplete, reloading %s", expose_url)
+        resp = http_client.get(expose_url, session=self.session, timeout=15)
+        return self._parse_form_tokens(BeautifulSoup(resp.content, 'lxml'), expose_url)
+
+    def _parse_form_tokens(self, soup: BeautifulSoup, expose_url: str) -> dict:
         form = soup.find('form', id='messenger_form') or soup.find('div', id='messenger_form')
         if not form:
             # Try finding tokens in hidden inputs anywhere on the page
             form = soup
 
         tokens = {}
-        for field in ('user_id', 'ad_type', 'ad_id', 'csrf_token'):
+        for field in self.FORM_TOKENS:
             el = form.find('input', {'name': field})
             if el:
                 tokens[field] = el.get('value', '')
@@ -98,8 +130,7 @@ class WgGesuchtContactor(AbstractContactor):
 
         url = expose.get('url', '')
         tokens = self._get_form_tokens(url)
-        required = ('user_id', 'ad_type', 'ad_id', 'csrf_token')
-        if not all(tokens.get(k) for k in required):
+        if not all(tokens.get(k) for k in self.FORM_TOKENS):
             logger.error("WG-Gesucht: missing form tokens for %s: got %s", url, tokens)
             return False
 
@@ -112,7 +143,8 @@ class WgGesuchtContactor(AbstractContactor):
         }
 
         try:
-            resp = self.session.post(self.CONVERSATIONS_URL, json=payload, timeout=15)
+            resp = http_client.post(self.CONVERSATIONS_URL, session=self.session,
+                                    json=payload, timeout=15)
             data = resp.json()
             if data.get('conversation_id'):
                 logger.info("WG-Gesucht: sent message, conversation_id=%s", data['conversation_id'])
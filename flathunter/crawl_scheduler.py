@@ -0,0 +1,58 @@
+"""Runs the crawls for all configured target URLs concurrently"""
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from flathunter.abstract_crawler import Crawler
+from flathunter.logging import logger
+
+
+class CrawlScheduler:
+    """Crawls (searcher, URL) pairs on a thread pool and streams the exposes
+    of each crawl as soon as it completes. The number of crawls running
+    against the same host at once is capped."""
+
+    def __init__(self, max_workers: int, per_host_limit: int):
+        self.max_workers = max(1, max_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _slots_for(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def _crawl(self, searcher: Crawler, url: str, max_pages):
+        with self._slots_for(url):
+            try:
+                return searcher.crawl(url, max_pages)
+            except requests.exceptions.RequestException:
+                logger.info("Error while scraping url %s:\n%s", url, traceback.format_exc())
+                return []
+            except Exception:
+                logger.warning("Unexpected error while scraping url %s:\n%s",
+                               url, traceback.format_exc())
+                return []
+
+    def run(self, jobs: List[Tuple[Crawler, str]], max_pages=None) -> Iterator[Dict]:
+        """Crawl every (searcher, URL) pair and yield the exposes in the order
+        in which the crawls finish"""
+        if not jobs:
+            return
+        workers = min(self.max_workers, len(jobs))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crawl') as executor:
+            futures = {
+                executor.submit(self._crawl, searcher, url, max_pages): url
+                for searcher, url in jobs
+            }
+            for future in as_completed(futures):
+                exposes = future.result()
+                logger.debug("Crawl of %s finished with %d exposes", futures[future], len(exposes))
+                yield from exposes
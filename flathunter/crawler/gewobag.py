@@ -1,7 +1,9 @@
 """Expose crawler for gewobag.de"""
 import re
+from urllib.parse import urlparse, urlunparse
 
 from flathunter.abstract_crawler import Crawler
+from flathunter.extractors import Attr, Exists, Extractor, Text
 from flathunter.logging import logger
 from flathunter.utils import parse_german_price
 
@@ -10,86 +12,68 @@ class Gewobag(Crawler):
     """Crawler for gewobag.de rental listings (SSR HTML)"""
 
     URL_PATTERN = re.compile(r'https://www\.gewobag\.de')
-
-    def extract_data(self, soup):
+    DETAIL_FIELDS = Crawler.DETAIL_FIELDS | {'warmmiete'}
+    EXTRACTOR = Extractor(
+        'article.angebot-big-box',
+        post_id=Attr(None, 'id'),
+        url=Attr('div.angebot-footer a.read-more-link', 'href'),
+        district=Text('tr.angebot-region td', strip_parts=True),
+        address=Text('tr.angebot-address td address', strip_parts=True),
+        title=Text('tr.angebot-address h3.angebot-title', strip_parts=True),
+        area=Text('tr.angebot-area td', strip_parts=True),
+        price=Text('tr.angebot-kosten td', strip_parts=True),
+        availability=Text('tr.availability td', strip_parts=True),
+        wbs=Exists('.gw-pictogram--wbs'),
+        image=Attr('.swiper img', 'src', 'data-src'),
+    )
+
+    def get_page_url(self, search_url, page_no):
+        """Gewobag uses WordPress pagination: '/page/N/' after the listing path"""
+        parsed = urlparse(search_url)
+        path = re.sub(r'page/\d+/?$', '', parsed.path)
+        if not path.endswith('/'):
+            path += '/'
+        if page_no > 1:
+            path += f"page/{page_no}/"
+        return urlunparse(parsed._replace(path=path))
+
+    def get_page_count(self, soup):
+        return self._max_page_number(soup, '.page-numbers')
+
+    def extract_data(self, raw_data):
         entries = []
-        for card in soup.select('article.angebot-big-box'):
-            footer_link = card.select_one('div.angebot-footer a.read-more-link')
-            if not footer_link:
-                continue
-            url = footer_link.get('href', '')
+        for card in self.EXTRACTOR.extract(raw_data):
+            url = card['url']
             if not url:
                 continue
 
             # ID from post-XXXXX id attr
-            post_id = card.get('id', '')
-            id_match = re.search(r'(\d+)', post_id)
+            id_match = re.search(r'(\d+)', card['post_id'] or '')
             if not id_match:
                 continue
             expose_id = int(id_match.group(1))
 
-            # Table rows
-            district = ''
-            address = ''
-            title = ''
-            area = ''
-            price = ''
+            district = card['district'] or ''
+            area = card['area'] or ''
+            # "3 Zimmer | 76,13 m²"
             rooms = ''
-            availability = ''
-
-            region_td = card.select_one('tr.angebot-region td')
-            if region_td:
-                district = region_td.get_text(strip=True)
-
-            addr_td = card.select_one('tr.angebot-address td address')
-            if addr_td:
-                address = addr_td.get_text(strip=True)
-
-            title_el = card.select_one('tr.angebot-address h3.angebot-title')
-            if title_el:
-                title = title_el.get_text(strip=True)
-
-            area_td = card.select_one('tr.angebot-area td')
-            if area_td:
-                area_text = area_td.get_text(strip=True)
-                # "3 Zimmer | 76,13 m²"
-                area = area_text
-                rm = re.search(r'(\d+)\s*Zimmer', area_text)
-                if rm:
-                    rooms = rm.group(1)
-
-            cost_td = card.select_one('tr.angebot-kosten td')
-            if cost_td:
-                price = cost_td.get_text(strip=True)
-
-            avail_td = card.select_one('tr.availability td')
-            if avail_td:
-                availability = avail_td.get_text(strip=True)
-
-            # WBS from pictogram
-            wbs = 'nein'
-            if card.select_one('.gw-pictogram--wbs'):
-                wbs = 'ja'
-
-            # First image
-            image = None
-            img = card.select_one('.swiper img')
-            if img:
-                image = img.get('src') or img.get('data-src')
+            rm = re.search(r'(\d+)\s*Zimmer', area)
+            if rm:
+                rooms = rm.group(1)
 
             entries.append({
                 'id': expose_id,
                 'url': url,
-                'title': title or f"{rooms} Zimmer in {district}",
-                'price': price,
+                'title': card['title'] or f"{rooms} Zimmer in {district}",
+                'price': card['price'] or '',
                 'size': area,
                 'rooms': rooms,
-                'address': address,
-                'image': image,
+                'address': card['address'] or '',
+                'image': card['image'],
                 'crawler': self.get_name(),
                 'district': district,
-                'wbs': wbs,
-                'availability': availability,
+                'wbs': 'ja' if card['wbs'] else 'nein',
+                'availability': card['availability'] or '',
             })
 
         logger.debug('Gewobag: found %d entries', len(entries))
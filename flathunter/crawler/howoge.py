@@ -1,10 +1,10 @@
 """Expose crawler for howoge.de (JSON API)"""
+import math
 import re
 from urllib.parse import urlparse, parse_qs, urlencode
 
-import requests
-
 from flathunter.abstract_crawler import Crawler
+from flathunter.http_client import http_client
 from flathunter.logging import logger
 
 
@@ -12,6 +12,7 @@ class Howoge(Crawler):
     """Crawler for howoge.de rental listings (JSON API)"""
 
     URL_PATTERN = re.compile(r'https://www\.howoge\.de')
+    DETAIL_FIELDS = Crawler.DETAIL_FIELDS | {'warmmiete'}
     BASE_URL = "https://www.howoge.de"
     API_URL = "https://www.howoge.de/?type=999&tx_howrealestate_json_list[action]=immoList"
 
@@ -22,9 +23,8 @@ class Howoge(Crawler):
 
     def get_soup_from_url(self, url):
         """Override with simpler headers to avoid redirect loops on howoge.de."""
-        from bs4 import BeautifulSoup
-        resp = requests.get(url, headers=self.SIMPLE_HEADERS, timeout=30)
-        return BeautifulSoup(resp.content, 'lxml')
+        return self.fetch_detail_page(
+            url, lambda: http_client.get(url, headers=self.SIMPLE_HEADERS, timeout=30)).soup
 
     def _build_post_data(self, search_url):
         """Extract tx_howrealestate_json_list params from URL query string into POST body.
@@ -48,87 +48,106 @@ class Howoge(Crawler):
             pairs.append((f'{prefix}[limit]', '50'))
         return urlencode(pairs)
 
-    def get_results(self, search_url, max_pages=None):
-        """Override to POST to JSON API instead of fetching HTML."""
-        logger.debug("Howoge: fetching from API for %s", search_url)
-        base_body = self._build_post_data(search_url)
-        # Extract limit from the encoded body for pagination
-        qs_parsed = parse_qs(base_body)
-        limit = int(qs_parsed.get('tx_howrealestate_json_list[limit]', ['50'])[0])
-
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'User-Agent': 'Mozilla/5.0',
-            'Accept': 'application/json, text/javascript, */*',
-            'X-Requested-With': 'XMLHttpRequest',
-        }
+    API_HEADERS = {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'User-Agent': 'Mozilla/5.0',
+        'Accept': 'application/json, text/javascript, */*',
+        'X-Requested-With': 'XMLHttpRequest',
+    }
 
+    @staticmethod
+    def _page_body(base_body, page):
+        """Replace the page number in the encoded POST body"""
+        return re.sub(
+            r'tx_howrealestate_json_list%5Bpage%5D=\d+',
+            f'tx_howrealestate_json_list%5Bpage%5D={page}',
+            base_body,
+        )
+
+    def _post_page(self, body, headers=None):
+        # The search is a POST, but it has no side effects
+        resp = http_client.post(self.API_URL, data=body,
+                                headers={**self.API_HEADERS, **(headers or {})}, timeout=30,
+                                retry=True)
+        resp.raise_for_status()
+        return resp
+
+    def extract_data(self, raw_data, include_teasers=True):
+        """Extracts the exposes from one page of the JSON API. The Neubauprojekte
+        teasers are repeated on every page and only taken from the first one."""
         entries = []
-        page = 1
-        while True:
-            # Replace page number in the encoded body
-            body = re.sub(
-                r'tx_howrealestate_json_list%5Bpage%5D=\d+',
-                f'tx_howrealestate_json_list%5Bpage%5D={page}',
-                base_body,
-            )
-            resp = requests.post(self.API_URL, data=body, headers=headers, timeout=30)
-            resp.raise_for_status()
-            data = resp.json()
-
-            for obj in data.get('immoobjects', []):
+        for obj in raw_data.get('immoobjects', []):
+            image = None
+            if obj.get('image'):
+                image = self._abs(obj['image'])
+
+            entries.append({
+                'id': obj['uid'],
+                'url': self._abs(obj.get('link', '')),
+                'title': obj.get('title', ''),
+                'price': f"{obj.get('rent', '')} €",
+                'size': f"{obj.get('area', '')} m²",
+                'rooms': str(obj.get('rooms', '')),
+                'address': obj.get('title', ''),
+                'image': image,
+                'crawler': self.get_name(),
+                'district': obj.get('district', ''),
+                'wbs': obj.get('wbs', ''),
+                'features': obj.get('features', []),
+                'notice': obj.get('notice', ''),
+                'warmmiete': obj.get('rent'),
+            })
+
+        if include_teasers:
+            for teaser in raw_data.get('projectteaser', []):
+                link = teaser.get('link', '')
+                if not link:
+                    continue
                 image = None
-                if obj.get('image'):
-                    image = self._abs(obj['image'])
-
+                if teaser.get('image'):
+                    image = self._abs(teaser['image'])
                 entries.append({
-                    'id': obj['uid'],
-                    'url': self._abs(obj.get('link', '')),
-                    'title': obj.get('title', ''),
-                    'price': f"{obj.get('rent', '')} €",
-                    'size': f"{obj.get('area', '')} m²",
-                    'rooms': str(obj.get('rooms', '')),
-                    'address': obj.get('title', ''),
+                    'id': hash(link) & 0x7FFFFFFF,
+                    'url': self._abs(link),
+                    'title': teaser.get('title', ''),
+                    'price': '',
+                    'size': '',
+                    'rooms': teaser.get('rooms', ''),
+                    'address': teaser.get('address', ''),
                     'image': image,
                     'crawler': self.get_name(),
-                    'district': obj.get('district', ''),
-                    'wbs': obj.get('wbs', ''),
-                    'features': obj.get('features', []),
-                    'notice': obj.get('notice', ''),
-                    'warmmiete': obj.get('rent'),
+                    'district': '',
+                    'notice': f"Neubauprojekt — Bezug: {teaser.get('indate', '')}",
                 })
-
-            # Neubauprojekte teasers (only on first page)
-            if page == 1:
-                for teaser in data.get('projectteaser', []):
-                    link = teaser.get('link', '')
-                    if not link:
-                        continue
-                    image = None
-                    if teaser.get('image'):
-                        image = self._abs(teaser['image'])
-                    entries.append({
-                        'id': hash(link) & 0x7FFFFFFF,
-                        'url': self._abs(link),
-                        'title': teaser.get('title', ''),
-                        'price': '',
-                        'size': '',
-                        'rooms': teaser.get('rooms', ''),
-                        'address': teaser.get('address', ''),
-                        'image': image,
-                        'crawler': self.get_name(),
-                        'district': '',
-                        'notice': f"Neubauprojekt — Bezug: {teaser.get('indate', '')}",
-                    })
-
-            total = data.get('immocount', 0)
-            if page * limit >= total:
-                break
-            page += 1
-
-        logger.debug('Howoge: found %d entries', len(entries))
         return entries
 
+    def get_results(self, search_url, max_pages=None):
+        """Override to POST to JSON API instead of fetching HTML. The first page
+        tells the total count; all remaining pages are then fetched concurrently."""
+        logger.debug("Howoge: fetching from API for %s", search_url)
+        base_body = self._build_post_data(search_url)
+        # Extract limit from the encoded body for pagination
+        qs_parsed = parse_qs(base_body)
+        limit = int(qs_parsed.get('tx_howrealestate_json_list[limit]', ['50'])[0])
+
+        first_body = self._page_body(base_body, 1)
+        first_page = self.fetch_page(
+            self.API_URL, state_key=f"{self.API_URL}&{first_body}",
+            request=lambda headers: self._post_page(first_body, headers),
+            skip_unchanged=self.skips_unchanged(search_url, max_pages))
+        if first_page is None:
+            return []
+        data = first_page.json()
+        entries = self.extract_data(data)
+
+        total = data.get('immocount', 0)
+        last_page = min(math.ceil(total / limit) if limit else 1, self.page_limit(max_pages))
+        pages = self.fetch_pages(
+            lambda page: self.extract_data(
+                self._post_page(self._page_body(base_body, page)).json(), include_teasers=False),
+            range(2, last_page + 1))
+        return self.collect_results(first_page, entries, pages)
+
     def get_expose_details(self, expose):
         try:
             soup = self.get_soup_from_url(expose['url'])
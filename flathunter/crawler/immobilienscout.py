@@ -1,17 +1,24 @@
 """Expose crawler for ImmobilienScout"""
+import asyncio
+import json
+import math
 import re
 from urllib.parse import urlencode, urlparse, parse_qs
 
+import httpx
 import requests
 
-from flathunter.abstract_crawler import Crawler
+from flathunter.abstract_crawler import AsyncCrawler, Crawler
+from flathunter.http_client import http_client
 from flathunter.logging import logger
 from flathunter.schemas.immobilienscout import ImmoscoutQuery
 
-class Immobilienscout(Crawler):
-    """Implementation of Crawler interface for ImmobilienScout"""
+class Immobilienscout(AsyncCrawler):
+    """Implementation of Crawler interface for ImmobilienScout. Native on the
+    async engine."""
 
     URL_PATTERN = re.compile(r'https://www\.immobilienscout24\.de')
+    DETAIL_FIELDS = Crawler.DETAIL_FIELDS | {'warmmiete', 'detail_contact_name'}
 
     HEADERS = {
         "Connection": "keep-alive",
@@ -20,7 +27,14 @@ class Immobilienscout(Crawler):
         "User-Agent": "ImmoScout_27.3_26.0_._"
     }
 
-    RESULT_LIMIT = 50
+    # No cap on the results besides crawl.max_pages, unless configured
+    RESULT_LIMIT = None
+    PAGE_SIZE = 50
+
+    API_REQUEST_BODY = {
+        "supportedResultListType": [],
+        "userData": {}
+    }
 
     FALLBACK_IMAGE_URL = "https://www.static-immobilienscout24.de/statpic/placeholder_house/" + \
                          "496c95154de31a357afa978cdb7f15f0_placeholder_medium.png"
@@ -58,8 +72,8 @@ class Immobilienscout(Crawler):
             realestatetype=real_estate_type, # type: ignore
             searchtype=search_type,
             geocodes=geocodes,
-            # set pagesize to result limit to minimize number of API requests
-            pagesize=self.RESULT_LIMIT,
+            # use the largest page size to minimize number of API requests
+            pagesize=self.PAGE_SIZE,
             **query_params # type: ignore
         )
 
@@ -73,21 +87,30 @@ class Immobilienscout(Crawler):
                 query_dict[k] = ",".join(v)
         return api_url + urlencode(query_dict)
 
-    def fetch_api_data(self, search_url: str, page_no: int | None = None) -> requests.Response:
-        """Applies a page number to a formatted API URL and fetches the exposes at that page"""
-
-        data = {
-            "supportedResultListType": [],
-            "userData": {}
-        }
-        response = requests.post(
+    def fetch_api_data(self, search_url: str, page_no: int | None = None,
+                       headers: dict | None = None) -> requests.Response:
+        """Applies a page number to a formatted API URL and fetches the exposes at that
+        page. The search is a POST, but it has no side effects, so it is retried."""
+        response = http_client.post(
             search_url.format(page_no),
-            headers=self.HEADERS,
-            json=data,
-            timeout=30
+            headers={**self.HEADERS, **(headers or {})},
+            json=self.API_REQUEST_BODY,
+            timeout=30,
+            retry=True
         )
         return response
 
+    async def afetch_api_data(self, search_url: str, page_no: int | None = None,
+                              headers: dict | None = None) -> httpx.Response:
+        """Coroutine variant of fetch_api_data"""
+        return await http_client.apost(
+            search_url.format(page_no),
+            headers={**self.HEADERS, **(headers or {})},
+            json=self.API_REQUEST_BODY,
+            timeout=30,
+            retry=True
+        )
+
     def extract_data(self, raw_data: dict) -> list:
         """Extracts all exposes from a JSON dictionary"""
         entries = []
@@ -129,18 +152,17 @@ class Immobilienscout(Crawler):
 
     DETAIL_API_URL = "https://api.mobile.immobilienscout24.de/expose/{}"
 
-    def get_expose_details(self, expose):
-        """Fetch description, photos, contact name, and Warmmiete from detail API"""
-        expose_id = expose.get('id', '')
+    def detail_url(self, expose):
+        return self.DETAIL_API_URL.format(expose.get('id', ''))
+
+    def parse_details(self, expose, page):
+        """Read description, photos, contact name, and Warmmiete from the detail API"""
+        if page is None or not page.ok:
+            return expose
         try:
-            resp = requests.get(
-                self.DETAIL_API_URL.format(expose_id),
-                headers=self.HEADERS, timeout=15)
-            if resp.status_code != 200:
-                return expose
-            data = resp.json()
-        except Exception as exc:
-            logger.debug("Failed to fetch details for %s: %s", expose_id, exc)
+            data = json.loads(page.content)
+        except ValueError as exc:
+            logger.debug("Failed to read details for %s: %s", expose.get('id', ''), exc)
             return expose
 
         descriptions = []
@@ -171,8 +193,19 @@ class Immobilienscout(Crawler):
         self._set_photos(expose, photos)
         return expose
 
-    def get_results(self, search_url: str, max_pages: int | None = None) -> list:
-        """Fetches the exposes from the ImmoScout mobile API, starting at the provided URL"""
+    def is_sorted_newest_first(self, search_url):
+        """ImmoScout sorting=2 orders by first activation, newest first"""
+        return parse_qs(urlparse(search_url).query).get('sorting') == ['2']
+
+    def crawl_result_limit(self) -> int | None:
+        """Maximum number of results fetched per search URL, if any"""
+        return self.config.crawl_result_limit(self.get_name(), self.RESULT_LIMIT)
+
+    def connection_urls(self, search_url):
+        return ["https://api.mobile.immobilienscout24.de/"]
+
+    def get_api_url(self, search_url: str) -> str:
+        """The mobile API URL of a search, with a placeholder for the page number"""
         query = self.get_immoscout_query(search_url)
         api_url = self.compose_api_url(query)
         if '&pagenumber' in api_url:
@@ -180,24 +213,59 @@ class Immobilienscout(Crawler):
         else:
             api_url = api_url + '&pagenumber={0}'
         logger.debug("Got search URL %s", api_url)
+        return api_url
 
-        page_no = 1
-        listings = self.fetch_api_data(api_url, page_no).json()
+    def get_last_page(self, no_of_results: int, max_pages: int | None) -> int:
+        """The last result page to fetch; the total count tells how many
+        pages there are, so the rest are fetched at once. The pages are
+        limited by crawl.max_pages, and by crawl.result_limit if set."""
+        wanted = no_of_results
+        result_limit = self.crawl_result_limit()
+        if result_limit is not None:
+            wanted = min(wanted, result_limit)
+        last_page = min(math.ceil(wanted / self.PAGE_SIZE), self.page_limit(max_pages))
+        logger.debug('Number of results: %d, fetching up to %d pages', no_of_results, last_page)
+        return last_page
 
-        no_of_results = listings["totalResults"]
+    def get_results(self, search_url: str, max_pages: int | None = None) -> list:
+        """Fetches the exposes from the ImmoScout mobile API, starting at the provided URL"""
+        api_url = self.get_api_url(search_url)
+        first_page = self.fetch_page(
+            api_url.format(1),
+            request=lambda headers: self.fetch_api_data(api_url, 1, headers),
+            skip_unchanged=self.skips_unchanged(search_url, max_pages))
+        if first_page is None:
+            return []
+        listings = first_page.json()
 
         # get data from first page
         entries = self.extract_data(listings)
 
-        # iterate over all remaining pages
-        while len(entries) < min(no_of_results, self.RESULT_LIMIT) and \
-                (max_pages is None or page_no < max_pages):
-            logger.debug(
-                '(Next page) Number of entries: %d / Number of results: %d',
-                len(entries), no_of_results)
-            page_no += 1
-            listings = self.fetch_api_data(api_url, page_no).json()
-            cur_entries = self.extract_data(listings)
-            entries.extend(cur_entries)
+        last_page = self.get_last_page(listings["totalResults"], max_pages)
+        page_nos, stop = self.further_pages(search_url, entries, range(2, last_page + 1))
+        pages = self.fetch_pages(
+            lambda page_no: self.extract_data(self.fetch_api_data(api_url, page_no).json()),
+            page_nos, stop)
+        return self.collect_results(first_page, entries, pages)
 
-        return entries
+    async def aget_results(self, search_url: str, max_pages: int | None = None) -> list:
+        """Coroutine variant of get_results"""
+        api_url = self.get_api_url(search_url)
+        first_page = await self.afetch_page(
+            api_url.format(1),
+            request=lambda headers: self.afetch_api_data(api_url, 1, headers),
+            skip_unchanged=self.skips_unchanged(search_url, max_pages))
+        if first_page is None:
+            return []
+        listings = first_page.json()
+        entries = self.extract_data(listings)
+
+        last_page = self.get_last_page(listings["totalResults"], max_pages)
+        page_nos, stop = await asyncio.to_thread(self.further_pages, search_url, entries,
+                                                 range(2, last_page + 1))
+
+        async def fetch(page_no):
+            return self.extract_data((await self.afetch_api_data(api_url, page_no)).json())
+
+        pages = await self.afetch_pages(fetch, page_nos, stop)
+        return self.collect_results(first_page, entries, pages)
@@ -1,11 +1,11 @@
 """Expose crawler for Kleinanzeigen — pure requests (no Selenium)"""
 import re
 import datetime
+from urllib.parse import urlparse, urlunparse
 
-import requests
-from bs4 import BeautifulSoup
-
-from flathunter.abstract_crawler import Crawler
+from flathunter.abstract_crawler import AsyncCrawler, Crawler
+from flathunter.extractors import Attr, Extractor, Text, select_one
+from flathunter.http_client import http_client
 from flathunter.logging import logger
 
 HTML_HEADERS = {
@@ -15,26 +15,60 @@ HTML_HEADERS = {
 }
 
 
-class Kleinanzeigen(Crawler):
-    """Implementation of Crawler interface for Kleinanzeigen (no Selenium)"""
+class Kleinanzeigen(AsyncCrawler):
+    """Implementation of Crawler interface for Kleinanzeigen (no Selenium).
+    Native on the async engine."""
 
     URL_PATTERN = re.compile(r'https://www\.kleinanzeigen\.de')
-
-    def get_page(self, search_url, page_no=None) -> BeautifulSoup:
+    DETAIL_FIELDS = Crawler.DETAIL_FIELDS | {'from'}
+    PAGE_CONCURRENCY = 2
+    EXTRACTOR = Extractor(
+        '#srchrslt-adtable article.aditem',
+        id=Attr(None, 'data-adid'),
+        url=Attr('.ellipsis', 'href'),
+        title=Text('.ellipsis'),
+        price=Text('.aditem-main--middle--price-shipping--price'),
+        tags=Text('.aditem-main--middle--tags'),
+        address=Text('div.aditem-main--top--left'),
+        image=Attr('div.aditem-image img', 'src'),
+    )
+
+    def get_page_url(self, search_url, page_no):
+        """Kleinanzeigen puts the page as 'seite:N' before the category segment"""
+        parsed = urlparse(search_url)
+        segments = [s for s in parsed.path.rstrip('/').split('/') if not s.startswith('seite:')]
+        if page_no > 1:
+            segments.insert(len(segments) - 1, f"seite:{page_no}")
+        return urlunparse(parsed._replace(path='/'.join(segments)))
+
+    def is_sorted_newest_first(self, search_url):
+        """Kleinanzeigen sorts by date unless another 'sortierung:' is in the path"""
+        return 'sortierung:' not in search_url or 'sortierung:neuste' in search_url
+
+    def get_page_count(self, soup):
+        return self._max_page_number(
+            soup, '.pagination-pages .pagination-page, .pagination-pages .pagination-current')
+
+    def request_page(self, url, headers):
         """Fetch search page via requests"""
-        resp = requests.get(search_url, headers=HTML_HEADERS, timeout=20)
-        if resp.status_code != 200:
-            logger.warning("Kleinanzeigen: got %d for %s", resp.status_code, search_url)
-        return BeautifulSoup(resp.content, 'lxml')
+        return http_client.get(url, headers={**HTML_HEADERS, **headers}, timeout=20)
+
+    async def arequest_page(self, url, headers):
+        return await http_client.aget(url, headers={**HTML_HEADERS, **headers}, timeout=20)
+
+    def request_detail(self, url):
+        return http_client.get(url, headers=HTML_HEADERS, timeout=15)
 
-    def get_expose_details(self, expose):
-        """Fetch description and photos from expose page"""
+    async def arequest_detail(self, url):
+        return await http_client.aget(url, headers=HTML_HEADERS, timeout=15)
+
+    def parse_details(self, expose, page):
+        """Read description and photos from the expose page"""
         expose['from'] = datetime.datetime.now().strftime('%d.%m.%Y')
+        if page is None or not page.ok:
+            return expose
         try:
-            resp = requests.get(expose.get('url', ''), headers=HTML_HEADERS, timeout=15)
-            if resp.status_code != 200:
-                return expose
-            soup = BeautifulSoup(resp.content, 'lxml')
+            soup = page.soup
 
             desc_el = soup.find('p', id='viewad-description-text')
             if desc_el:
@@ -47,67 +81,45 @@ class Kleinanzeigen(Crawler):
                     photos.append(src)
             self._set_photos(expose, photos)
         except Exception as exc:
-            logger.debug("Failed to fetch details for %s: %s", expose.get('url'), exc)
+            logger.debug("Failed to read details for %s: %s", expose.get('url'), exc)
         return expose
 
-    # pylint: disable=too-many-locals
     def extract_data(self, raw_data):
-        """Extracts all exposes from a provided Soup object"""
+        """Extracts all exposes from a parsed result page"""
         entries = []
         if raw_data is None:
             logger.warning("Kleinanzeigen: No page content received")
             return entries
-        soup = raw_data.find(id="srchrslt-adtable")
-        if soup is None:
+        if select_one(raw_data, "#srchrslt-adtable") is None:
             logger.warning("Kleinanzeigen: Could not find search results table - page may have changed or bot detection triggered")
             return entries
 
-        exposes = soup.find_all("article", class_="aditem")
-        for  expose in exposes:
-
-            title_elem = expose.find(class_="ellipsis")
-            if title_elem.get("href"):
-                url = title_elem.get("href")
-            else:
+        for expose in self.EXTRACTOR.extract(raw_data):
+            url = expose['url']
+            if not url:
                 continue
-
-            try:
-                price = expose.find(
-                    class_="aditem-main--middle--price-shipping--price").text.strip()
-                tags_element = expose.find(class_="aditem-main--middle--tags")
-                address = expose.find("div", {"class": "aditem-main--top--left"})
-                image_container = expose.find("div", {"class": "aditem-image"})
-            except AttributeError as error:
-                logger.warning("Unable to process Kleinanzeigen expose: %s", str(error))
+            if expose['price'] is None or expose['address'] is None:
+                logger.warning("Unable to process Kleinanzeigen expose %s", expose['id'])
                 continue
 
-            image = None
-            if image_container is not None:
-                img_tag = image_container.find("img")
-                if img_tag is not None:
-                    image = img_tag.get("src")
-
-            address = address.text.strip()
-            address = address.replace('\n', ' ').replace('\r', '')
-            address = " ".join(address.split())
+            address = " ".join(expose['address'].split())
 
             size = ""
             rooms = ""
-            if tags_element is not None:
-                tags_text = tags_element.text.strip()
-                size_match = re.search(r'(\d+)\s*m²', tags_text)
+            if expose['tags'] is not None:
+                size_match = re.search(r'(\d+)\s*m²', expose['tags'])
                 if size_match:
                     size = size_match.group(1) + " m²"
-                rooms_match = re.search(r'(\d+[.,]?\d*)\s*Zi\.?', tags_text)
+                rooms_match = re.search(r'(\d+[.,]?\d*)\s*Zi\.?', expose['tags'])
                 if rooms_match:
                     rooms = rooms_match.group(1)
 
             details = {
-                'id': int(expose.get("data-adid")),
-                'image': image,
+                'id': int(expose['id']),
+                'image': expose['image'],
                 'url': ("https://www.kleinanzeigen.de" + url),
-                'title': title_elem.text.strip(),
-                'price': price,
+                'title': expose['title'],
+                'price': expose['price'],
                 'size': size,
                 'rooms': rooms,
                 'address': address,
@@ -2,6 +2,7 @@
 import re
 
 from flathunter.abstract_crawler import Crawler
+from flathunter.extractors import Attr, Exists, Extractor, Labelled, Text
 from flathunter.logging import logger
 from flathunter.utils import parse_german_price
 
@@ -10,17 +11,26 @@ class LivingInBerlin(Crawler):
     """Implementation of Crawler interface for livinginberlin.de"""
 
     URL_PATTERN = re.compile(r'https://www\.livinginberlin\.de')
+    DETAIL_FIELDS = Crawler.DETAIL_FIELDS | {'warmmiete'}
     BASE_URL = "https://www.livinginberlin.de"
-
-    def extract_data(self, soup):
+    PAGINATION_SELECTOR = 'ul.uk-pagination a[href]'
+    EXTRACTOR = Extractor(
+        "div.uk-card.uk-card-default",
+        url=Attr("div.uk-card-footer a[href]", "href"),
+        has_body=Exists("div.uk-card-body"),
+        location=Text("div.uk-card-body h3", strip_parts=True),
+        title=Text("div.uk-card-body p", strip_parts=True),
+        properties=Labelled("div.uk-card-body span.uk-text-muted"),
+        # Thumbnail from card-media-top
+        image=Attr("div.uk-card-media-top img", "data-src", "src"),
+    )
+
+    def extract_data(self, raw_data):
         entries = []
-        for card in soup.select("div.uk-card.uk-card-default"):
-            # URL from footer link or image link
-            footer_link = card.select_one("div.uk-card-footer a[href]")
-            if footer_link is None:
-                continue
-            href = footer_link.get("href", "")
-            if "angebot" not in href:
+        for card in self.EXTRACTOR.extract(raw_data):
+            # URL from footer link
+            href = card['url']
+            if href is None or "angebot" not in href:
                 continue
             href = self._abs(href)
 
@@ -29,30 +39,14 @@ class LivingInBerlin(Crawler):
                 continue
             expose_id = int(id_match.group(1))
 
-            body = card.select_one("div.uk-card-body")
-            if body is None:
+            if not card['has_body']:
                 continue
 
-            location = ""
-            h3 = body.find("h3")
-            if h3:
-                location = h3.get_text(strip=True)
-
-            title = ""
-            p = body.find("p")
-            if p:
-                title = p.get_text(strip=True)
-
             # Parse "Zimmer:", "Wohnfläche:", "Kaltmiete:" from span.uk-text-muted + sibling text
             price = ""
             size = ""
             rooms = ""
-            for span in body.select("span.uk-text-muted"):
-                label = span.get_text(strip=True)
-                value = span.next_sibling
-                if value is None:
-                    continue
-                value = str(value).strip()
+            for label, value in card['properties']:
                 if "Kaltmiete" in label:
                     price = value
                 elif "Wohnfläche" in label:
@@ -60,22 +54,16 @@ class LivingInBerlin(Crawler):
                 elif "Zimmer" in label:
                     rooms = value
 
-            # Thumbnail from card-media-top
-            image = None
-            img = card.select_one("div.uk-card-media-top img")
-            if img:
-                src = img.get("data-src") or img.get("src")
-                if src:
-                    image = self._abs(src)
+            image = self._abs(card['image']) if card['image'] else None
 
             entries.append({
                 'id': expose_id,
                 'url': href,
-                'title': title,
+                'title': card['title'] or "",
                 'price': price,
                 'size': size,
                 'rooms': rooms,
-                'address': location,
+                'address': card['location'] or "",
                 'image': image,
                 'crawler': self.get_name(),
             })
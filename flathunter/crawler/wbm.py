@@ -2,6 +2,7 @@
 import re
 
 from flathunter.abstract_crawler import Crawler
+from flathunter.extractors import Attr, Extractor, Text, Texts
 from flathunter.logging import logger
 from flathunter.utils import parse_german_price
 
@@ -11,80 +12,65 @@ class Wbm(Crawler):
 
     URL_PATTERN = re.compile(r'https://www\.wbm\.de')
     BASE_URL = "https://www.wbm.de"
-
-    def extract_data(self, soup):
+    PAGINATION_SELECTOR = 'ul.pagination a[href]'
+    EXTRACTOR = Extractor(
+        'div.row.openimmo-search-list-item',
+        uid=Attr(None, 'data-uid'),
+        link=Attr('a.immo-button-cta', 'href'),
+        sign_link=Attr('a.btn.sign', 'href'),
+        title=Text('h2.imageTitle', strip_parts=True),
+        address=Text('div.address', strip_parts=True),
+        district=Text('div.area', strip_parts=True),
+        # Main properties: rent, size, rooms
+        price=Text('li.main-property .main-property-value.main-property-rent', strip_parts=True),
+        size=Text('li.main-property .main-property-value.main-property-size', strip_parts=True),
+        rooms=Text('li.main-property .main-property-value.main-property-rooms', strip_parts=True),
+        amenities=Texts('ul.check-property-list li'),
+        image=Attr('div.imgWrap', 'data-img-src', 'style'),
+    )
+
+    def extract_data(self, raw_data):
         entries = []
-        for card in soup.select('div.row.openimmo-search-list-item'):
-            uid = card.get('data-uid', '')
+        for card in self.EXTRACTOR.extract(raw_data):
+            uid = card['uid']
             if not uid:
                 continue
             expose_id = int(uid)
 
             # Detail link
-            link_el = card.select_one('a.immo-button-cta') or card.select_one('a.btn.sign')
-            if not link_el:
+            href = card['link'] if card['link'] is not None else card['sign_link']
+            if href is None:
                 continue
-            url = self._abs(link_el.get('href', ''))
-
-            title = ''
-            h2 = card.select_one('h2.imageTitle')
-            if h2:
-                title = h2.get_text(strip=True)
-
-            address = ''
-            addr_el = card.select_one('div.address')
-            if addr_el:
-                address = addr_el.get_text(strip=True)
-
-            district = ''
-            area_el = card.select_one('div.area')
-            if area_el:
-                district = area_el.get_text(strip=True)
-
-            # Main properties: rent, size, rooms
-            price = ''
-            size = ''
-            rooms = ''
-            for li in card.select('li.main-property'):
-                val_el = li.select_one('.main-property-value')
-                if not val_el:
-                    continue
-                val = val_el.get_text(strip=True)
-                if 'main-property-rent' in val_el.get('class', []):
-                    price = val
-                elif 'main-property-size' in val_el.get('class', []):
-                    size = val
-                elif 'main-property-rooms' in val_el.get('class', []):
-                    rooms = val
-
-            # Amenities
-            amenities = [li.get_text(strip=True) for li in card.select('ul.check-property-list li')]
+            url = self._abs(href)
 
             # Image
             image = None
-            img_wrap = card.select_one('div.imgWrap')
-            if img_wrap:
-                bg = img_wrap.get('data-img-src') or img_wrap.get('style', '')
-                if bg.startswith('/'):
-                    image = self._abs(bg)
-                elif 'url(' in bg:
-                    m = re.search(r'url\(([^)]+)\)', bg)
-                    if m:
-                        image = self._abs(m.group(1))
-
-            entries.append({
+            bg = card['image'] or ''
+            if bg.startswith('/'):
+                image = self._abs(bg)
+            elif 'url(' in bg:
+                m = re.search(r'url\(([^)]+)\)', bg)
+                if m:
+                    image = self._abs(m.group(1))
+
+            entry = {
                 'id': expose_id,
                 'url': url,
-                'title': title,
-                'price': price,
-                'size': size,
-                'rooms': rooms,
-                'address': address,
+                'title': card['title'] or '',
+                'price': card['price'] or '',
+                'size': card['size'] or '',
+                'rooms': card['rooms'] or '',
+                'address': card['address'] or '',
                 'image': image,
                 'crawler': self.get_name(),
-                'district': district,
-                'amenities': amenities,
-            })
+                'district': card['district'] or '',
+                'amenities': card['amenities'],
+            }
+            # The listed rent is the Warmmiete
+            warmmiete = parse_german_price(entry['price'])
+            if warmmiete:
+                entry['warmmiete'] = warmmiete
+            entries.append(entry)
 
         logger.debug('Wbm: found %d entries', len(entries))
         return entries
@@ -93,10 +79,6 @@ class Wbm(Crawler):
         try:
             soup = self.get_soup_from_url(expose['url'])
 
-            warmmiete = parse_german_price(expose.get('price', ''))
-            if warmmiete:
-                expose['warmmiete'] = warmmiete
-
             desc = self._extract_description(soup, extra_excludes=('datenschutz',))
             if desc:
                 expose['detail_description'] = desc
@@ -1,46 +1,30 @@
 """Expose crawler for WgGesucht"""
+import json
+import os
 import re
-from typing import Optional, List, Dict, Union
+import threading
+import time
+from typing import Optional, List, Dict
+from urllib.parse import parse_qs, urlparse, urlunparse
 
 import requests
 from bs4 import BeautifulSoup, Tag
 
+from flathunter.extractors import Attr, Exists, Extractor, Text
+from flathunter.http_client import http_client
 from flathunter.logging import logger
 from flathunter.abstract_crawler import Crawler
 
 
-def get_title(title_row: Tag) -> str:
-    """Parse the title from the expose title element"""
-    return title_row.text.strip()
-
-
-def get_url(title_row: Tag) -> Optional[str]:
-    """Parse the expose URL from the expose title element"""
-    a_element = title_row.find('a')
-    if not isinstance(a_element, Tag) \
-            or not a_element.has_attr('href') \
-            or not isinstance(a_element.attrs['href'], str):
-        return None
-    return 'https://www.wg-gesucht.de/' + a_element.attrs['href'].removeprefix("/")
-
-
-def extract_href_style(row: Tag) -> Optional[str]:
-    """Extract the style attribute from a image div"""
-    div = row.find('div', {"class": "card_image"})
-    if not isinstance(div, Tag):
+def get_url(href: Optional[str]) -> Optional[str]:
+    """Parse the expose URL from the link in the expose title"""
+    if href is None:
         return None
-    a_element = div.find('a')
-    if not isinstance(a_element, Tag) or not a_element.has_attr('style'):
-        return None
-    style = a_element.attrs['style']
-    if not isinstance(style, str):
-        return None
-    return style
+    return 'https://www.wg-gesucht.de/' + href.removeprefix("/")
 
 
-def get_image_url(row: Tag) -> Optional[str]:
-    """Parse the image url from the expose"""
-    href_style = extract_href_style(row)
+def get_image_url(href_style: Optional[str]) -> Optional[str]:
+    """Parse the image url from the style attribute of the image link"""
     if href_style is None:
         return None
     image_match = re.match(r'background-image: url\((.*)\);', href_style)
@@ -49,12 +33,11 @@ def get_image_url(row: Tag) -> Optional[str]:
     return image_match[1]
 
 
-def get_rooms(row: Tag) -> str:
-    """Parse the number of rooms from the expose"""
-    details_el = row.find("div", {"class": "col-xs-11"})
-    if not isinstance(details_el, Tag):
+def get_rooms(details: Optional[str]) -> str:
+    """Parse the number of rooms from the expose details text"""
+    if details is None:
         return ""
-    detail_string = details_el.text.strip().split("|")
+    detail_string = details.split("|")
     details_array = list(map(lambda s: re.sub(' +', ' ',
                                               re.sub(r'\W', ' ', s.strip())),
                              detail_string))
@@ -62,63 +45,45 @@ def get_rooms(row: Tag) -> str:
     return rooms_tmp[0][:1] if rooms_tmp else ""
 
 
-def get_price(numbers_row: Tag) -> Optional[str]:
-    """Parse the price from the expose"""
-    price_el = numbers_row.find("div", {"class": "col-xs-3"})
-    if not isinstance(price_el, Tag):
-        return None
-    return price_el.text.strip()
-
-
-def get_dates(numbers_row: Tag) -> List[str]:
+def get_dates(dates: Optional[str]) -> List[str]:
     """Parse the advert dates from the expose"""
-    date_el = numbers_row.find("div", {"class": "text-center"})
-    if not isinstance(date_el, Tag):
+    if dates is None:
         return []
-    return re.findall(r'\d{2}.\d{2}.\d{4}', date_el.text)
+    return re.findall(r'\d{2}.\d{2}.\d{4}', dates)
 
 
-def get_size(numbers_row: Tag) -> List[str]:
+def get_size(size: Optional[str]) -> List[str]:
     """Parse the room size from the expose"""
-    size_el = numbers_row.find("div", {"class": "text-right"})
-    if not isinstance(size_el, Tag):
+    if size is None:
         return []
-    return re.findall(r'\d{1,4}\sm²', size_el.text)
+    return re.findall(r'\d{1,4}\sm²', size)
 
-def is_verified_company(row: Tag) -> bool:
-    """Filter out ads from 'Verified Companies'"""
-    verified_el = row.find("span", {"class": "label_verified"})
-    if isinstance(verified_el, Tag):
-        return True
-    return False
 
 # pylint: disable=too-many-return-statements
-def parse_expose_element_to_details(row: Tag, crawler: str) -> Optional[Dict]:
-    """Parse an Expose soup element to an Expose details dictionary"""
-    title_row = row.find('h2', {"class": "truncate_title"})
-    if title_row is None or not isinstance(title_row, Tag):
+def parse_expose_element_to_details(row: Dict, crawler: str) -> Optional[Dict]:
+    """Parse the extracted fields of an expose row to an Expose details dictionary"""
+    if row['title'] is None:
         logger.warning("No title found - skipping")
         return None
-    if is_verified_company(row):
+    if row['verified']:
         logger.warning("Advert found - skipping")
         return None
-    title = get_title(title_row)
-    url = get_url(title_row)
+    title = row['title']
+    url = get_url(row['href'])
     if url is None:
         logger.warning("No expose URL found - skipping")
         return None
-    image = get_image_url(row)
-    rooms = get_rooms(row)
-    numbers_row = row.find("div", {"class": "middle"})
-    if not isinstance(numbers_row, Tag):
+    image = get_image_url(row['image_style'])
+    rooms = get_rooms(row['details'])
+    if not row['has_numbers']:
         logger.warning("No numbers row found - skipping")
         return None
-    price = get_price(numbers_row)
-    dates = get_dates(numbers_row)
+    price = row['price']
+    dates = get_dates(row['dates'])
     if len(dates) == 0:
         logger.warning("No dates found - skipping")
         return None
-    size = get_size(numbers_row)
+    size = get_size(row['size'])
     if len(size) == 0:
         logger.warning("No size found - skipping")
         return None
@@ -147,19 +112,6 @@ def parse_expose_element_to_details(row: Tag, crawler: str) -> Optional[Dict]:
     return details
 
 
-def liste_attribute_filter(element: Union[Tag, str]) -> bool:
-    """Return true for elements whose 'id' attribute starts with 'liste-' 
-    and are not contained in the 'premium_user_extra_list' container"""
-    if not isinstance(element, Tag):
-        return False
-    if not element.attrs or "id" not in element.attrs:
-        return False
-    if not element.parent or not element.parent.attrs or "class" not in element.parent.attrs:
-        return False
-    return element.attrs["id"].startswith('liste-') and \
-        'premium_user_extra_list' not in element.parent.attrs["class"]
-
-
 HTML_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
                   "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -167,18 +119,146 @@ HTML_HEADERS = {
 }
 
 
+def search_key(url: str) -> str:
+    """The URL of the first page of the search a list URL belongs to"""
+    parsed = urlparse(url)
+    path = re.sub(r'\.\d+\.html$', '.0.html', parsed.path)
+    return urlunparse(parsed._replace(path=path))
+
+
+class WgGesuchtSessions:
+    """Cookie sessions for WG-Gesucht, kept for the whole run. WG-Gesucht only
+    applies the filters of a search once its filter cookies are set, so the
+    first request of every search is sent twice; all later requests for that
+    search, including its other result pages, are sent once. Expose pages
+    don't depend on the filters and share a single session.
+
+    With a cookie file, the cookies of primed searches are persisted and
+    reused by later runs for up to `max_age` seconds."""
+
+    DETAIL_KEY = ''
+
+    def __init__(self, headers: Dict[str, str], cookie_file: Optional[str] = None,
+                 max_age: float = 12 * 3600):
+        self.headers = headers
+        self.cookie_file = cookie_file
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, requests.Session] = {}
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._primed: Dict[str, float] = {}
+        self._load()
+
+    def _session(self, key: str) -> requests.Session:
+        with self._lock:
+            if key not in self._sessions:
+                self._sessions[key] = http_client.create_session(self.headers)
+                self._key_locks[key] = threading.Lock()
+            return self._sessions[key]
+
+    def search_page(self, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Fetch a search result page, setting up the search's filter cookies first if needed"""
+        key = search_key(url)
+        session = self._session(key)
+        with self._key_locks[key]:
+            if key not in self._primed:
+                http_client.get(url, session=session)
+                self._primed[key] = time.time()
+                self._save()
+        return http_client.get(url, session=session, headers=headers)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Fetch a page that does not depend on search filters"""
+        return http_client.get(url, session=self._session(self.DETAIL_KEY), **kwargs)
+
+    def _load(self):
+        if not self.cookie_file or not os.path.exists(self.cookie_file):
+            return
+        try:
+            with open(self.cookie_file, encoding='utf-8') as cookie_file:
+                stored = json.load(cookie_file)
+        except (OSError, ValueError) as exc:
+            logger.warning("Could not read WG-Gesucht cookies from %s: %s", self.cookie_file, exc)
+            return
+        now = time.time()
+        for key, entry in stored.items():
+            if now - entry.get('saved', 0) > self.max_age:
+                continue
+            session = self._session(key)
+            for cookie in entry.get('cookies', []):
+                session.cookies.set(**cookie)
+            self._primed[key] = entry['saved']
+        logger.debug("Reusing WG-Gesucht cookies for %d searches", len(self._primed))
+
+    def _save(self):
+        if not self.cookie_file:
+            return
+        with self._lock:
+            stored = {
+                key: {
+                    'saved': saved,
+                    'cookies': [{'name': c.name, 'value': c.value, 'domain': c.domain,
+                                 'path': c.path, 'expires': c.expires}
+                                for c in self._sessions[key].cookies],
+                }
+                for key, saved in self._primed.items()
+            }
+        try:
+            with open(self.cookie_file, 'w', encoding='utf-8') as cookie_file:
+                json.dump(stored, cookie_file)
+        except OSError as exc:
+            logger.warning("Could not save WG-Gesucht cookies to %s: %s", self.cookie_file, exc)
+
+
 class WgGesucht(Crawler):
     """Implementation of Crawler interface for WgGesucht"""
 
     URL_PATTERN = re.compile(r'https://www\.wg-gesucht\.de')
+    # Rows have an id starting with 'liste-'; rows in the 'premium_user_extra_list'
+    # container and hidden rows are skipped
+    EXTRACTOR = Extractor(
+        '[class]:not(.premium_user_extra_list) > [id^="liste-"][class]:not(.display-none)',
+        title=Text('h2.truncate_title'),
+        href=Attr('h2.truncate_title a', 'href'),
+        verified=Exists('span.label_verified'),
+        image_style=Attr('div.card_image a', 'style'),
+        details=Text('div.col-xs-11'),
+        has_numbers=Exists('div.middle'),
+        price=Text('div.middle div.col-xs-3'),
+        dates=Text('div.middle div.text-center'),
+        size=Text('div.middle div.text-right'),
+    )
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.sessions = WgGesuchtSessions(self.HEADERS, config.wg_gesucht_cookie_file(),
+                                          config.wg_gesucht_cookie_max_age())
+
+    def get_page_url(self, search_url, page_no):
+        """The last number of a WG-Gesucht list URL is the zero-based page index"""
+        parsed = urlparse(search_url)
+        page_match = re.search(r'\.(\d+)\.html$', parsed.path)
+        if page_match is None:
+            return search_url if page_no == 1 else None
+        path = f"{parsed.path[:page_match.start(1)]}{page_no - 1}.html"
+        return urlunparse(parsed._replace(path=path))
+
+    def is_sorted_newest_first(self, search_url):
+        """WG-Gesucht sorts by online date unless another sort_column is requested"""
+        return parse_qs(urlparse(search_url).query).get('sort_column', ['0']) == ['0']
+
+    def get_page_count(self, soup):
+        return self._max_page_number(soup, 'ul.pagination .page-link')
 
     def get_expose_details(self, expose):
         """Fetch description and photos from expose page"""
         try:
-            resp = requests.get(expose.get('url', ''), headers=HTML_HEADERS, timeout=15)
-            if resp.status_code != 200:
+            url = expose.get('url', '')
+            page = self.fetch_detail_page(
+                url, lambda: self.sessions.get(url, headers=HTML_HEADERS, timeout=15))
+            if not page.ok:
                 return expose
-            soup = BeautifulSoup(resp.content, 'lxml')
+            soup = page.soup
 
             desc_el = soup.find('div', id='ad_description_text')
             if not desc_el:
@@ -196,17 +276,10 @@ class WgGesucht(Crawler):
             logger.debug("Failed to fetch details for %s: %s", expose.get('url'), exc)
         return expose
 
-    # pylint: disable=too-many-locals
-    def extract_data(self, raw_data: BeautifulSoup) -> List[Dict]:
-        """Extracts all exposes from a provided Soup object"""
+    def extract_data(self, raw_data) -> List[Dict]:
+        """Extracts all exposes from a parsed result page"""
         entries = []
-
-        findings = raw_data.find_all(liste_attribute_filter)
-        existing_findings = [
-            e for e in findings
-            if isinstance(e, Tag) and e.has_attr('class') and not 'display-none' in e['class']
-        ]
-        for row in existing_findings:
+        for row in self.EXTRACTOR.extract(raw_data):
             details = parse_expose_element_to_details(row, self.get_name())
             if details is None:
                 continue
@@ -230,13 +303,16 @@ class WgGesucht(Crawler):
         return ' '.join(a_element.text.strip().split())
 
     def get_soup_from_url(self, url: str) -> BeautifulSoup:
-        """Creates a Soup object from the HTML at the provided URL.
-        Loads the page twice so WG-Gesucht filters are applied correctly."""
-        sess = requests.session()
-        sess.get(url, headers=self.HEADERS)
-        resp = sess.get(url, headers=self.HEADERS)
+        """Creates a Soup object from the HTML at the provided URL, through the
+        page caches"""
+        page = self.fetch_detail_page(url, lambda: self.sessions.get(url))
 
-        if resp.status_code not in (200, 405):
+        if page.status_code not in (200, 405):
             logger.error("Got response (%i): %s",
-                         resp.status_code, resp.content)
-        return BeautifulSoup(resp.content, 'lxml')
+                         page.status_code, page.content)
+        return page.soup
+
+    def request_page(self, url, headers):
+        """Loads a result page in the session of its search, so that
+        WG-Gesucht's filters are applied"""
+        return self.sessions.search_page(url, headers)
@@ -1,13 +1,23 @@
 """Built-in expose processor implementations. Used by the processor pipelines
    in flathunter and in the webservice"""
 
+import threading
+from typing import Dict
+
+from flathunter.expose import Expose
 from flathunter.logging import logger
-from flathunter.abstract_processor import Processor
+from flathunter.abstract_processor import COST_FETCH, Processor
+from flathunter.utils.concurrency import stream_map_keyed
 
 
 class FilterProcessor(Processor):
     """Filter processor implementation. Applies a filter to the list of exposes"""
 
+    REQUIRES = frozenset({'id', 'title', 'price', 'size', 'rooms'})
+    FILTER = True
+    # The already-seen filter marks exposes as processed
+    SIDE_EFFECT = True
+
     def __init__(self, config, filter_set):
         self.config = config
         self.filter = filter_set
@@ -19,6 +29,10 @@ class FilterProcessor(Processor):
 class AddressResolver(Processor):
     """Processor to extract apartment addresses from expose links"""
 
+    COST = COST_FETCH
+    REQUIRES = frozenset({'address', 'crawler'})
+    PROVIDES = frozenset({'address'})
+
     def __init__(self, config):
         self.config = config
 
@@ -41,19 +55,117 @@ def _format_german_price(value: float) -> str:
 
 class CrawlExposeDetails(Processor):
     """Fetches detail pages via each crawler's get_expose_details.
-    Enriches exposes with description, photos, and Warmmiete."""
+    Enriches exposes with description, photos, and Warmmiete. Detail pages
+    are fetched on a thread pool, with at most detail_concurrency() at a
+    time per crawler, and exposes are passed on as soon as they are enriched.
+    Exposes of a crawler at its limit wait in that crawler's queue, so they
+    do not hold pool threads the other crawlers could use.
+    With lazy details, the fetch is deferred until a later stage needs a
+    detail field the list page did not provide (see Expose.defer), and is
+    then made on the same pool by LoadDeferredDetails. Exposes whose
+    Warmmiete is only on the detail page are fetched right away: the price
+    is read by the filters, which would otherwise fetch one by one."""
+
+    COST = COST_FETCH
+    REQUIRES = frozenset({'url', 'crawler'})
+    # The Warmmiete replaces the price; some crawlers complete the address
+    PROVIDES = frozenset({'detail_description', 'detail_photos', 'detail_total_photos',
+                          'detail_contact_name', 'warmmiete', 'price', 'address', 'from'})
+    # The detail fields that can be deferred
+    LAZY_FIELDS = PROVIDES - {'warmmiete', 'price', 'address'}
 
     def __init__(self, config):
         self.config = config
+        self.lazy = config.crawl_lazy_details()
+        self.DEFERS = self.LAZY_FIELDS if self.lazy else frozenset()  # pylint: disable=invalid-name
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _slots_for(self, searcher) -> threading.BoundedSemaphore:
+        name = searcher.get_name()
+        with self._lock:
+            if name not in self._slots:
+                self._slots[name] = threading.BoundedSemaphore(searcher.detail_concurrency())
+            return self._slots[name]
+
+    def fetch_details(self, searcher, expose):
+        """Enrich the expose from its detail page"""
+        return self.apply_warmmiete(searcher.get_expose_details(expose))
+
+    def load_details(self, searcher, expose):
+        """Loader for deferred details. These are read from whichever thread
+        needs them, outside the pool, so the limit per crawler is kept here."""
+        with self._slots_for(searcher):
+            return self.fetch_details(searcher, expose)
+
+    def defer_details(self, searcher, expose) -> bool:
+        """Defer the detail fetch until one of the missing detail fields is
+        read. Returns False if the expose cannot defer fields."""
+        if not self.lazy or not isinstance(expose, Expose):
+            return False
+        fields = {field for field in searcher.DETAIL_FIELDS if field not in expose}
+        if not fields <= self.LAZY_FIELDS:
+            # The Warmmiete replaces the listed price, which the filters read
+            return False
+        self.apply_warmmiete(expose)
+        expose.defer(fields, lambda expose: self.load_details(searcher, expose))
+        return True
 
     def process_expose(self, expose):
         searcher = self.config.searcher_for_name(expose.get('crawler', ''))
-        if searcher:
-            expose = searcher.get_expose_details(expose)
+        if searcher is None:
+            return self.apply_warmmiete(expose)
+        if self.defer_details(searcher, expose):
+            return expose
+        return self.fetch_details(searcher, expose)
+
+    def detail_concurrency(self, crawler: str) -> int:
+        """How many detail pages of the crawler may be fetched at a time"""
+        searcher = self.config.searcher_for_name(crawler)
+        return searcher.detail_concurrency() if searcher is not None else 1
+
+    def run_on_pool(self, func, exposes):
+        """Apply func to the exposes on the detail pool, with the limits per
+        crawler"""
+        return stream_map_keyed(func, exposes,
+                                key=lambda expose: expose.get('crawler', ''),
+                                key_limit=self.detail_concurrency,
+                                max_workers=self.config.crawl_detail_workers(),
+                                ordered=self.config.crawl_detail_ordered(),
+                                thread_name_prefix='details')
 
+    def process_exposes(self, exposes):
+        return self.run_on_pool(self.process_expose, exposes)
+
+    def load_deferred(self):
+        return LoadDeferredDetails(self) if self.lazy else None
+
+    @staticmethod
+    def apply_warmmiete(expose):
+        """Replace the listed price with the Warmmiete, if the details had one"""
         warmmiete = expose.get('warmmiete')
         if warmmiete is not None:
             expose['price'] = _format_german_price(warmmiete)
+        return expose
 
+
+
+class LoadDeferredDetails(Processor):
+    """Fetches the detail pages CrawlExposeDetails deferred, on its pool.
+    Placed by plan_stages before the first stage that needs the details, so
+    only exposes that got that far cost a detail request."""
+
+    COST = COST_FETCH
+    REQUIRES = frozenset({'crawler'})
+
+    def __init__(self, details: CrawlExposeDetails):
+        self.details = details
+        self.PROVIDES = details.DEFERS  # pylint: disable=invalid-name
+
+    def process_expose(self, expose):
+        if isinstance(expose, Expose):
+            expose.resolve_all()
         return expose
 
+    def process_exposes(self, exposes):
+        return self.details.run_on_pool(self.process_expose, exposes)
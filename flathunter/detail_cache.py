@@ -0,0 +1,137 @@
+"""On-disk cache of expose detail pages. Detail pages and detail API responses
+are kept in an SQLite database for a per-crawler TTL, so that re-running a
+backfill or reprocessing exposes after a crash does not fetch them again. The
+database is bounded in size; the least recently used entries are evicted."""
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Callable, Optional
+
+import requests
+
+from flathunter.logging import logger
+from flathunter.page_cache import CachedPage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    crawler TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    content BLOB NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+)
+"""
+
+
+class DetailCache:
+    """SQLite-backed response cache keyed by URL. Disabled until configured
+    with a path."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._config = None
+        self._max_bytes = 0
+        # Total length of the cached contents, kept up to date on every
+        # insert and delete so that puts need not sum the table
+        self._size = 0
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+
+    def configure(self, config):
+        """Open the database configured in `detail_cache.path`, if any"""
+        self.close()
+        self._config = config
+        path = config.detail_cache_path()
+        if not path:
+            return
+        with self._lock:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(SCHEMA)
+            self._size = self._db.execute(
+                "SELECT COALESCE(SUM(LENGTH(content)), 0) FROM pages").fetchone()[0]
+        self._max_bytes = config.detail_cache_max_size() * 1024 * 1024
+        logger.debug("Using detail cache at %s", path)
+
+    def close(self):
+        """Close the database"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @property
+    def enabled(self) -> bool:
+        """True if a database is configured"""
+        return self._db is not None
+
+    def get(self, url: str, crawler: str) -> Optional[CachedPage]:
+        """The cached page for the URL, if it is younger than the crawler's TTL"""
+        if self._db is None:
+            return None
+        now = time.time()
+        ttl = self._config.detail_cache_ttl(crawler)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, content FROM pages WHERE url = ? AND fetched_at > ?",
+                (url, now - ttl)).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (now, url))
+        if row is None:
+            self.misses[crawler] += 1
+            return None
+        self.hits[crawler] += 1
+        return CachedPage(url, row[0], row[1])
+
+    def put(self, url: str, crawler: str, page: CachedPage):
+        """Store a page, evicting old entries if the cache grows too large"""
+        if self._db is None:
+            return
+        now = time.time()
+        with self._lock:
+            replaced = self._db.execute(
+                "SELECT LENGTH(content) FROM pages WHERE url = ?", (url,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                (url, crawler, page.status_code, page.content, now, now))
+            self._size += len(page.content) - (replaced[0] if replaced else 0)
+            self._evict()
+
+    def _evict(self):
+        if self._size <= self._max_bytes:
+            return
+        # Evict down to 90% of the limit, so that we don't evict on every insert
+        excess = self._size - self._max_bytes * 0.9
+        evicted = 0
+        for url, length in self._db.execute(
+                "SELECT url, LENGTH(content) FROM pages ORDER BY accessed_at").fetchall():
+            if excess <= 0:
+                break
+            self._db.execute("DELETE FROM pages WHERE url = ?", (url,))
+            excess -= length
+            self._size -= length
+            evicted += 1
+        logger.debug("Detail cache: evicted %d pages", evicted)
+
+    def fetch(self, url: str, crawler: str, load: Callable[[], requests.Response]) -> CachedPage:
+        """Return the cached page for the URL, calling `load` and storing a
+        successful response if there is no fresh one"""
+        page = self.get(url, crawler)
+        if page is not None:
+            return page
+        page = CachedPage.from_response(load())
+        if page.ok:
+            self.put(url, crawler, page)
+        return page
+
+    def log_stats(self):
+        """Log the hit and miss counts per crawler"""
+        for crawler in sorted(set(self.hits) | set(self.misses)):
+            logger.info("Detail cache %s: %d hits, %d misses",
+                        crawler, self.hits[crawler], self.misses[crawler])
+
+
+detail_cache = DetailCache()
@@ -0,0 +1,196 @@
+"""Typed record for the exposes passed through the processor chain. Crawlers
+emit plain dicts; `Crawler.crawl` wraps them in an `Expose`, which parses the
+numbers in the price, size and rooms texts and normalizes the address once,
+instead of in every filter and notifier. Exposes still behave like dicts, so
+processors keep reading and writing fields by key.
+
+Detail fields can be deferred: `defer` attaches a loader that runs when one of
+the fields is first read, so that exposes dropped before any stage needs their
+details never cost a detail request."""
+import re
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, Optional
+
+_NUMBER = re.compile(r"\d+([\.,]\d+)?")
+_MISSING = object()
+
+
+def parse_price(text: Any) -> Optional[float]:
+    """Extracts the price from a price text (handles German number format)"""
+    if not text:
+        return None
+    # Remove thousands separators (dots) and convert decimal comma to dot
+    # German format: 1.516,50 -> 1516.50
+    price_clean = re.sub(r"[^\d,.]", "", str(text))
+    # If there's both dot and comma, dot is thousands sep, comma is decimal
+    if "." in price_clean and "," in price_clean:
+        price_clean = price_clean.replace(".", "").replace(",", ".")
+    # If only dot and it's followed by 3 digits at end, it's thousands sep
+    elif "." in price_clean:
+        parts = price_clean.split(".")
+        if len(parts) == 2 and len(parts[1]) == 3:
+            price_clean = price_clean.replace(".", "")
+        # Otherwise treat dot as decimal
+    # If only comma, it's decimal separator
+    elif "," in price_clean:
+        price_clean = price_clean.replace(",", ".")
+    try:
+        return float(price_clean)
+    except ValueError:
+        return None
+
+
+def parse_number(text: Any) -> Optional[float]:
+    """Extracts the first number from a size or room text"""
+    if text is None:
+        return None
+    match = _NUMBER.search(str(text))
+    if match is None:
+        return None
+    return float(match[0].replace(",", "."))
+
+
+def normalize_address(text: Any) -> Optional[str]:
+    """Collapses the whitespace in an address"""
+    if text is None:
+        return None
+    normalized = " ".join(str(text).split())
+    # Most addresses are clean already; share the string then
+    return text if normalized == text else normalized
+
+
+class Expose(MutableMapping):
+    """An expose with its common fields in slots and the parsed numbers
+    cached. Fields set by later stages (durations, details, scores) are kept
+    in a dict that is only created when needed. Setting price, size, rooms or
+    address parses them again."""
+
+    FIELDS = ('id', 'url', 'title', 'price', 'size', 'rooms', 'address', 'image', 'crawler')
+
+    __slots__ = FIELDS + ('_extra', '_pending', '_loader', 'price_value', 'size_value',
+                          'rooms_value', 'price_per_sqm', 'normalized_address')
+
+    def __init__(self, fields: Optional[Dict[str, Any]] = None, **kwargs):
+        for name in self.FIELDS:
+            object.__setattr__(self, name, _MISSING)
+        self._extra: Optional[Dict[str, Any]] = None
+        self._pending: Optional[FrozenSet[str]] = None
+        self._loader: Optional[Callable[['Expose'], Any]] = None
+        self.price_value: Optional[float] = None
+        self.size_value: Optional[float] = None
+        self.rooms_value: Optional[float] = None
+        self.price_per_sqm: Optional[float] = None
+        self.normalized_address: Optional[str] = None
+        self.update(fields or {}, **kwargs)
+
+    @classmethod
+    def of(cls, expose) -> 'Expose':
+        """The expose itself if it already is an Expose, otherwise a new one"""
+        return expose if isinstance(expose, cls) else cls(expose)
+
+    def defer(self, fields: Iterable[str], loader: Callable[['Expose'], Any]):
+        """Call loader(expose) when one of the fields is first read. The loader
+        sets the fields on the expose; it runs at most once."""
+        pending = frozenset(fields)
+        if pending:
+            self._pending = pending
+            self._loader = loader
+
+    def deferred(self) -> FrozenSet[str]:
+        """The fields whose loader has not run yet"""
+        return self._pending or frozenset()
+
+    def undefer(self) -> FrozenSet[str]:
+        """Drop the pending loader, for callers that load the fields
+        themselves. Returns the fields that were pending."""
+        pending = self.deferred()
+        self._pending = self._loader = None
+        return pending
+
+    def resolve_all(self):
+        """Run the pending loader, if any"""
+        if self._pending is not None:
+            self.resolve(next(iter(self._pending)))
+
+    def loaded(self) -> Dict[str, Any]:
+        """The fields as a dict, without loading deferred fields"""
+        fields = {name: getattr(self, name) for name in self.FIELDS
+                  if getattr(self, name) is not _MISSING}
+        if self._extra is not None:
+            fields.update(self._extra)
+        return fields
+
+    def resolve(self, key: str):
+        """Run the pending loader if it provides the field"""
+        if self._pending is not None and key in self._pending:
+            loader = self._loader
+            self._pending = self._loader = None
+            loader(self)  # type: ignore[misc]
+
+    def _parse(self, name: str):
+        value = getattr(self, name)
+        value = None if value is _MISSING else value
+        if name == 'price':
+            self.price_value = parse_price(value)
+        elif name == 'size':
+            self.size_value = parse_number(value)
+        elif name == 'rooms':
+            self.rooms_value = parse_number(value)
+        else:
+            self.normalized_address = normalize_address(value)
+        if name in ('price', 'size'):
+            self.price_per_sqm = self.price_value / self.size_value \
+                if self.price_value and self.size_value else None
+
+    def __getitem__(self, key: str) -> Any:
+        if self._pending is not None:
+            self.resolve(key)
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self.FIELDS:
+            object.__setattr__(self, key, value)
+            if key in ('price', 'size', 'rooms', 'address'):
+                self._parse(key)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str):
+        self[key]  # pylint: disable=pointless-statement
+        if key in self.FIELDS:
+            self[key] = _MISSING
+        else:
+            del self._extra[key]  # type: ignore[union-attr]
+
+    def __contains__(self, key: object) -> bool:
+        if self._pending is not None:
+            self.resolve(key)  # type: ignore[arg-type]
+        if key in self.FIELDS:
+            return getattr(self, key) is not _MISSING  # type: ignore[arg-type]
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        for name in self.FIELDS:
+            if getattr(self, name) is not _MISSING:
+                yield name
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"Expose({dict(self)!r})"
+
+    def copy(self) -> 'Expose':
+        """A shallow copy, like dict.copy"""
+        return Expose(self)
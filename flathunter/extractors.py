@@ -0,0 +1,234 @@
+"""Declarative extraction of exposes from result pages. A crawler describes
+the result items of a page and the fields of each item as CSS selectors once,
+in an `Extractor`. The selectors are compiled to XPath and run directly on
+lxml trees; on BeautifulSoup trees the same selectors run through soupsieve,
+so the BS4 backend stays available as a fallback.
+
+Only the CSS subset the crawlers need is supported: type, #id, .class,
+[attr], [attr=value], [attr^=value], [attr*=value] and :not() on simple
+selectors, the descendant and child combinators, and selector groups."""
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from bs4 import Tag
+from lxml import etree
+
+Node = Union[etree._Element, Tag]  # pylint: disable=protected-access
+
+_COMPOUND = re.compile(
+    r'([\w*-]+)|#([\w-]+)|\.([\w-]+)|\[([\w-]+)(?:([\^*]?=)"?([^"\]]*)"?)?\]|:not\(([^)]+)\)')
+
+
+def _literal(value: str) -> str:
+    return f"'{value}'" if "'" not in value else f'"{value}"'
+
+
+def _conditions(compound: str) -> List[str]:
+    conditions = []
+    position = 0
+    while position < len(compound):
+        match = _COMPOUND.match(compound, position)
+        if match is None:
+            raise ValueError(f"Unsupported selector {compound}")
+        tag, element_id, css_class, attr, operator, value, negated = match.groups()
+        if tag and tag != '*':
+            conditions.append(f"self::{tag}")
+        elif element_id:
+            conditions.append(f"@id={_literal(element_id)}")
+        elif css_class:
+            conditions.append(
+                f"contains(concat(' ', normalize-space(@class), ' '), ' {css_class} ')")
+        elif attr and not operator:
+            conditions.append(f"@{attr}")
+        elif operator == '=':
+            conditions.append(f"@{attr}={_literal(value)}")
+        elif operator == '^=':
+            conditions.append(f"starts-with(@{attr}, {_literal(value)})")
+        elif operator == '*=':
+            conditions.append(f"contains(@{attr}, {_literal(value)})")
+        elif negated:
+            conditions.append(f"not({' and '.join(_conditions(negated)) or 'true()'})")
+        position = match.end()
+    return conditions
+
+
+def css_to_xpath(selector: str) -> str:
+    """Translate a CSS selector into an XPath expression that selects the
+    matching descendants of the context node, in document order"""
+    paths = []
+    for part in selector.split(','):
+        tokens = [token for token in re.split(r'\s*(>)\s*|\s+', part.strip()) if token]
+        path = '.'
+        axis = '//'
+        for token in tokens:
+            if token == '>':
+                axis = '/'
+                continue
+            conditions = _conditions(token)
+            predicate = ''.join(f"[{condition}]" for condition in conditions)
+            path += f"{axis}*{predicate}"
+            axis = '//'
+        paths.append(path)
+    return ' | '.join(paths)
+
+
+_local = threading.local()
+
+
+@lru_cache(maxsize=None)
+def _xpath_source(selector: str) -> str:
+    return css_to_xpath(selector)
+
+
+def _compiled(expression: str) -> etree.XPath:
+    """Compiled XPath objects are not shared between threads"""
+    cache = getattr(_local, 'xpaths', None)
+    if cache is None:
+        cache = _local.xpaths = {}
+    if expression not in cache:
+        cache[expression] = etree.XPath(expression)
+    return cache[expression]
+
+
+_TEXT_XPATH = './/text()[not(parent::script or parent::style)]'
+
+
+def is_lxml(node: Any) -> bool:
+    """True if the node belongs to an lxml tree"""
+    return isinstance(node, etree._Element)  # pylint: disable=protected-access
+
+
+def select(node: Node, selector: str) -> List[Node]:
+    """All descendants of the node matching the CSS selector"""
+    if is_lxml(node):
+        return _compiled(_xpath_source(selector))(node)
+    return node.select(selector)
+
+
+def select_one(node: Node, selector: str) -> Optional[Node]:
+    """The first descendant of the node matching the CSS selector"""
+    if is_lxml(node):
+        found = _compiled(_xpath_source(selector))(node)
+        return found[0] if found else None
+    return node.select_one(selector)
+
+
+def text(node: Node, strip_parts: bool = False) -> str:
+    """The text content of the node, like BeautifulSoup's `.text.strip()`.
+    With strip_parts, every text part is stripped before joining, like
+    `get_text(strip=True)`."""
+    if not is_lxml(node):
+        return node.get_text(strip=True) if strip_parts else node.get_text().strip()
+    parts = _compiled(_TEXT_XPATH)(node)
+    if strip_parts:
+        return ''.join(part.strip() for part in parts)
+    return ''.join(parts).strip()
+
+
+def attr(node: Node, name: str) -> Optional[str]:
+    """The value of an attribute of the node"""
+    value = node.get(name)
+    if isinstance(value, list):
+        return ' '.join(value)
+    return value
+
+
+class Field:
+    """How to read one value from a result item"""
+
+    def __init__(self, selector: Optional[str] = None):
+        self.selector = selector
+
+    def target(self, item: Node) -> Optional[Node]:
+        """The element the value is read from; the item itself without selector"""
+        return item if self.selector is None else select_one(item, self.selector)
+
+    def read(self, item: Node) -> Any:
+        """The value of the field in the item"""
+        raise NotImplementedError
+
+
+class Text(Field):
+    """Text of the first matching element, None if there is none"""
+
+    def __init__(self, selector: Optional[str] = None, strip_parts: bool = False):
+        super().__init__(selector)
+        self.strip_parts = strip_parts
+
+    def read(self, item):
+        element = self.target(item)
+        return None if element is None else text(element, self.strip_parts)
+
+
+class Attr(Field):
+    """Attribute of the first matching element, None if there is none. With
+    several names, the first non-empty one of those attributes."""
+
+    def __init__(self, selector: Optional[str], *names: str):
+        super().__init__(selector)
+        self.names = names
+
+    def read(self, item):
+        element = self.target(item)
+        if element is None:
+            return None
+        value = None
+        for name in self.names:
+            value = attr(element, name)
+            if value:
+                break
+        return value
+
+
+class Texts(Field):
+    """Texts of all matching elements"""
+
+    def __init__(self, selector: str, strip_parts: bool = True):
+        super().__init__(selector)
+        self.strip_parts = strip_parts
+
+    def read(self, item):
+        return [text(element, self.strip_parts) for element in select(item, self.selector)]
+
+
+class Labelled(Field):
+    """(label, value) pairs of all matching label elements, where the value
+    is the text directly following the label element"""
+
+    def read(self, item):
+        pairs = []
+        for label in select(item, self.selector):
+            if is_lxml(label):
+                value = label.tail
+            else:
+                value = label.next_sibling
+                value = None if value is None else str(value)
+            if value is not None:
+                pairs.append((text(label, strip_parts=True), value.strip()))
+        return pairs
+
+
+class Exists(Field):
+    """True if any element matches"""
+
+    def read(self, item):
+        return self.target(item) is not None
+
+
+class Extractor:
+    """The result items of a page and the fields to read from each of them"""
+
+    def __init__(self, items: str, **fields: Field):
+        self.items = items
+        self.fields = fields
+        # Translate all selectors up front, so that unsupported ones fail early
+        for selector in [items] + [field.selector for field in fields.values()]:
+            if selector is not None:
+                _xpath_source(selector)
+
+    def extract(self, page: Node) -> Iterator[Dict[str, Any]]:
+        """The field values of every item on the page"""
+        for item in select(page, self.items):
+            yield {name: field.read(item) for name, field in self.fields.items()}
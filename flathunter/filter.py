@@ -2,6 +2,7 @@
 import re
 from abc import ABC, ABCMeta
 from typing import List, Any
+from flathunter.expose import Expose, parse_number, parse_price
 from flathunter.logging import logger
 
 
@@ -14,49 +15,40 @@ class AbstractFilter(ABC):
 
 
 class ExposeHelper:
-    """Helper functions for extracting data from expose text"""
+    """Helper functions for reading the numbers of an expose. Values of an
+    Expose were parsed when it was created; plain dicts are parsed here."""
 
     @staticmethod
     def get_price(expose):
-        """Extracts the price from a price text (handles German number format)"""
-        price_text = expose.get("price", "")
-        if not price_text:
-            return None
-        # Remove thousands separators (dots) and convert decimal comma to dot
-        # German format: 1.516,50 -> 1516.50
-        price_clean = re.sub(r"[^\d,.]", "", price_text)
-        # If there's both dot and comma, dot is thousands sep, comma is decimal
-        if "." in price_clean and "," in price_clean:
-            price_clean = price_clean.replace(".", "").replace(",", ".")
-        # If only dot and it's followed by 3 digits at end, it's thousands sep
-        elif "." in price_clean:
-            parts = price_clean.split(".")
-            if len(parts) == 2 and len(parts[1]) == 3:
-                price_clean = price_clean.replace(".", "")
-            # Otherwise treat dot as decimal
-        # If only comma, it's decimal separator
-        elif "," in price_clean:
-            price_clean = price_clean.replace(",", ".")
-        try:
-            return float(price_clean)
-        except ValueError:
-            return None
+        """The price as a number"""
+        if isinstance(expose, Expose):
+            expose.resolve("price")
+            return expose.price_value
+        return parse_price(expose.get("price", ""))
 
     @staticmethod
     def get_size(expose):
-        """Extracts the size from a size text"""
-        size_match = re.search(r"\d+([\.,]\d+)?", expose["size"])
-        if size_match is None:
-            return None
-        return float(size_match[0].replace(",", "."))
+        """The size as a number"""
+        if isinstance(expose, Expose):
+            return expose.size_value
+        return parse_number(expose.get("size"))
 
     @staticmethod
     def get_rooms(expose):
-        """Extracts the number of rooms from a room text"""
-        rooms_match = re.search(r"\d+([\.,]\d+)?", expose["rooms"])
-        if rooms_match is None:
-            return None
-        return float(rooms_match[0].replace(",", "."))
+        """The number of rooms"""
+        if isinstance(expose, Expose):
+            return expose.rooms_value
+        return parse_number(expose.get("rooms"))
+
+    @staticmethod
+    def get_price_per_sqm(expose):
+        """The price per square meter, if both price and size are known"""
+        if isinstance(expose, Expose):
+            expose.resolve("price")
+            return expose.price_per_sqm
+        price = ExposeHelper.get_price(expose)
+        size = ExposeHelper.get_size(expose)
+        return price / size if price and size else None
 
 
 class AlreadySeenFilter(AbstractFilter):
@@ -228,18 +220,16 @@ class Filter:
         return is_interesting, explanations
 
     def filter(self, exposes):
-        """Apply all filters to every expose in the list"""
-        filtered_exposes = []
+        """Apply all filters to every expose in the sequence, yielding the
+        interesting ones as they arrive"""
         for expose in exposes:
             is_interesting, explanations = self.is_interesting_expose(expose)
             if is_interesting:
-                filtered_exposes.append(expose)
+                yield expose
             else:
                 reasons = "\n - ".join(explanations)
                 logger.info("Excluding expose: %s\nReasons:\n - %s", expose["title"], reasons)
 
-        return filtered_exposes
-
     @staticmethod
     def builder():
         """Return a new filter builder"""
@@ -4,10 +4,10 @@ import datetime
 import time
 from datetime import timezone
 from urllib.parse import quote_plus
-import requests
 
+from flathunter.http_client import http_client
 from flathunter.logging import logger
-from flathunter.abstract_processor import Processor
+from flathunter.abstract_processor import COST_API, Processor
 
 AVG_CYCLING_SPEED_MS = 16 * 1000 / 3600  # 16 km/h in m/s
 
@@ -15,6 +15,10 @@ AVG_CYCLING_SPEED_MS = 16 * 1000 / 3600  # 16 km/h in m/s
 class GMapsDurationProcessor(Processor):
     """Implementation of Processor class to calculate travel durations"""
 
+    COST = COST_API
+    REQUIRES = frozenset({'address'})
+    PROVIDES = frozenset({'durations', 'durations_passed'})
+
     GM_MODE_TRANSIT = 'transit'
     GM_MODE_BICYCLE = 'bicycling'
     GM_MODE_DRIVING = 'driving'
@@ -121,7 +125,7 @@ class GMapsDurationProcessor(Processor):
 
         url = base_url.format(dest=dest_enc, mode=mode, origin=address_enc,
                               key=gm_key, arrival=arrival_time)
-        result = requests.get(url, timeout=30).json()
+        result = http_client.get(url, timeout=30).json()
 
         if result['status'] in ('OVER_QUERY_LIMIT', 'REQUEST_DENIED'):
             self._google_quota_exhausted = True
@@ -144,7 +148,7 @@ class GMapsDurationProcessor(Processor):
 
     def _geocode(self, address):
         """Geocode address to (lat, lng) via BVG transport.rest."""
-        resp = requests.get("https://v6.bvg.transport.rest/locations", params={
+        resp = http_client.get("https://v6.bvg.transport.rest/locations", params={
             "query": address, "addresses": True, "results": 1,
         }, timeout=10)
         resp.raise_for_status()
@@ -170,7 +174,7 @@ class GMapsDurationProcessor(Processor):
         try:
             url = (f"https://router.project-osrm.org/route/v1/driving/"
                    f"{origin[1]},{origin[0]};{dest[1]},{dest[0]}?overview=false")
-            resp = requests.get(url, timeout=10)
+            resp = http_client.get(url, timeout=10)
             resp.raise_for_status()
             data = resp.json()
             if data["code"] != "Ok" or not data["routes"]:
@@ -191,7 +195,7 @@ class GMapsDurationProcessor(Processor):
     def _bvg_transit(self, origin, dest, origin_address, dest_address):
         """Get transit duration from BVG transport.rest (free, no key)."""
         try:
-            resp = requests.get("https://v6.bvg.transport.rest/journeys", params={
+            resp = http_client.get("https://v6.bvg.transport.rest/journeys", params={
                 "from.latitude": origin[0], "from.longitude": origin[1],
                 "from.address": origin_address,
                 "to.latitude": dest[0], "to.longitude": dest[1],
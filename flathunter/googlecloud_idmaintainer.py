@@ -1,5 +1,13 @@
 """Storage back-end implementation using Google Cloud Firestore"""
 import datetime
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from itertools import batched
+from typing import Dict, Iterable, Optional, Tuple
 
 import firebase_admin
 from firebase_admin import credentials
@@ -7,10 +15,138 @@ from firebase_admin import firestore
 
 from flathunter.logging import logger
 from flathunter.exceptions import PersistenceException
+from flathunter.idmaintainer import ExposeRecord, IdMaintainer, StoredExpose, compress_fields
+from flathunter.seen_snapshot import LEGACY_MONTH, MonthlySeenSnapshot, SeenSnapshot
 
+# Maximum number of writes in one Firestore batch
+MAX_BATCH_WRITES = 500
+_STOP = object()
 
-class GoogleCloudIdMaintainer:
-    """Storage back-end - implementation of IdMaintainer API"""
+
+def _month() -> str:
+    """The current month, which documents are partitioned by"""
+    return datetime.datetime.now(tz=datetime.timezone.utc).strftime('%Y-%m')
+
+
+class FirestoreWriteQueue:
+    """Write-behind queue for Firestore documents. Writes are queued and
+    committed by a background thread in WriteBatches of up to `batch_size`
+    documents, at the latest `flush_interval` seconds after the first write
+    of a batch. Repeated writes of a document within a batch are merged.
+    Writes with `merge` only set the given fields of the document."""
+
+    # Attempts to commit a batch before its writes are dropped
+    ATTEMPTS = 3
+
+    def __init__(self, database, batch_size: int = MAX_BATCH_WRITES,
+                 flush_interval: float = 1.0):
+        self.database = database
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_WRITES))
+        self.flush_interval = flush_interval
+        self.writes = 0
+        self.commits = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='firestore-writes', daemon=True)
+        self._thread.start()
+
+    def set(self, collection: str, doc_id: str, record: Dict, merge: bool = False):
+        """Queue a write of the document"""
+        if self._closed:
+            self._commit({(collection, doc_id): (record, merge)})
+        else:
+            self._queue.put((collection, doc_id, record, merge))
+
+    def flush(self):
+        """Block until all writes queued so far are committed"""
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        """Commit the queued writes and stop the background thread"""
+        if self._closed:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._closed = True
+        logger.info("Committed %d Firestore writes in %d batches", self.writes, self.commits)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            writes: Dict[Tuple[str, str], Tuple[Dict, bool]] = {}
+            waiters = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                collection, doc_id, record, merge = item
+                if merge and (collection, doc_id) in writes:
+                    queued, merge = writes[(collection, doc_id)]
+                    record = dict(queued, **record)
+                writes[(collection, doc_id)] = (record, merge)
+                if len(writes) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if writes:
+                self._commit(writes)
+            for waiter in waiters:
+                waiter.set()
+
+    def _commit(self, writes: Dict[Tuple[str, str], Tuple[Dict, bool]]):
+        for attempt in range(1, self.ATTEMPTS + 1):
+            batch = self.database.batch()
+            for (collection, doc_id), (record, merge) in writes.items():
+                batch.set(self.database.collection(collection).document(doc_id), record,
+                          merge=merge)
+            try:
+                batch.commit()
+            except Exception as exc:  # pylint: disable=broad-except
+                if attempt == self.ATTEMPTS:
+                    logger.error("Dropping %d Firestore writes: %s", len(writes), exc)
+                    return
+                logger.warning("Firestore batch commit failed (%s), retrying", exc)
+                time.sleep(attempt)
+                continue
+            self.writes += len(writes)
+            self.commits += 1
+            return
+
+
+class GoogleCloudIdMaintainer(IdMaintainer):
+    """Storage back-end - implementation of IdMaintainer API. The processed
+    and contacted state is cached for the run: lookups can be prefetched in
+    batches, and IDs marked in this run are answered without a read.
+
+    Processed IDs are also kept in a MonthlySeenSnapshot, loaded on the first
+    lookup from the 'seen_ids' collection (or a local file) and saved on
+    close. Only IDs that are not in the snapshot are looked up in the
+    'processed' collection. Each month of the snapshot is saved in documents
+    of at most PART_BYTES of hashes, so none of them outgrows the document
+    size limit as IDs pile up.
+
+    apply_retention compacts old 'processed' documents into per-month ID sets
+    in 'processed_archive', and deletes old exposes and contacted marks. The
+    archive parts are merged into the snapshot, and only the parts that
+    changed since are read again."""
+
+    # Bytes of ID hashes per archive or snapshot document, below the 1 MiB
+    # document limit
+    PART_BYTES = 8 * 100_000
+
+    # Maximum number of documents read in one get_all call
+    BATCH_SIZE = 100
 
     def __init__(self, config):
         project_id = config.google_cloud_project_id()
@@ -21,39 +157,350 @@ class GoogleCloudIdMaintainer:
             'projectId': project_id
         })
         self.database = firestore.client()
+        # Processed / contacted state known in this run, by document ID
+        self._processed: Dict[str, bool] = {}
+        self._contacted: Dict[str, bool] = {}
+        # Fingerprints of the saved exposes, or None if an expose has not
+        # been saved
+        self._fingerprints: Dict[str, Optional[StoredExpose]] = {}
+        self._lock = threading.Lock()
+        # IDs known to be processed: the saved snapshot (if enabled), the
+        # archive and the IDs found in this run
+        self.seen = MonthlySeenSnapshot()
+        self.seen_persisted = config.firestore_seen_snapshot()
+        self.seen_file: Optional[str] = config.firestore_seen_snapshot_file()
+        # Update times of the archive parts merged into the snapshot, by part
+        self._archive_parts: Dict[str, str] = {}
+        self._archive_parts_changed = False
+        # Snapshot shards saved before the snapshot was split by month,
+        # deleted once their IDs are saved by month
+        self._legacy_seen: list = []
+        self._seen_loaded = False
+        self._seen_lock = threading.Lock()
+        self.write_queue: Optional[FirestoreWriteQueue] = None
+        if config.firestore_write_behind():
+            self.write_queue = FirestoreWriteQueue(
+                self.database, config.firestore_batch_size(), config.firestore_flush_interval())
+
+    def _write(self, collection: str, doc_id: str, record: Dict, merge: bool = False):
+        """Writes the document, through the write-behind queue if there is one"""
+        if self.write_queue is not None:
+            self.write_queue.set(collection, doc_id, record, merge)
+        else:
+            self.database.collection(collection).document(doc_id).set(record, merge=merge)
+
+    def flush(self):
+        """Block until all queued writes are committed"""
+        if self.write_queue is not None:
+            self.write_queue.flush()
+
+    def begin_run(self):
+        """Drop the processed and contacted state and the saved fingerprints
+        read in the previous hunt. The queued writes are committed first, so
+        no mark of this process is lost from view."""
+        self.flush()
+        with self._lock:
+            self._processed.clear()
+            self._contacted.clear()
+            self._fingerprints.clear()
+
+    def close(self):
+        """Commit the queued writes and save the seen-ID snapshot. Called on shutdown."""
+        if self.write_queue is not None:
+            self.write_queue.close()
+        if self._seen_loaded and self.seen_persisted:
+            self._save_seen()
+
+    def _seen_snapshot(self) -> MonthlySeenSnapshot:
+        """The seen-ID snapshot, loaded with the archive on first use, so
+        that runs that don't look up IDs (e.g. --compact) don't read it"""
+        if not self._seen_loaded:
+            with self._seen_lock:
+                if not self._seen_loaded:
+                    if self.seen_persisted:
+                        self._load_seen()
+                    self._load_archive()
+                    self._seen_loaded = True
+        return self.seen
+
+    def _load_archive(self):
+        """Merges the archive parts that changed since the snapshot was
+        saved into it. Only the update times of the parts are listed; the
+        ID hashes are only read for new or rewritten parts."""
+        archive = self.database.collection('processed_archive')
+        parts = {snapshot.id: snapshot.update_time.isoformat()
+                 for snapshot in archive.select(['count']).stream()}
+        changed = [part for part, updated in parts.items()
+                   if self._archive_parts.get(part) != updated]
+        for chunk in batched(changed, self.BATCH_SIZE):
+            for snapshot in self.database.get_all([archive.document(part) for part in chunk]):
+                if snapshot.exists:
+                    self.seen.load(snapshot.get('month'), snapshot.get('hashes'),
+                                   dirty=self.seen_persisted)
+        if changed:
+            logger.debug("Merged %d archive parts into the seen-ID snapshot", len(changed))
+            self._archive_parts = parts
+            self._archive_parts_changed = True
+
+    def apply_retention(self, retention: Dict[str, Optional[float]]):
+        """Folds 'processed' documents older than retention['processed'] days
+        into the monthly ID sets of 'processed_archive', and deletes exposes
+        and contacted marks older than their retention"""
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        if retention.get('processed'):
+            self._compact_processed(now - datetime.timedelta(days=retention['processed']))
+        for collection, field in (('exposes', 'created_at'), ('contacted', 'contacted_at')):
+            if retention.get(collection):
+                cutoff = now - datetime.timedelta(days=retention[collection])
+                query = self.database.collection(collection).where(
+                    filter=firestore.FieldFilter(field, '<', cutoff))
+                refs = [snapshot.reference for snapshot in query.select([field]).stream()]
+                logger.info("Retention: deleting %d old %s documents", len(refs), collection)
+                if collection == 'exposes':
+                    refs += [ref.collection('details').document('heavy') for ref in refs]
+                self._delete(refs)
+
+    def _compact_processed(self, cutoff: datetime.datetime):
+        # Documents are partitioned by the month they were marked in, so only
+        # the months up to the cutoff are read. Within the month of the
+        # cutoff, their create_time tells which ones are old enough.
+        months: Dict[str, SeenSnapshot] = {}
+        refs = []
+        processed = self.database.collection('processed')
+        cutoff_month = cutoff.strftime('%Y-%m')
+        query = processed.where(filter=firestore.FieldFilter('month', '<=', cutoff_month))
+        for snapshot in query.select(['month']).stream():
+            month = snapshot.get('month')
+            if month < cutoff_month or snapshot.create_time < cutoff:
+                months.setdefault(month, SeenSnapshot()).add(snapshot.id)
+                refs.append(snapshot.reference)
+        self._compact_legacy_processed(cutoff, months, refs)
+        archive = self.database.collection('processed_archive')
+        for month, ids in sorted(months.items()):
+            for snapshot in archive.where(filter=firestore.FieldFilter('month', '==', month)).stream():
+                ids.load(snapshot.get('hashes'))
+            data = ids.to_bytes()
+            for part, start in enumerate(range(0, len(data), self.PART_BYTES)):
+                hashes = data[start:start + self.PART_BYTES]
+                archive.document(f"{month}.{part}").set({
+                    'month': month, 'hashes': hashes, 'count': len(hashes) // 8})
+        # The IDs are archived, now the documents can go
+        self._delete(refs)
+        logger.info("Retention: archived %d processed IDs of %d months", len(refs), len(months))
+
+    def _compact_legacy_processed(self, cutoff: datetime.datetime,
+                                  months: Dict[str, SeenSnapshot], refs: list):
+        """Adds the documents older than the cutoff that were written without
+        a month field. They can't be queried for, so the whole collection is
+        scanned, until a scan finds none of them left."""
+        done = self.database.collection('retention').document('processed')
+        if done.get().exists:
+            return
+        remaining = 0
+        for snapshot in self.database.collection('processed').select(['month']).stream():
+            if 'month' in (snapshot.to_dict() or {}):
+                continue
+            if snapshot.create_time < cutoff:
+                month = snapshot.create_time.strftime('%Y-%m')
+                months.setdefault(month, SeenSnapshot()).add(snapshot.id)
+                refs.append(snapshot.reference)
+            else:
+                remaining += 1
+        if not remaining:
+            done.set({'legacy_compacted': True})
+
+    def _delete(self, refs):
+        for chunk in batched(refs, MAX_BATCH_WRITES):
+            batch = self.database.batch()
+            for ref in chunk:
+                batch.delete(ref)
+            batch.commit()
+
+    def _archive_parts_ref(self):
+        return self.database.collection('seen_ids').document('archive-parts')
+
+    def _load_seen(self):
+        seen = self.seen
+        if self.seen_file is not None:
+            seen.load_file(self.seen_file)
+            if os.path.exists(f"{self.seen_file}.parts"):
+                with open(f"{self.seen_file}.parts", encoding='utf-8') as parts_file:
+                    self._archive_parts = json.load(parts_file)
+        else:
+            for snapshot in self.database.collection('seen_ids').stream():
+                data = snapshot.to_dict() or {}
+                if snapshot.id == self._archive_parts_ref().id:
+                    self._archive_parts = data.get('parts') or {}
+                elif 'month' in data:
+                    seen.load(data['month'], data['hashes'])
+                elif 'hashes' in data:
+                    # A shard of the snapshot before it was split by month
+                    seen.load(LEGACY_MONTH, data['hashes'], dirty=True)
+                    self._legacy_seen.append(snapshot.reference)
+        logger.debug("Loaded %d seen expose IDs", len(seen))
+
+    def _save_seen(self):
+        """Saves the months with new IDs, merged with the IDs other runs
+        saved, and then which archive parts they include"""
+        seen = self.seen
+        months = seen.dirty_months()
+        if not months and not self._archive_parts_changed:
+            return
+        try:
+            if self.seen_file is not None:
+                seen.save_file(self.seen_file)
+                if self._archive_parts_changed:
+                    with open(f"{self.seen_file}.parts", 'w', encoding='utf-8') as parts_file:
+                        json.dump(self._archive_parts, parts_file)
+            else:
+                seen_ids = self.database.collection('seen_ids')
+                for month in months:
+                    query = seen_ids.where(filter=firestore.FieldFilter('month', '==', month))
+                    for snapshot in query.stream():
+                        seen.load(month, snapshot.get('hashes'))
+                    updated_at = datetime.datetime.now(tz=datetime.timezone.utc)
+                    for part, hashes in enumerate(seen.parts(month, self.PART_BYTES)):
+                        seen_ids.document(f"{month}.{part}").set({
+                            'month': month, 'hashes': hashes, 'updated_at': updated_at})
+                if self._archive_parts_changed:
+                    self._archive_parts_ref().set({'parts': self._archive_parts})
+                self._delete(self._legacy_seen)
+                self._legacy_seen = []
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Could not save the seen-ID snapshot: %s", exc)
+            return
+        self._archive_parts_changed = False
+        logger.debug("Saved %d seen expose IDs", len(seen))
+
+    def _prefetch(self, collection: str, doc_ids: Iterable[str], known: Dict[str, bool]):
+        """Reads the documents that are not known yet with batched get_all calls"""
+        with self._lock:
+            missing = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id not in known]
+        for chunk in batched(missing, self.BATCH_SIZE):
+            refs = [self.database.collection(collection).document(doc_id) for doc_id in chunk]
+            found = {snapshot.id for snapshot in self.database.get_all(refs) if snapshot.exists}
+            with self._lock:
+                for doc_id in chunk:
+                    # Don't overwrite a mark made while the batch was read
+                    known.setdefault(doc_id, doc_id in found)
+
+    def _lookup(self, collection: str, doc_id: str, known: Dict[str, bool]) -> bool:
+        """Whether the document exists, read only if it is not known yet"""
+        with self._lock:
+            if doc_id in known:
+                return known[doc_id]
+        exists = self.database.collection(collection).document(doc_id).get().exists
+        with self._lock:
+            return known.setdefault(doc_id, exists)
 
     def mark_processed(self, expose_id):
         """Mark exposes as processed when we have processed them"""
         logger.debug('mark_processed(%d)', expose_id)
-        self.database.collection('processed').document(
-            str(expose_id)).set({'id': expose_id})
+        self._write('processed', str(expose_id), {'id': expose_id, 'month': _month()})
+        with self._lock:
+            self._processed[str(expose_id)] = True
+        self.seen.add(str(expose_id), _month())
 
     def is_processed(self, expose_id):
         """Returns true if an expose has already been marked as processed"""
         logger.debug('is_processed(%d)', expose_id)
-        doc = self.database.collection('processed').document(str(expose_id))
-        return doc.get().exists
+        doc_id = str(expose_id)
+        seen = self._seen_snapshot()
+        if doc_id in seen:
+            return True
+        processed = self._lookup('processed', doc_id, self._processed)
+        if processed:
+            seen.add(doc_id, _month())
+        return processed
 
-    def save_expose(self, expose):
-        """Writes an expose to the storage backend"""
-        now = datetime.datetime.now(tz=datetime.timezone.utc)
-        record = expose.copy()
-        record.update({'created_at': now,
-                       'created_sort': (0 - now.timestamp())})
-        self.database.collection('exposes').document(
-            str(expose['id'])).set(record)
+    def prefetch_processed(self, expose_ids: Iterable):
+        """Loads the processed state of the exposes in batches, so that
+        is_processed needs no read for them"""
+        seen = self._seen_snapshot()
+        doc_ids = [str(expose_id) for expose_id in expose_ids]
+        doc_ids = [doc_id for doc_id in doc_ids if doc_id not in seen]
+        self._prefetch('processed', doc_ids, self._processed)
+
+    def prefetch_saved(self, expose_ids: Iterable):
+        """Loads the fingerprints of saved exposes in batches. Only the
+        fingerprint fields of the documents are read."""
+        with self._lock:
+            missing = [doc_id for doc_id in dict.fromkeys(str(expose_id) for expose_id in expose_ids)
+                       if doc_id not in self._fingerprints]
+        for chunk in batched(missing, self.BATCH_SIZE):
+            refs = [self.database.collection('exposes').document(doc_id) for doc_id in chunk]
+            for snapshot in self.database.get_all(
+                    refs, field_paths=['fingerprint', 'heavy_fingerprint', 'enriched_fields']):
+                stored = None
+                if snapshot.exists:
+                    data = snapshot.to_dict()
+                    stored = StoredExpose(data.get('fingerprint'), data.get('heavy_fingerprint'),
+                                          frozenset(data.get('enriched_fields') or ()))
+                with self._lock:
+                    self._fingerprints.setdefault(snapshot.id, stored)
+
+    def save_expose(self, expose, enriched: bool = False):
+        """Writes an expose to the storage backend, unless it is unchanged.
+        Only the changed fields are merged into the document; the creation
+        time is set by the first save. The heavy detail fields are written
+        compressed to a 'details' subdocument, and only when they changed."""
+        record = ExposeRecord.of(expose)
+        doc_id = str(expose['id'])
+        self.prefetch_saved([doc_id])
+        with self._lock:
+            update = record.update(self._fingerprints[doc_id], enriched)
+            if update is not None:
+                self._fingerprints[doc_id] = update.stored
+        if update is None:
+            return
+        fields = dict(update.fields)
+        fields.update({'fingerprint': update.stored.fingerprint,
+                       'heavy_fingerprint': update.stored.heavy_fingerprint,
+                       'enriched_fields': sorted(update.stored.enriched_fields)})
+        if update.created:
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+            fields.update({'created_at': now,
+                           'created_sort': (0 - now.timestamp()),
+                           'month': now.strftime('%Y-%m')})
+        self._write('exposes', doc_id, fields, merge=not update.created)
+        if update.heavy_changed:
+            self._write(f'exposes/{doc_id}/details', 'heavy',
+                        {'data': compress_fields(record.heavy)})
+
+    @staticmethod
+    def _page_state_doc_id(key):
+        """Page keys are URLs, which are not valid document IDs"""
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def get_page_state(self, key):
+        """Returns the stored validators (etag, last_modified, hash) of a search page"""
+        doc = self.database.collection('page_state').document(
+            self._page_state_doc_id(key)).get()
+        return doc.to_dict() if doc.exists else None
+
+    def save_page_state(self, key, state):
+        """Stores the validators of a search page for the next run's conditional request"""
+        record = dict(state)
+        record.update({'key': key,
+                       'updated_at': datetime.datetime.now(tz=datetime.timezone.utc)})
+        self._write('page_state', self._page_state_doc_id(key), record)
 
     def is_contacted(self, expose_id, crawler):
         """Returns true if a landlord has already been contacted for this expose"""
-        doc = self.database.collection('contacted').document(
-            f"{expose_id}_{crawler}").get()
-        return doc.exists
+        return self._lookup('contacted', f"{expose_id}_{crawler}", self._contacted)
+
+    def prefetch_contacted(self, keys: Iterable[Tuple]):
+        """Loads the contacted state of (expose_id, crawler) pairs in batches"""
+        self._prefetch('contacted', (f"{expose_id}_{crawler}" for expose_id, crawler in keys),
+                       self._contacted)
 
     def mark_contacted(self, expose_id, crawler):
         """Mark an expose as contacted in the database"""
-        self.database.collection('contacted').document(
-            f"{expose_id}_{crawler}").set({
-                'id': expose_id,
-                'crawler': crawler,
-                'contacted_at': datetime.datetime.now(tz=datetime.timezone.utc),
-            })
+        self._write('contacted', f"{expose_id}_{crawler}", {
+            'id': expose_id,
+            'crawler': crawler,
+            'contacted_at': datetime.datetime.now(tz=datetime.timezone.utc),
+            'month': _month(),
+        })
+        with self._lock:
+            self._contacted[f"{expose_id}_{crawler}"] = True
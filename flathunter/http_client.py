@@ -0,0 +1,206 @@
+"""Shared HTTP client. Crawlers, processors and notifiers send their requests
+through the module-level `http_client`, so connections are pooled per host and
+kept alive for the whole run instead of being re-established for every call.
+Each request is also paced by the per-host limiter from `flathunter.rate_limit`."""
+import asyncio
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from flathunter.logging import logger
+from flathunter.rate_limit import parse_retry_after, rate_limiter, retries_method
+
+DEFAULT_TIMEOUT = 30
+
+
+class HttpClient:
+    """Thread-safe pooled HTTP client with per-host default headers and timeouts"""
+
+    def __init__(self, pool_connections: int = 32, pool_maxsize: int = 16):
+        self._lock = threading.Lock()
+        self._host_headers: Dict[str, Dict[str, str]] = {}
+        self._host_timeouts: Dict[str, float] = {}
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._async_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+        self._adapter = self._create_adapter(pool_connections, pool_maxsize)
+        self._session = self.create_session()
+        # The shared session stays stateless like module-level requests calls;
+        # callers that need cookies should use their own `create_session()`
+        self._session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        # Cassette to record responses to, or to replay them from (see flathunter.cassette)
+        self.cassette = None
+
+    @staticmethod
+    def _create_adapter(pool_connections: int, pool_maxsize: int) -> HTTPAdapter:
+        return HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+
+    def configure(self, config):
+        """Apply pool sizes and per-host defaults from the config"""
+        with self._lock:
+            self._pool_connections = config.http_pool_connections()
+            self._pool_maxsize = config.http_pool_maxsize()
+            self._adapter = self._create_adapter(self._pool_connections, self._pool_maxsize)
+            self._mount(self._session)
+        rate_limiter.configure(config)
+        for host, settings in config.http_host_settings().items():
+            settings = settings or {}
+            self.configure_host(host, headers=settings.get('headers'),
+                                timeout=settings.get('timeout'))
+
+    def configure_host(self, host: str, headers: Optional[Dict[str, str]] = None,
+                       timeout: Optional[float] = None):
+        """Set default headers and timeout for all requests to the given host"""
+        with self._lock:
+            if headers:
+                self._host_headers[host] = dict(headers)
+            if timeout is not None:
+                self._host_timeouts[host] = float(timeout)
+
+    def _mount(self, session: requests.Session):
+        session.mount('https://', self._adapter)
+        session.mount('http://', self._adapter)
+
+    def create_session(self, headers: Optional[Dict[str, str]] = None) -> requests.Session:
+        """Create a session with its own cookie jar that shares the pooled connections"""
+        session = requests.Session()
+        self._mount(session)
+        if headers:
+            session.headers.update(headers)
+        return session
+
+    def _apply_host_defaults(self, url: str, kwargs: dict) -> dict:
+        """Merge the host's default headers and timeout into the request kwargs"""
+        host = urlparse(url).netloc
+        headers = dict(self._host_headers.get(host, {}))
+        headers.update(kwargs.pop('headers', None) or {})
+        kwargs['headers'] = headers
+        kwargs.setdefault('timeout', self._host_timeouts.get(host, DEFAULT_TIMEOUT))
+        return kwargs
+
+    def request(self, method: str, url: str, session: Optional[requests.Session] = None,
+                retry: Optional[bool] = None, **kwargs) -> requests.Response:
+        """Send a request, applying the defaults configured for the target host.
+        Pass `session` to send it with that session's cookies and headers.
+        Only GET, HEAD and OPTIONS requests are retried on 429 and 503, unless
+        `retry` says otherwise, e.g. for a POST that only runs a search."""
+        kwargs = self._apply_host_defaults(url, kwargs)
+        retry = retries_method(method, retry)
+        if self.cassette is not None and self.cassette.replaying:
+            return self.cassette.replay(method, url, kwargs)
+        limiter = rate_limiter.for_url(url)
+        attempt = 0
+        while True:
+            limiter.acquire()
+            status = retry_after = None
+            try:
+                response = (session or self._session).request(method, url, **kwargs)
+                status = response.status_code
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            finally:
+                pause = limiter.release(status, retry_after)
+            if not (retry and limiter.should_retry(status, pause, attempt)):
+                break
+            attempt += 1
+            logger.debug("Retrying %s %s after %d (attempt %d)", method, url, status, attempt)
+            response.close()
+        if self.cassette is not None and self.cassette.recording:
+            self.cassette.record_response(method, url, kwargs, response.status_code,
+                                          response.headers, response.content)
+        return response
+
+    def _async_client(self) -> httpx.AsyncClient:
+        """The async client for the running event loop, sharing the pool limits"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_clients:
+                self._async_clients[loop] = httpx.AsyncClient(
+                    follow_redirects=True,
+                    limits=httpx.Limits(max_connections=self._pool_connections * self._pool_maxsize,
+                                        max_keepalive_connections=self._pool_maxsize),
+                )
+            return self._async_clients[loop]
+
+    async def arequest(self, method: str, url: str, retry: Optional[bool] = None,
+                       **kwargs) -> httpx.Response:
+        """Send a request from a coroutine without blocking the event loop.
+        Keyword arguments are those of `httpx.AsyncClient.request`; `retry`
+        is that of `request`."""
+        kwargs = self._apply_host_defaults(url, kwargs)
+        retry = retries_method(method, retry)
+        if self.cassette is not None and self.cassette.replaying:
+            return self.cassette.areplay(method, url, kwargs)
+        limiter = rate_limiter.for_url(url)
+        attempt = 0
+        while True:
+            await limiter.aacquire()
+            status = retry_after = None
+            try:
+                response = await self._async_client().request(method, url, **kwargs)
+                status = response.status_code
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            finally:
+                pause = limiter.release(status, retry_after)
+            if not (retry and limiter.should_retry(status, pause, attempt)):
+                break
+            attempt += 1
+            logger.debug("Retrying %s %s after %d (attempt %d)", method, url, status, attempt)
+            await response.aclose()
+        if self.cassette is not None and self.cassette.recording:
+            self.cassette.record_response(method, url, kwargs, response.status_code,
+                                          response.headers, response.content)
+        return response
+
+    async def aget(self, url: str, **kwargs) -> httpx.Response:
+        """Send a GET request from a coroutine"""
+        return await self.arequest('GET', url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> httpx.Response:
+        """Send a POST request from a coroutine"""
+        return await self.arequest('POST', url, **kwargs)
+
+    async def aclose(self):
+        """Close the async client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Send a GET request"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Send a POST request"""
+        return self.request('POST', url, **kwargs)
+
+    def warmup(self, urls: Iterable[str], timeout: float = 5):
+        """Open a pooled connection to each host up front, so that the TCP and TLS
+        handshakes are done before the first real request needs them"""
+        if self.cassette is not None and self.cassette.replaying:
+            return
+        origins = {f"{parsed.scheme}://{parsed.netloc}/"
+                   for parsed in map(urlparse, urls) if parsed.netloc}
+
+        def connect(origin):
+            try:
+                self._session.head(origin, timeout=timeout, allow_redirects=False)
+            except requests.exceptions.RequestException as exc:
+                logger.debug("Connection warmup for %s failed: %s", origin, exc)
+
+        threads = [threading.Thread(target=connect, args=(origin,), daemon=True)
+                   for origin in origins]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout)
+        logger.debug("Warmed up connections to %d hosts", len(origins))
+
+
+http_client = HttpClient()
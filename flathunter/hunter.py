@@ -1,13 +1,15 @@
 """Default Flathunter implementation for the command line"""
-import traceback
-from itertools import chain
-
-import requests
+import asyncio
 
+from flathunter.async_engine import AsyncEngine
 from flathunter.config import YamlConfig
+from flathunter.crawl_scheduler import CrawlScheduler
+from flathunter.detail_cache import detail_cache
 from flathunter.exceptions import ConfigException
 from flathunter.filter import Filter
 from flathunter.logging import logger
+from flathunter.page_cache import page_cache
+from flathunter.parse_pool import parse_pool
 from flathunter.processor import ProcessorChain
 
 
@@ -19,33 +21,33 @@ class Hunter:
         if not isinstance(self.config, YamlConfig):
             raise ConfigException("Invalid config for hunter - should be a 'Config' object")
         self.id_watch = id_watch
+        for searcher in self.config.searchers():
+            if self.config.crawl_conditional_requests():
+                searcher.page_state = id_watch
+            searcher.id_watch = id_watch
+            if parse_pool.enabled:
+                searcher.parse_pool = parse_pool
+        self.crawl_scheduler = CrawlScheduler(
+            max_workers=self.config.crawl_max_workers(),
+            per_host_limit=self.config.crawl_per_host_concurrency(),
+        )
 
     def crawl_for_exposes(self, max_pages=None):
-        """Trigger a new crawl of the configured URLs"""
+        """Trigger a new crawl of the configured URLs. The URLs are crawled
+        concurrently, and exposes are yielded as soon as their crawl completes"""
+        jobs = [
+            (searcher, url)
+            for searcher in self.config.searchers()
+            for url in self.config.target_urls()
+            if searcher.matches_url(url)
+        ]
+        return self.crawl_scheduler.run(jobs, max_pages)
 
-        def try_crawl(searcher, url, max_pages):
-            try:
-                return searcher.crawl(url, max_pages)
-            except requests.exceptions.RequestException:
-                logger.info("Error while scraping url %s:\n%s", url, traceback.format_exc())
-                return []
-            except Exception:
-                logger.warning("Unexpected error while scraping url %s:\n%s", url, traceback.format_exc())
-                return []
-
-        return chain(
-            *[
-                try_crawl(searcher, url, max_pages)
-                for searcher in self.config.searchers()
-                for url in self.config.target_urls()
-            ]
-        )
-
-    def hunt_flats(self, max_pages: None|int = None):
-        """Crawl, process and filter exposes"""
+    def build_processor_chain(self) -> ProcessorChain:
+        """Build the processor chain every crawled expose is run through"""
         filter_set = Filter.builder().read_config(self.config).filter_already_seen(self.id_watch).build()
 
-        processor_chain = (
+        return (
             ProcessorChain.builder(self.config)
             .save_all_exposes(self.id_watch)
             .apply_filter(filter_set)
@@ -57,12 +59,40 @@ class Hunter:
             .score_with_gemini()
             .send_messages()
             .auto_contact(self.id_watch)
+            .save_enriched_exposes(self.id_watch)
             .build()
         )
 
+    def hunt_flats(self, max_pages: None|int = None):
+        """Crawl, process and filter exposes"""
+        page_cache.clear()
+        self.id_watch.begin_run()
+        if self.config.engine() == 'async':
+            result = asyncio.run(self.hunt_flats_async(max_pages))
+        else:
+            processor_chain = self.build_processor_chain()
+
+            result = []
+            # We need to iterate over this list to force the evaluation of the pipeline
+            for expose in processor_chain.process(self.crawl_for_exposes(max_pages)):
+                logger.info("New offer: %s", expose["title"])
+                result.append(expose)
+
+        # Only now are the exposes of the crawled pages processed
+        for searcher in self.config.searchers():
+            searcher.commit_page_states()
+        detail_cache.log_stats()
+        return result
+
+    async def hunt_flats_async(self, max_pages: None|int = None):
+        """Crawl, process and filter exposes on the asyncio engine"""
+        engine = AsyncEngine(self.config,
+                             max_threads=self.config.async_max_threads(),
+                             concurrency=self.config.async_concurrency())
+
         result = []
-        # We need to iterate over this list to force the evaluation of the pipeline
-        for expose in processor_chain.process(self.crawl_for_exposes(max_pages)):
+        async for expose in engine.run(self.build_processor_chain(), self.config.target_urls(),
+                                       max_pages, self.config.crawl_per_host_concurrency()):
             logger.info("New offer: %s", expose["title"])
             result.append(expose)
 
@@ -0,0 +1,355 @@
+"""Storage back-ends for the processed and contacted state of exposes. The
+back-end is selected with `id_maintainer` in the config: Google Cloud
+Firestore for cloud deployments, a local SQLite database, or memory (nothing
+is persisted, e.g. for benchmarks).
+
+Saved exposes are split into their list fields and their heavy detail fields
+(descriptions, photos, Gemini texts), which are stored compressed and apart.
+Both parts carry a fingerprint, and a part is only written again if its
+fingerprint changed. Writes are merged into the stored expose, and the fields
+written by a save of the enriched expose (see SaveEnrichedExposesProcessor)
+are never overwritten by a later save of the list fields, e.g. the Warmmiete
+by the list price."""
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Dict, FrozenSet, Iterable, NamedTuple, Optional, Set, Tuple
+
+from flathunter.exceptions import ConfigException
+from flathunter.expose import Expose
+from flathunter.logging import logger
+
+# Large expose fields that are only read when an expose is looked at in detail
+HEAVY_FIELDS = frozenset({'detail_description', 'detail_photos', 'gemini_summary',
+                          'gemini_pros', 'gemini_cons', 'gemini_message'})
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed (
+    id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS contacted (
+    id TEXT NOT NULL,
+    crawler TEXT NOT NULL,
+    contacted_at TEXT NOT NULL,
+    PRIMARY KEY (id, crawler)
+);
+CREATE TABLE IF NOT EXISTS exposes (
+    id TEXT PRIMARY KEY,
+    crawler TEXT,
+    created_at TEXT NOT NULL,
+    details TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    heavy_fingerprint TEXT,
+    enriched_fields TEXT
+);
+CREATE TABLE IF NOT EXISTS expose_details (
+    id TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS page_state (
+    key TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+"""
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(tz=datetime.timezone.utc)
+
+
+def _fingerprint(fields: Dict[str, Any]) -> str:
+    encoded = json.dumps(fields, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def compress_fields(fields: Dict[str, Any]) -> bytes:
+    """The fields as compressed JSON"""
+    return zlib.compress(json.dumps(fields, separators=(',', ':'), default=str).encode('utf-8'))
+
+
+def decompress_fields(data: bytes) -> Dict[str, Any]:
+    """The fields stored with compress_fields"""
+    return json.loads(zlib.decompress(data))
+
+
+class StoredExpose(NamedTuple):
+    """What is kept of a saved expose to tell what a save changes"""
+    fingerprint: str
+    heavy_fingerprint: Optional[str]
+    # Fields written by a save of the enriched expose
+    enriched_fields: FrozenSet[str] = frozenset()
+
+
+class ExposeUpdate(NamedTuple):
+    """The writes a save makes: the fields to merge into the stored expose,
+    whether the heavy fields are written, and the stored state after it"""
+    fields: Dict[str, Any]
+    heavy_changed: bool
+    stored: StoredExpose
+    created: bool
+
+
+class ExposeRecord(NamedTuple):
+    """An expose split for storage, with the fingerprints of both parts"""
+    fields: Dict[str, Any]
+    heavy: Dict[str, Any]
+    fingerprint: str
+    heavy_fingerprint: Optional[str]
+
+    @classmethod
+    def of(cls, expose) -> 'ExposeRecord':
+        """Splits the expose. Deferred detail fields are not loaded."""
+        fields = expose.loaded() if isinstance(expose, Expose) else dict(expose)
+        heavy = {name: fields.pop(name) for name in HEAVY_FIELDS if name in fields}
+        return cls(fields, heavy, _fingerprint(fields),
+                   _fingerprint(heavy) if heavy else None)
+
+    def changes(self, stored: Optional[Tuple[str, Optional[str]]]) -> Tuple[bool, bool]:
+        """Whether the fields and the heavy fields differ from the stored
+        (fingerprint, heavy_fingerprint). Missing heavy fields are no change:
+        they have not been loaded yet."""
+        if stored is None:
+            return True, bool(self.heavy)
+        heavy_changed = bool(self.heavy) and self.heavy_fingerprint != stored[1]
+        return heavy_changed or self.fingerprint != stored[0], heavy_changed
+
+    def update(self, stored: Optional[StoredExpose], enriched: bool = False) \
+            -> Optional[ExposeUpdate]:
+        """The writes that save this record over the stored expose, or None
+        if there is nothing to write. A save of the list fields leaves out
+        the fields an enriched save has written."""
+        changed, heavy_changed = self.changes(stored)
+        if not changed:
+            return None
+        fields = self.fields
+        enriched_fields = stored.enriched_fields if stored is not None else frozenset()
+        if enriched:
+            enriched_fields = enriched_fields | frozenset(fields)
+        else:
+            fields = {name: value for name, value in fields.items()
+                      if name not in enriched_fields}
+            if stored is not None and not fields and not heavy_changed:
+                return None
+        heavy_fingerprint = self.heavy_fingerprint if heavy_changed \
+            else stored and stored.heavy_fingerprint
+        return ExposeUpdate(fields, heavy_changed,
+                            StoredExpose(self.fingerprint, heavy_fingerprint, enriched_fields),
+                            stored is None)
+
+
+class IdMaintainer(ABC):
+    """Storage back-end for exposes and their processed / contacted state.
+    The batched lookups and flush / close are optional: by default, the
+    prefetch methods do nothing and the single lookups are used."""
+
+    @abstractmethod
+    def is_processed(self, expose_id) -> bool:
+        """Returns true if an expose has already been marked as processed"""
+
+    @abstractmethod
+    def mark_processed(self, expose_id):
+        """Mark exposes as processed when we have processed them"""
+
+    @abstractmethod
+    def save_expose(self, expose, enriched: bool = False):
+        """Writes an expose to the storage backend. `enriched` is set for
+        the save after the chain, whose fields win over the list fields."""
+
+    @abstractmethod
+    def is_contacted(self, expose_id, crawler) -> bool:
+        """Returns true if a landlord has already been contacted for this expose"""
+
+    @abstractmethod
+    def mark_contacted(self, expose_id, crawler):
+        """Mark an expose as contacted in the database"""
+
+    @abstractmethod
+    def get_page_state(self, key) -> Optional[Dict]:
+        """Returns the stored validators (etag, last_modified, hash) of a search page"""
+
+    @abstractmethod
+    def save_page_state(self, key, state):
+        """Stores the validators of a search page for the next run's conditional request"""
+
+    def prefetch_processed(self, expose_ids: Iterable):
+        """Loads the processed state of the exposes in batches"""
+
+    def prefetch_contacted(self, keys: Iterable[Tuple]):
+        """Loads the contacted state of (expose_id, crawler) pairs in batches"""
+
+    def prefetch_saved(self, expose_ids: Iterable):
+        """Loads the fingerprints of saved exposes in batches"""
+
+    def apply_retention(self, retention: Dict[str, Optional[float]]):
+        """Remove or compact data older than the retention in days per
+        collection ('processed', 'exposes', 'contacted'); None keeps it"""
+
+    def begin_run(self):
+        """Called at the start of every hunt. Back-ends that cache the state
+        they have read drop it here, so that a long-running process sees the
+        changes made since and its caches do not grow without bound."""
+
+    def flush(self):
+        """Block until all pending writes are stored"""
+
+    def close(self):
+        """Store pending writes and release the back-end. Called on shutdown."""
+
+
+class MemoryIdMaintainer(IdMaintainer):
+    """Keeps everything in memory for the lifetime of the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.processed: Set[str] = set()
+        self.contacted: Set[Tuple[str, str]] = set()
+        self.exposes: Dict[str, Dict] = {}
+        self.fingerprints: Dict[str, StoredExpose] = {}
+        self.page_state: Dict[str, Dict] = {}
+
+    def is_processed(self, expose_id) -> bool:
+        return str(expose_id) in self.processed
+
+    def mark_processed(self, expose_id):
+        with self._lock:
+            self.processed.add(str(expose_id))
+
+    def save_expose(self, expose, enriched: bool = False):
+        record = ExposeRecord.of(expose)
+        doc_id = str(expose['id'])
+        with self._lock:
+            update = record.update(self.fingerprints.get(doc_id), enriched)
+            if update is None:
+                return
+            saved = self.exposes.setdefault(doc_id, {'created_at': _now()})
+            saved.update(update.fields)
+            if update.heavy_changed:
+                saved.update(record.heavy)
+            self.fingerprints[doc_id] = update.stored
+
+    def is_contacted(self, expose_id, crawler) -> bool:
+        return (str(expose_id), crawler) in self.contacted
+
+    def mark_contacted(self, expose_id, crawler):
+        with self._lock:
+            self.contacted.add((str(expose_id), crawler))
+
+    def get_page_state(self, key) -> Optional[Dict]:
+        return self.page_state.get(key)
+
+    def save_page_state(self, key, state):
+        with self._lock:
+            self.page_state[key] = dict(state)
+
+
+class SqliteIdMaintainer(IdMaintainer):
+    """Local SQLite database in WAL mode. Lookups are answered from an index
+    on the local disk, so no batching is needed."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL makes NORMAL durable across application crashes
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(exposes)")}
+        if 'enriched_fields' not in columns:
+            self._db.execute("ALTER TABLE exposes ADD COLUMN enriched_fields TEXT")
+        logger.debug("Using id maintainer database at %s", path)
+
+    def _query(self, sql: str, args: tuple = ()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchone()
+
+    def is_processed(self, expose_id) -> bool:
+        return self._query("SELECT 1 FROM processed WHERE id = ?", (str(expose_id),)) is not None
+
+    def mark_processed(self, expose_id):
+        self._query("INSERT OR IGNORE INTO processed VALUES (?)", (str(expose_id),))
+
+    def save_expose(self, expose, enriched: bool = False):
+        record = ExposeRecord.of(expose)
+        doc_id = str(expose['id'])
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fingerprint, heavy_fingerprint, enriched_fields FROM exposes WHERE id = ?",
+                (doc_id,)).fetchone()
+            stored = None if row is None else StoredExpose(
+                row[0], row[1], frozenset(json.loads(row[2] or '[]')))
+            update = record.update(stored, enriched)
+            if update is None:
+                return
+            enriched_fields = json.dumps(sorted(update.stored.enriched_fields))
+            if update.created:
+                self._db.execute("INSERT INTO exposes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (doc_id, expose.get('crawler'), _now().isoformat(),
+                                  json.dumps(update.fields, default=str),
+                                  update.stored.fingerprint, update.stored.heavy_fingerprint,
+                                  enriched_fields))
+            else:
+                details = json.loads(self._db.execute(
+                    "SELECT details FROM exposes WHERE id = ?", (doc_id,)).fetchone()[0])
+                details.update(json.loads(json.dumps(update.fields, default=str)))
+                self._db.execute(
+                    "UPDATE exposes SET details = ?, fingerprint = ?, heavy_fingerprint = ?, "
+                    "enriched_fields = ? WHERE id = ?",
+                    (json.dumps(details), update.stored.fingerprint,
+                     update.stored.heavy_fingerprint, enriched_fields, doc_id))
+            if update.heavy_changed:
+                self._db.execute("INSERT OR REPLACE INTO expose_details VALUES (?, ?)",
+                                 (doc_id, compress_fields(record.heavy)))
+
+    def is_contacted(self, expose_id, crawler) -> bool:
+        return self._query("SELECT 1 FROM contacted WHERE id = ? AND crawler = ?",
+                           (str(expose_id), crawler)) is not None
+
+    def mark_contacted(self, expose_id, crawler):
+        self._query("INSERT OR REPLACE INTO contacted VALUES (?, ?, ?)",
+                    (str(expose_id), crawler, _now().isoformat()))
+
+    def get_page_state(self, key) -> Optional[Dict]:
+        row = self._query("SELECT state FROM page_state WHERE key = ?", (key,))
+        return json.loads(row[0]) if row is not None else None
+
+    def save_page_state(self, key, state):
+        self._query("INSERT OR REPLACE INTO page_state VALUES (?, ?)",
+                    (key, json.dumps(dict(state), default=str)))
+
+    def apply_retention(self, retention: Dict[str, Optional[float]]):
+        """Deletes old exposes and contacted marks. Processed IDs are kept:
+        they are indexed, so lookups stay fast without compaction."""
+        now = _now()
+        for table, field in (('exposes', 'created_at'), ('contacted', 'contacted_at')):
+            if retention.get(table):
+                cutoff = (now - datetime.timedelta(days=retention[table])).isoformat()
+                with self._lock:
+                    deleted = self._db.execute(
+                        f"DELETE FROM {table} WHERE {field} < ?", (cutoff,)).rowcount
+                logger.info("Retention: deleted %d old %s rows", deleted, table)
+        with self._lock:
+            self._db.execute("DELETE FROM expose_details WHERE id NOT IN (SELECT id FROM exposes)")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def create_id_maintainer(config) -> IdMaintainer:
+    """The back-end selected in the config. Firestore is only imported when
+    it is used, so that local runs need no cloud libraries."""
+    backend = config.id_maintainer()
+    if backend == 'firestore':
+        # pylint: disable=import-outside-toplevel
+        from flathunter.googlecloud_idmaintainer import GoogleCloudIdMaintainer
+        return GoogleCloudIdMaintainer(config)
+    if backend == 'sqlite':
+        return SqliteIdMaintainer(os.path.join(config.database_location(), 'processed_ids.db'))
+    if backend == 'memory':
+        return MemoryIdMaintainer()
+    raise ConfigException(f"Unknown id_maintainer '{backend}'")
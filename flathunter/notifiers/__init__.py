@@ -1,6 +1,5 @@
 """Package for notifiers."""
-import requests
-
+from flathunter.http_client import http_client
 from flathunter.logging import logger
 
 from .sender_apprise import SenderApprise
@@ -14,7 +13,7 @@ def send_telegram_alert(bot_token: str, receiver_ids: list, text: str):
     url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
     for chat_id in receiver_ids:
         try:
-            requests.post(url, data={
+            http_client.post(url, data={
                 "chat_id": chat_id,
                 "text": text,
                 "parse_mode": "HTML",
@@ -1,13 +1,17 @@
 """Functions and classes related to sending Apprise messages"""
 import apprise
 
-from flathunter.abstract_processor import Processor
+from flathunter.abstract_processor import COST_FETCH, Processor
 from flathunter.config import YamlConfig
 
 
 class SenderApprise(Processor):
     """Expose processor that sends Apprise messages"""
 
+    COST = COST_FETCH
+    REQUIRES = frozenset({'detail_photos'})
+    SIDE_EFFECT = True
+
     def __init__(self, config: YamlConfig):
         self.config = config
         self.apprise_urls = self.config.get('apprise', {})
@@ -1,22 +1,25 @@
 """Functions and classes related to sending Telegram messages"""
 import json
-import time
 from typing import List, Dict, Optional
 from flathunter.filter import ExposeHelper
 
-import requests
-
-from flathunter.abstract_processor import Processor
+from flathunter.abstract_processor import COST_FETCH, Processor
 from flathunter.config import YamlConfig
 from flathunter.exceptions import BotBlockedException
 from flathunter.exceptions import UserDeactivatedException
+from flathunter.http_client import http_client
 from flathunter.logging import logger
+from flathunter.rate_limit import rate_limiter
 from itertools import batched
 
 
 class SenderTelegram(Processor):
     """Expose processor that sends Telegram messages"""
 
+    COST = COST_FETCH
+    REQUIRES = frozenset({'detail_photos'})
+    SIDE_EFFECT = True
+
     def __init__(self, config: YamlConfig, receivers=None):
         self.config = config
         self.bot_token = self.config.telegram_bot_token()
@@ -77,7 +80,7 @@ class SenderTelegram(Processor):
         logger.debug(('text:', message))
         logger.debug("Retrieving URL %s, payload %s",
                      self.__text_message_url, payload)
-        response = requests.request(
+        response = http_client.request(
             "POST", self.__text_message_url, data=payload, timeout=30)
         logger.debug("Got response (%i): %s",
                      response.status_code, response.content)
@@ -111,7 +114,7 @@ class SenderTelegram(Processor):
             if msg.get('message_id', None):
                 payload['reply_to_message_id'] = msg.get('message_id')
 
-            response = requests.request(
+            response = http_client.request(
                 "POST", self.__media_group_url, data=payload, timeout=30)
 
             if response.status_code != 200:
@@ -151,7 +154,7 @@ class SenderTelegram(Processor):
         if response.status_code == 429:
             if "Too Many Requests" in data.get("description", ""):
                 backoff = data.get("parameters", {}).get("retry_after", 30)
-                time.sleep(min(backoff, 30))
+                rate_limiter.for_url(self.__media_group_url).pause(backoff)
                 return None
         return None
 
@@ -164,15 +167,8 @@ class SenderTelegram(Processor):
         :param expose: dictionary
         :return: str
         """
-        size_number = ExposeHelper.get_size(expose)
-        price_number = ExposeHelper.get_price(expose)
-
-        if size_number and price_number:
-            pps = price_number / size_number
-            rounded_pps = round(pps, 1)
-        else:
-            pps = None
-            rounded_pps = None
+        pps = ExposeHelper.get_price_per_sqm(expose)
+        rounded_pps = round(pps, 1) if pps is not None else None
 
         preferred_max_pps = self.config.telegram_preferred_max_pps()
 
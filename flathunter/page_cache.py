@@ -0,0 +1,105 @@
+"""Per-run cache of expose pages. Address resolution, detail crawling and the
+contactors all need the same expose pages; through `page_cache` each page is
+downloaded and parsed only once per run, however many stages read it."""
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Union
+
+import requests
+from bs4 import BeautifulSoup
+
+from flathunter.logging import logger
+
+
+class CachedPage:
+    """The raw content of a fetched page and its lazily parsed tree"""
+
+    def __init__(self, url: str, status_code: int, content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self._soup: Optional[BeautifulSoup] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_response(cls, resp: requests.Response) -> 'CachedPage':
+        """Keep the parts of a response (requests or httpx) the stages need"""
+        return cls(str(resp.url), resp.status_code, resp.content)
+
+    @property
+    def ok(self) -> bool:
+        """True if the page was fetched successfully"""
+        return self.status_code == 200
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        """The parsed page, parsed on first access"""
+        with self._lock:
+            if self._soup is None:
+                self._soup = BeautifulSoup(self.content, 'lxml')
+            return self._soup
+
+
+class PageCache:
+    """Thread-safe cache of pages by URL. Concurrent requests for a page that
+    is being fetched wait for that fetch instead of starting their own. Only
+    successful responses are kept."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages: Dict[str, CachedPage] = {}
+        self._inflight: Dict[str, Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """Forget all pages, at the start of a run"""
+        with self._lock:
+            if self._pages:
+                logger.debug("Page cache: %d hits, %d misses, %d pages",
+                             self.hits, self.misses, len(self._pages))
+            self._pages = {}
+            self.hits = self.misses = 0
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        """The cached page for the URL, if any"""
+        with self._lock:
+            return self._pages.get(url)
+
+    def fetch(self, url: str,
+              load: Callable[[], Union[requests.Response, CachedPage]]) -> CachedPage:
+        """Return the cached page for the URL, calling `load` to fetch it if needed.
+        `load` returns either a response or an already wrapped page."""
+        with self._lock:
+            page = self._pages.get(url)
+            if page is not None:
+                self.hits += 1
+                return page
+            flight = self._inflight.get(url)
+            owner = flight is None
+            if owner:
+                self.misses += 1
+                flight = self._inflight[url] = Future()
+            else:
+                self.hits += 1
+        if not owner:
+            return flight.result()
+
+        try:
+            page = load()
+            if not isinstance(page, CachedPage):
+                page = CachedPage.from_response(page)
+        except BaseException as exc:
+            with self._lock:
+                del self._inflight[url]
+            flight.set_exception(exc)
+            raise
+        with self._lock:
+            del self._inflight[url]
+            if page.ok:
+                self._pages[url] = page
+        flight.set_result(page)
+        return page
+
+
+page_cache = PageCache()
@@ -0,0 +1,82 @@
+"""Optional process pool for parsing search result pages. Parsing and
+extraction are CPU-bound and hold the GIL, so more crawl threads stop helping
+once the pages are downloaded. With `crawl.parse_processes` set, the raw
+response bytes of result pages are sent to worker processes, which run the
+crawler's parse_page, extract_data and pagination logic; only the extracted
+exposes and page URLs are sent back."""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from flathunter.config import YamlConfig
+from flathunter.logging import logger
+
+# Crawlers of the worker process, by name
+_searchers: Dict = {}
+
+
+def _init_worker(settings: Dict):
+    config = YamlConfig(settings)
+    config.init_searchers()
+    _searchers.update({searcher.get_name(): searcher for searcher in config.searchers()})
+
+
+def _extract_page(name: str, content: bytes, headers: Dict[str, str],
+                  search_url: Optional[str], max_pages: Optional[int]) -> Tuple[List[Dict], List[str]]:
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.headers = CaseInsensitiveDict(headers)
+    resp._content = content  # pylint: disable=protected-access
+    return _searchers[name].extract_page(resp, search_url, max_pages)
+
+
+class ParsePool:
+    """Process pool running Crawler.extract_page. Disabled until configured
+    with a number of processes."""
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def configure(self, config):
+        """Start the worker processes configured in `crawl.parse_processes`, if any"""
+        self.close()
+        processes = config.crawl_parse_processes()
+        if processes <= 0:
+            return
+        # Worker processes are spawned rather than forked: the crawl threads
+        # may hold locks at the time of the fork
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(config.config,))
+        logger.debug("Parsing result pages in %d processes", processes)
+
+    def close(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    @property
+    def enabled(self) -> bool:
+        """True if worker processes are configured"""
+        return self._executor is not None
+
+    def extract_page(self, crawler, resp: requests.Response, search_url: Optional[str] = None,
+                     max_pages: Optional[int] = None) -> Tuple[List[Dict], List[str]]:
+        """Runs the crawler's extract_page for the response in a worker process.
+        Falls back to the calling thread if the pool is not usable."""
+        executor = self._executor
+        if executor is not None:
+            try:
+                return executor.submit(_extract_page, crawler.get_name(), resp.content,
+                                       dict(resp.headers), search_url, max_pages).result()
+            except (BrokenProcessPool, RuntimeError) as exc:
+                logger.warning("Parse pool failed (%s), parsing in process", exc)
+        return crawler.extract_page(resp, search_url, max_pages)
+
+
+parse_pool = ParsePool()
@@ -1,6 +1,6 @@
 """Utility classes for building chains for processors"""
 from functools import reduce
-from typing import List
+from typing import List, NamedTuple, Optional
 
 from flathunter.default_processors import AddressResolver
 from flathunter.default_processors import FilterProcessor
@@ -10,12 +10,15 @@ from flathunter.notifiers import SenderTelegram, SenderApprise
 from flathunter.gmaps_duration_processor import GMapsDurationProcessor
 from flathunter.contactors.auto_contact import AutoContactProcessor
 from flathunter.contactors.score_processor import GeminiScoreProcessor
-from flathunter.abstract_processor import Processor
+from flathunter.abstract_processor import COST_STORE, Processor
 from flathunter.logging import logger
 
 class SaveAllExposesProcessor(Processor):
     """Processor that saves all exposes to the database"""
 
+    COST = COST_STORE
+    SIDE_EFFECT = True
+
     def __init__(self, config, id_watch):
         self.config = config
         self.id_watch = id_watch
@@ -26,9 +29,28 @@ class SaveAllExposesProcessor(Processor):
         return expose
 
 
+class SaveEnrichedExposesProcessor(SaveAllExposesProcessor):
+    """Processor that saves the exposes again once they passed the chain,
+    with their details and Gemini scores. SaveAllExposesProcessor runs
+    before any of those are added; the id maintainer only writes the parts
+    whose fingerprint changed, here usually the heavy detail fields. Its
+    fields win over those of later saves of the list fields."""
+
+    def process_expose(self, expose):
+        """Save a single enriched expose"""
+        self.id_watch.save_expose(expose, enriched=True)
+        return expose
+
+
 class PreDurationFilter(Processor):
     """Drop exposes with no size data or that exceed PPS threshold.
-    Should run before calculate_durations to avoid unnecessary API calls."""
+    Should run before calculate_durations to avoid unnecessary API calls.
+    The Warmmiete from the detail pages only raises the price, so the check
+    also runs as a precheck on the list-page price."""
+
+    REQUIRES = frozenset({'price', 'size'})
+    FILTER = True
+    PRECHECK = True
 
     def __init__(self, config):
         self.config = config
@@ -40,11 +62,10 @@ class PreDurationFilter(Processor):
                 logger.info("Dropping '%s': no size data", expose.get('title'))
                 continue
             if self.max_pps:
-                price = ExposeHelper.get_price(expose)
-                size = ExposeHelper.get_size(expose)
-                if price and size and price / size > self.max_pps:
+                pps = ExposeHelper.get_price_per_sqm(expose)
+                if pps and pps > self.max_pps:
                     logger.info("Dropping '%s': PPS %.1f exceeds %.1f",
-                                expose.get('title'), price / size, self.max_pps)
+                                expose.get('title'), pps, self.max_pps)
                     continue
             yield expose
 
@@ -53,6 +74,12 @@ class DurationFilter(Processor):
     """Drop exposes that fail duration limits.
     Should run after calculate_durations."""
 
+    REQUIRES = frozenset({'durations_passed'})
+    FILTER = True
+
+    def __init__(self, config):
+        self.config = config
+
     def process_exposes(self, exposes):
         for expose in exposes:
             if not expose.get('durations_passed', True):
@@ -116,6 +143,11 @@ class ProcessorChainBuilder:
         self.processors.append(SaveAllExposesProcessor(self.config, id_watch))
         return self
 
+    def save_enriched_exposes(self, id_watch):
+        """Add processor that saves exposes again with their details"""
+        self.processors.append(SaveEnrichedExposesProcessor(self.config, id_watch))
+        return self
+
     def score_with_gemini(self):
         """Add processor that scores listings with Gemini, if enabled"""
         if self.config.auto_contact_gemini_api_key():
@@ -129,15 +161,107 @@ class ProcessorChainBuilder:
         return self
 
     def build(self):
-        """Build the processor chain"""
-        return ProcessorChain(self.processors)
+        """Build the processor chain, with its stages planned by plan_stages"""
+        return ProcessorChain.planned(self.processors)
+
+
+class Stage(NamedTuple):
+    """A processor at its place in a planned chain, and why it is there"""
+    processor: Processor
+    note: str = ''
+
+
+def _name(processor: Processor) -> str:
+    return type(processor).__name__
+
+
+def _hoist_position(stages: List[Stage], processor: Processor, precheck: bool) -> int:
+    """How far up the filter can move: past costlier stages without side
+    effects that do not provide what it reads (unless it is a precheck)"""
+    position = len(stages)
+    while position > 0:
+        before = stages[position - 1].processor
+        if before.SIDE_EFFECT or before.COST <= processor.COST:
+            break
+        if not precheck and before.PROVIDES & processor.REQUIRES:
+            break
+        position -= 1
+    return position
+
+
+def plan_stages(processors: List[Processor]) -> List[Stage]:
+    """Arrange the processors so that cheap filters run before expensive
+    stages. Filters move up past costlier stages unless those provide fields
+    the filter reads or have side effects. A filter marked PRECHECK that is
+    held back by such a dependency also runs as early as it can, on the
+    list-page data. All other stages keep their order. Fields a stage
+    deferred are loaded right before the first stage requiring them."""
+    stages: List[Stage] = []
+    for processor in processors:
+        if not processor.FILTER or processor.SIDE_EFFECT:
+            stages.append(Stage(processor))
+            continue
+        position = _hoist_position(stages, processor, precheck=False)
+        note = f"moved before {_name(stages[position].processor)}" \
+            if position < len(stages) else ''
+        if processor.PRECHECK:
+            early = _hoist_position(stages[:position], processor, precheck=True)
+            if early < position:
+                stages.insert(early, Stage(processor, "precheck on list-page data, "
+                                                      f"before {_name(stages[early].processor)}"))
+                position += 1
+        stages.insert(position, Stage(processor, note))
+    _add_loaders(stages)
+    return stages
+
+
+def _add_loaders(stages: List[Stage]):
+    """Insert the stage loading deferred fields before the first stage that
+    requires one of them"""
+    position = 0
+    while position < len(stages):
+        processor = stages[position].processor
+        position += 1
+        loader = processor.load_deferred() if processor.DEFERS else None
+        if loader is None:
+            continue
+        for later in range(position, len(stages)):
+            if stages[later].processor.REQUIRES & processor.DEFERS:
+                stages.insert(later, Stage(loader, f"loads the fields {_name(processor)} "
+                                                   f"deferred, before {_name(stages[later].processor)}"))
+                break
+
 
 class ProcessorChain:
     """Class to hold a chain of processors"""
     processors: List[Processor]
 
-    def __init__(self, processors):
+    def __init__(self, processors, stages: Optional[List[Stage]] = None):
         self.processors = processors
+        self.stages = stages if stages is not None else [Stage(p) for p in processors]
+
+    @classmethod
+    def planned(cls, processors: List[Processor]) -> 'ProcessorChain':
+        """A chain running the processors in the order given by plan_stages"""
+        stages = plan_stages(processors)
+        return cls([stage.processor for stage in stages], stages)
+
+    def explain(self) -> str:
+        """The resolved order of the stages, with their costs and the reasons
+        they were moved"""
+        lines = []
+        for number, stage in enumerate(self.stages, start=1):
+            processor = stage.processor
+            flags = [f"cost {processor.COST}"]
+            if processor.FILTER:
+                flags.append("filter")
+            if processor.SIDE_EFFECT:
+                flags.append("side effects")
+            line = f"{number:2}. {_name(processor)} ({', '.join(flags)})"
+            if stage.note:
+                line += f" - {stage.note}"
+            lines.append(line)
+        return "\n".join(lines)
 
     def process(self, exposes):
         """Process the sequences of exposes with the processor chain"""
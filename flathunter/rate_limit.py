@@ -0,0 +1,191 @@
+"""Per-host rate limiting. Every request sent through the shared `http_client`
+takes a token from its host's bucket and a slot of the host's concurrency limit.
+The limit adapts AIMD-style: it grows by one slot per `limit` successful
+responses and is halved whenever the host answers 429, 403 or 5xx. A
+Retry-After header (or repeated 429s) pauses the whole host for a while.
+Requests answered 429 or 503 are retried if they are idempotent; others,
+e.g. a POST that sends a message, may already have been acted on."""
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, fields, replace
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from flathunter.logging import logger
+
+THROTTLE_STATUSES = frozenset({403, 429})
+RETRY_STATUSES = frozenset({429, 503})
+# Methods that are retried by default
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+
+def retries_method(method: str, retry: Optional[bool] = None) -> bool:
+    """Whether requests with the method are retried; `retry` overrides it"""
+    return method.upper() in IDEMPOTENT_METHODS if retry is None else retry
+
+
+@dataclass(frozen=True)
+class HostPolicy:
+    """Rate limit settings for one host"""
+    rate: float = 10.0             # requests per second, refill rate of the bucket
+    burst: int = 10                # bucket size
+    concurrency: int = 4           # initial concurrency limit
+    max_concurrency: int = 16      # upper bound for the adaptive limit
+    retries: int = 2               # retries on 429/503 of idempotent requests
+    max_retry_after: float = 60.0  # never wait longer than this for a retry
+
+    def updated(self, settings: Optional[Dict]) -> 'HostPolicy':
+        """Return a copy with the known keys of `settings` applied"""
+        if not settings:
+            return self
+        known = {field.name for field in fields(self)}
+        return replace(self, **{key: value for key, value in settings.items() if key in known})
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait according to a Retry-After header (delta or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def is_throttled(status: Optional[int]) -> bool:
+    """True if the status code means the host wants us to slow down"""
+    return status is not None and (status in THROTTLE_STATUSES or status >= 500)
+
+
+class HostLimiter:
+    """Token bucket plus adaptive concurrency limit for a single host"""
+
+    def __init__(self, host: str, policy: HostPolicy):
+        self.host = host
+        self.policy = policy
+        self._cond = threading.Condition()
+        self._tokens = float(policy.burst)
+        self._updated = time.monotonic()
+        self._limit = float(max(1, policy.concurrency))
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._throttled = 0
+
+    @property
+    def limit(self) -> int:
+        """The current concurrency limit"""
+        return int(self._limit)
+
+    def _try_acquire(self) -> Optional[float]:
+        """Take a slot and a token if available. Returns 0 on success, otherwise
+        the seconds to wait, or None if we have to wait for a slot to be released"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= int(self._limit):
+            return None
+        self._tokens = min(float(self.policy.burst),
+                           self._tokens + (now - self._updated) * self.policy.rate)
+        self._updated = now
+        if self._tokens < 1:
+            return (1 - self._tokens) / self.policy.rate
+        self._tokens -= 1
+        self._in_flight += 1
+        return 0
+
+    def acquire(self):
+        """Block until a request to the host may be sent"""
+        with self._cond:
+            while (wait := self._try_acquire()) != 0:
+                self._cond.wait(wait)
+
+    async def aacquire(self):
+        """Wait on the event loop until a request to the host may be sent"""
+        while True:
+            with self._cond:
+                wait = self._try_acquire()
+            if wait == 0:
+                return
+            await asyncio.sleep(wait if wait is not None else 0.05)
+
+    def pause(self, seconds: float):
+        """Send no requests to the host for the given number of seconds"""
+        seconds = min(seconds, self.policy.max_retry_after)
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+        logger.debug("Pausing requests to %s for %.1fs", self.host, seconds)
+
+    def release(self, status: Optional[int], retry_after: Optional[float] = None) -> float:
+        """Free the slot taken by `acquire` and adapt the limit to the response.
+        Returns the number of seconds the host is paused for (0 if not paused)."""
+        pause = 0.0
+        with self._cond:
+            self._in_flight -= 1
+            if is_throttled(status):
+                self._throttled += 1
+                self._limit = max(1.0, self._limit / 2)
+                if retry_after is not None:
+                    pause = retry_after
+                elif status == 429:
+                    pause = float(2 ** min(self._throttled, 6))
+            elif status is not None:
+                self._throttled = 0
+                self._limit = min(float(self.policy.max_concurrency),
+                                  self._limit + 1 / self._limit)
+            self._cond.notify_all()
+        if is_throttled(status):
+            logger.info("%s answered %d, lowering concurrency to %d",
+                        self.host, status, self.limit)
+        if pause:
+            self.pause(pause)
+        return pause
+
+    def should_retry(self, status: Optional[int], pause: float, attempt: int) -> bool:
+        """True if a request that got `status` should be sent again"""
+        return (status in RETRY_STATUSES and attempt < self.policy.retries
+                and pause <= self.policy.max_retry_after)
+
+
+class RateLimiter:
+    """Registry of the per-host limiters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._default = HostPolicy()
+        self._policies: Dict[str, HostPolicy] = {}
+        self._hosts: Dict[str, HostLimiter] = {}
+
+    def configure(self, config):
+        """Read the default and per-host policies from the config"""
+        with self._lock:
+            self._default = HostPolicy().updated(config.http_rate_limit())
+            self._policies = {
+                host: self._default.updated((settings or {}).get('rate_limit'))
+                for host, settings in config.http_host_settings().items()
+            }
+            self._hosts = {}
+
+    def for_host(self, host: str) -> HostLimiter:
+        """The limiter of the given host"""
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostLimiter(host, self._policies.get(host, self._default))
+            return self._hosts[host]
+
+    def for_url(self, url: str) -> HostLimiter:
+        """The limiter of the URL's host"""
+        return self.for_host(urlparse(url).netloc)
+
+
+rate_limiter = RateLimiter()
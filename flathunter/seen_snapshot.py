@@ -0,0 +1,205 @@
+"""Compact local set of processed expose IDs. IDs are stored as 64-bit hashes
+in sorted arrays, split into shards by the top bits of the hash, so that a
+snapshot of a million IDs takes 8 MB and a lookup is a binary search.
+
+The set is exact up to hash collisions (about one in 10^13 for a million
+IDs), unlike a Bloom filter, whose false positives would drop new listings.
+It only answers "seen": an ID that is not in the snapshot may still have
+been processed by another instance since it was saved.
+
+MonthlySeenSnapshot partitions the IDs by month, so that each month is saved
+on its own and no saved document grows with the total number of IDs."""
+import hashlib
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Set
+
+# Number of shards, addressed by the top 4 bits of the hash
+SHARDS = 16
+_SHARD_SHIFT = 60
+
+# Header of snapshot files with months; older files are one flat set
+_FILE_MAGIC = b'FHSEEN2\n'
+# Month of the IDs of snapshots saved before they were split by month
+LEGACY_MONTH = '0000-00'
+
+
+def id_hash(doc_id: str) -> int:
+    """64-bit hash of an expose ID"""
+    return int.from_bytes(hashlib.blake2b(doc_id.encode('utf-8'), digest_size=8).digest(),
+                          'little')
+
+
+def _to_bytes(hashes: array) -> bytes:
+    if sys.byteorder != 'little':
+        hashes = array('Q', hashes)
+        hashes.byteswap()
+    return hashes.tobytes()
+
+
+def _from_bytes(data: bytes) -> array:
+    hashes = array('Q')
+    hashes.frombytes(data)
+    if sys.byteorder != 'little':
+        hashes.byteswap()
+    return hashes
+
+
+class SeenSnapshot:
+    """Set of expose IDs. IDs added since loading are kept apart, so that only
+    the shards that changed need to be saved."""
+
+    def __init__(self):
+        self._shards: List[array] = [array('Q') for _ in range(SHARDS)]
+        self._added: List[Set[int]] = [set() for _ in range(SHARDS)]
+        # Shards that were merged with IDs that have to be saved with them
+        self._dirty: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self.contains_hash(id_hash(doc_id))
+
+    def contains_hash(self, hashed: int) -> bool:
+        """True if the ID with the given id_hash is in the set"""
+        shard = hashed >> _SHARD_SHIFT
+        if hashed in self._added[shard]:
+            return True
+        hashes = self._shards[shard]
+        index = bisect_left(hashes, hashed)
+        return index < len(hashes) and hashes[index] == hashed
+
+    def __len__(self) -> int:
+        return sum(len(hashes) for hashes in self._shards) \
+            + sum(len(added) for added in self._added)
+
+    def add(self, doc_id: str):
+        """Add an ID to the set"""
+        if doc_id not in self:
+            hashed = id_hash(doc_id)
+            with self._lock:
+                self._added[hashed >> _SHARD_SHIFT].add(hashed)
+
+    def dirty_shards(self) -> List[int]:
+        """Shards with IDs added since they were loaded or saved"""
+        return [shard for shard, added in enumerate(self._added)
+                if added or shard in self._dirty]
+
+    def shard_bytes(self, shard: int) -> bytes:
+        """Serialize a shard, including the IDs added to it, and mark it clean"""
+        with self._lock:
+            self._shards[shard] = self._merge(self._shards[shard], self._added[shard])
+            self._added[shard] = set()
+            self._dirty.discard(shard)
+            return _to_bytes(self._shards[shard])
+
+    def load(self, data: bytes, dirty: bool = False):
+        """Merge a serialized set (see to_bytes) into the set. With `dirty`,
+        the shards it adds to are saved like shards with added IDs."""
+        hashes = _from_bytes(data)
+        bounds = [bisect_left(hashes, shard << _SHARD_SHIFT) for shard in range(SHARDS)]
+        bounds.append(len(hashes))
+        with self._lock:
+            for shard in range(SHARDS):
+                if bounds[shard] == bounds[shard + 1]:
+                    continue
+                self._shards[shard] = self._merge(
+                    self._shards[shard], hashes[bounds[shard]:bounds[shard + 1]])
+                if dirty:
+                    self._dirty.add(shard)
+
+    def to_bytes(self) -> bytes:
+        """Serialize the whole set as one sorted array"""
+        return b''.join(self.shard_bytes(shard) for shard in range(SHARDS))
+
+    @staticmethod
+    def _merge(hashes: array, more: Iterable[int]) -> array:
+        if not more:
+            return hashes
+        if not hashes and isinstance(more, array):
+            # Serialized shards are sorted already
+            return more
+        return array('Q', sorted(set(hashes).union(more)))
+
+
+class MonthlySeenSnapshot:
+    """Set of expose IDs, partitioned into a SeenSnapshot per month ('YYYY-MM'):
+    the month of the archive set an ID came from, or the month it was added
+    in. Lookups check every month; months are saved apart."""
+
+    def __init__(self):
+        self._months: Dict[str, SeenSnapshot] = {}
+        self._lock = threading.Lock()
+
+    def month(self, month: str) -> SeenSnapshot:
+        """The IDs of a month"""
+        with self._lock:
+            if month not in self._months:
+                self._months[month] = SeenSnapshot()
+            return self._months[month]
+
+    def __contains__(self, doc_id: str) -> bool:
+        hashed = id_hash(doc_id)
+        with self._lock:
+            months = list(self._months.values())
+        return any(snapshot.contains_hash(hashed) for snapshot in months)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(snapshot) for snapshot in self._months.values())
+
+    def add(self, doc_id: str, month: str):
+        """Add an ID to the set, in the given month unless it is known"""
+        if doc_id not in self:
+            self.month(month).add(doc_id)
+
+    def load(self, month: str, data: bytes, dirty: bool = False):
+        """Merge a serialized set into the month (see SeenSnapshot.load)"""
+        self.month(month).load(data, dirty)
+
+    def dirty_months(self) -> List[str]:
+        """Months with IDs added since they were loaded or saved"""
+        with self._lock:
+            return sorted(month for month, snapshot in self._months.items()
+                          if snapshot.dirty_shards())
+
+    def parts(self, month: str, part_size: int) -> List[bytes]:
+        """Serialize a month in parts of at most part_size bytes, and mark it clean"""
+        data = self.month(month).to_bytes()
+        part_size -= part_size % 8
+        return [data[start:start + part_size] for start in range(0, len(data), part_size)] \
+            or [b'']
+
+    def load_file(self, path: str):
+        """Merge the set saved in a file, if it exists. A file saved before
+        the IDs were split by month is loaded into LEGACY_MONTH."""
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as snapshot_file:
+            data = snapshot_file.read()
+        if not data.startswith(_FILE_MAGIC):
+            self.load(LEGACY_MONTH, data, dirty=True)
+            return
+        position = len(_FILE_MAGIC)
+        while position < len(data):
+            month = data[position:position + 7].decode('ascii')
+            size = int.from_bytes(data[position + 7:position + 15], 'little')
+            position += 15
+            self.load(month, data[position:position + size])
+            position += size
+
+    def save_file(self, path: str):
+        """Save the set to a file, merged with the IDs other runs saved there"""
+        self.load_file(path)
+        with self._lock:
+            months = sorted(self._months.items())
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as snapshot_file:
+            snapshot_file.write(_FILE_MAGIC)
+            for month, snapshot in months:
+                data = snapshot.to_bytes()
+                snapshot_file.write(month.encode('ascii') + len(data).to_bytes(8, 'little'))
+                snapshot_file.write(data)
+        os.replace(temp_path, path)
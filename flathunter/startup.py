@@ -1,9 +1,33 @@
 """Shared startup logic for CLI and Cloud Run entry points"""
+import atexit
+import sys
+
 from flathunter.argument_parser import parse
+from flathunter.cassette import CassetteIdMaintainer, open_cassette
 from flathunter.config import Config
-from flathunter.googlecloud_idmaintainer import GoogleCloudIdMaintainer
+from flathunter.contactors.message_generator import GEMINI_API_URL
+from flathunter.detail_cache import detail_cache
+from flathunter.http_client import http_client
 from flathunter.hunter import Hunter
+from flathunter.idmaintainer import create_id_maintainer
 from flathunter.logging import configure_logging
+from flathunter.parse_pool import parse_pool
+
+
+def warmup_urls(config) -> list:
+    """URLs of all hosts the run is going to talk to"""
+    urls = [
+        conn_url
+        for searcher in config.searchers()
+        for url in config.target_urls()
+        if searcher.matches_url(url)
+        for conn_url in searcher.connection_urls(url)
+    ]
+    if 'telegram' in config.notifiers():
+        urls.append("https://api.telegram.org/")
+    if config.auto_contact_gemini_api_key():
+        urls.append(GEMINI_API_URL)
+    return urls
 
 
 def create_hunter() -> Hunter:
@@ -14,6 +38,32 @@ def create_hunter() -> Hunter:
 
     configure_logging(config)
     config.init_searchers()
+    if args.explain:
+        # Planning needs neither the network nor the database
+        print(Hunter(config, None).build_processor_chain().explain())
+        sys.exit(0)
+
+    if args.compact:
+        id_watch = create_id_maintainer(config)
+        id_watch.apply_retention({name: config.retention_days(name)
+                                  for name in ('processed', 'exposes', 'contacted')})
+        id_watch.close()
+        sys.exit(0)
+
+    http_client.configure(config)
+    detail_cache.configure(config)
+    parse_pool.configure(config)
+    atexit.register(parse_pool.close)
+    cassette = open_cassette(args.record, args.replay)
+    http_client.cassette = cassette
+    if config.http_warmup():
+        http_client.warmup(warmup_urls(config))
 
-    id_watch = GoogleCloudIdMaintainer(config)
-    return Hunter(config, id_watch)
+    id_watch = None
+    if cassette is None or not cassette.replaying:
+        id_watch = create_id_maintainer(config)
+        atexit.register(id_watch.close)
+    if cassette is None:
+        return Hunter(config, id_watch)
+    atexit.register(cassette.save)
+    return Hunter(config, CassetteIdMaintainer(id_watch, cassette))
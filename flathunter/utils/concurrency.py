@@ -0,0 +1,249 @@
+"""Helpers for running blocking work on thread pools while streaming results"""
+import asyncio
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Deque, Dict,
+                    Iterable, Iterator, List, Set, Tuple, TypeVar)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+_FEED_DONE = object()
+
+
+def stream_map(func: Callable[[T], R], items: Iterable[T], max_workers: int,
+               ordered: bool = False, thread_name_prefix: str = '') -> Iterator[R]:
+    """Apply func to every item on a thread pool and yield the results as they
+    become available. Items are pulled lazily from a feeder thread, so results
+    are yielded while the upstream iterator is still producing, and at most
+    max_workers items are in flight at any time. Results are yielded in
+    completion order, or in input order if `ordered` is set."""
+    max_workers = max(1, max_workers)
+    results: queue.Queue = queue.Queue()
+    slots = threading.BoundedSemaphore(max_workers)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max_workers,
+                                  thread_name_prefix=thread_name_prefix)
+
+    def run(index, item):
+        try:
+            results.put((index, True, func(item)))
+        except BaseException as exc:  # pylint: disable=broad-exception-caught
+            results.put((index, False, exc))
+        finally:
+            slots.release()
+
+    def feed():
+        submitted = 0
+        try:
+            for item in items:
+                slots.acquire()
+                if stop.is_set():
+                    slots.release()
+                    break
+                executor.submit(run, submitted, item)
+                submitted += 1
+        except BaseException as exc:  # pylint: disable=broad-exception-caught
+            results.put((None, False, exc))
+        finally:
+            results.put((_FEED_DONE, True, submitted))
+
+    feeder = threading.Thread(target=feed, name=f'{thread_name_prefix}feeder', daemon=True)
+    feeder.start()
+    return _collect(results, ordered, stop, executor)
+
+
+def stream_map_keyed(func: Callable[[T], R], items: Iterable[T], key: Callable[[T], Any],
+                     key_limit: Callable[[Any], int], max_workers: int,
+                     ordered: bool = False, thread_name_prefix: str = '') -> Iterator[R]:
+    """Like stream_map, but with at most key_limit(key) items of the same key
+    in flight. Items whose key is at its limit wait in a queue per key without
+    holding a worker, so a burst of one key does not hold up the others. The
+    upstream iterator is read ahead as far as needed to keep the workers busy."""
+    max_workers = max(1, max_workers)
+    results: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max_workers,
+                                  thread_name_prefix=thread_name_prefix)
+    lock = threading.Lock()
+    waiting: Dict[Any, Deque[Tuple[int, T]]] = {}
+    running: Dict[Any, int] = {}
+    limits: Dict[Any, int] = {}
+    free = [max_workers]
+
+    def dispatch():
+        # Called with the lock held
+        for item_key, items_waiting in waiting.items():
+            while items_waiting and free[0] > 0 and running[item_key] < limits[item_key]:
+                index, item = items_waiting.popleft()
+                running[item_key] += 1
+                free[0] -= 1
+                executor.submit(run, index, item_key, item)
+
+    def run(index, item_key, item):
+        try:
+            results.put((index, True, func(item)))
+        except BaseException as exc:  # pylint: disable=broad-exception-caught
+            results.put((index, False, exc))
+        finally:
+            with lock:
+                running[item_key] -= 1
+                free[0] += 1
+                if not stop.is_set():
+                    dispatch()
+
+    def feed():
+        submitted = 0
+        try:
+            for item in items:
+                if stop.is_set():
+                    break
+                item_key = key(item)
+                with lock:
+                    if item_key not in limits:
+                        limits[item_key] = max(1, key_limit(item_key))
+                        running[item_key] = 0
+                        waiting[item_key] = deque()
+                    waiting[item_key].append((submitted, item))
+                    dispatch()
+                submitted += 1
+        except BaseException as exc:  # pylint: disable=broad-exception-caught
+            results.put((None, False, exc))
+        finally:
+            results.put((_FEED_DONE, True, submitted))
+
+    feeder = threading.Thread(target=feed, name=f'{thread_name_prefix}feeder', daemon=True)
+    feeder.start()
+    return _collect(results, ordered, stop, executor)
+
+
+def ready_batches(items: Iterable[T], max_size: int,
+                  thread_name: str = 'batches') -> Iterator[List[T]]:
+    """Yield the items in batches of those that are already available, up to
+    max_size each. The items are pulled by a feeder thread; a batch is
+    yielded as soon as one item is there, so no item waits for others to
+    fill up a batch."""
+    ready: queue.Queue = queue.Queue()
+    stop = threading.Event()
+
+    def feed():
+        try:
+            for item in items:
+                if stop.is_set():
+                    return
+                ready.put((True, item))
+        except BaseException as exc:  # pylint: disable=broad-exception-caught
+            ready.put((False, exc))
+        ready.put((True, _FEED_DONE))
+
+    feeder = threading.Thread(target=feed, name=thread_name, daemon=True)
+    feeder.start()
+    return _collect_batches(ready, max(1, max_size), stop)
+
+
+def _collect_batches(ready: queue.Queue, max_size: int,
+                     stop: threading.Event) -> Iterator[List]:
+    """Yield the items put by the feeder of ready_batches, taking whatever
+    is queued up to max_size without waiting for more"""
+    done = False
+    try:
+        while not done:
+            entries = [ready.get()]
+            while len(entries) < max_size:
+                try:
+                    entries.append(ready.get_nowait())
+                except queue.Empty:
+                    break
+            batch = []
+            for ok, value in entries:
+                if not ok:
+                    raise value
+                if value is _FEED_DONE:
+                    done = True
+                    break
+                batch.append(value)
+            if batch:
+                yield batch
+    finally:
+        stop.set()
+
+
+def _collect(results: queue.Queue, ordered: bool, stop: threading.Event,
+             executor: ThreadPoolExecutor) -> Iterator:
+    """Yield the results put by the workers of stream_map, until the feeder
+    reports the number of items"""
+    total = None
+    received = 0
+    next_index = 0
+    buffered = {}
+    try:
+        while total is None or received < total:
+            index, ok, value = results.get()
+            if index is _FEED_DONE:
+                total = value
+                continue
+            if not ok:
+                raise value
+            received += 1
+            if not ordered:
+                yield value
+                continue
+            buffered[index] = value
+            while next_index in buffered:
+                yield buffered.pop(next_index)
+                next_index += 1
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def astream_map(func: Callable[[T], Awaitable[R]], items: AsyncIterable[T],
+                      limit: int) -> AsyncIterator[R]:
+    """Await func for every item of an async iterable, with at most `limit`
+    calls in flight, and yield the results in completion order"""
+    limit = max(1, limit)
+    results: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(limit)
+    tasks: Set[asyncio.Task] = set()
+
+    async def run(item):
+        try:
+            results.put_nowait((True, await func(item)))
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            results.put_nowait((False, exc))
+        finally:
+            slots.release()
+
+    async def feed():
+        submitted = 0
+        try:
+            async for item in items:
+                await slots.acquire()
+                task = asyncio.create_task(run(item))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                submitted += 1
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            results.put_nowait((False, exc))
+        finally:
+            results.put_nowait((_FEED_DONE, submitted))
+
+    feeder = asyncio.create_task(feed())
+    total = None
+    received = 0
+    try:
+        while total is None or received < total:
+            ok, value = await results.get()
+            if ok is _FEED_DONE:
+                total = value
+                continue
+            if not ok:
+                raise value
+            received += 1
+            yield value
+    finally:
+        feeder.cancel()
+        for task in list(tasks):
+            task.cancel()
@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+import requests
+
+from flathunter.abstract_processor import Processor
+from flathunter.async_engine import AsyncEngine, SyncProcessorAdapter
+from flathunter.config import YamlConfig
+from flathunter.crawler.immobilienscout import Immobilienscout
+from flathunter.crawler.kleinanzeigen import Kleinanzeigen
+from flathunter.default_processors import CrawlExposeDetails
+from flathunter.http_client import http_client
+from flathunter.page_cache import page_cache
+from flathunter.processor import ProcessorChain
+
+SEARCH_URL = 'https://www.kleinanzeigen.de/s-wohnung-mieten/berlin/c203l3331'
+RESULTS = ('<html><body><div id="srchrslt-adtable">{}</div><div class="pagination-pages">'
+           '<span class="pagination-current">1</span></div></body></html>').format(''.join(
+    f'<article class="aditem" data-adid="{number}"><a class="ellipsis" href="/s-anzeige/{number}">'
+    f'Flat {number}</a><p class="aditem-main--middle--price-shipping--price">{500 + number} €</p>'
+    f'<p class="aditem-main--middle--tags">50 m² 2 Zi.</p>'
+    f'<div class="aditem-main--top--left">Berlin</div></article>' for number in range(5)))
+DETAILS = ('<html><body><p id="viewad-description-text">Great flat</p>'
+           '<div id="viewad-image"><img src="https://img.example/1.jpg"></div></body></html>')
+
+
+def _body(url):
+    return (DETAILS if 's-anzeige' in url else RESULTS).encode()
+
+
+@pytest.fixture(name='requested')
+def fixture_requested(monkeypatch):
+    requested = []
+
+    async def aget(url, **kwargs):
+        requested.append(('async', url))
+        return httpx.Response(200, content=_body(url), request=httpx.Request('GET', url))
+
+    def get(url, **kwargs):
+        requested.append(('sync', url))
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = _body(url)
+        resp.url = url
+        return resp
+
+    monkeypatch.setattr(http_client, 'aget', aget)
+    monkeypatch.setattr(http_client, 'get', get)
+    page_cache.clear()
+    return requested
+
+
+def _config(**crawl):
+    config = YamlConfig({'urls': [SEARCH_URL], 'engine': 'async', 'crawl': crawl})
+    config.init_searchers()
+    return config
+
+
+class Notifier(Processor):
+    REQUIRES = frozenset({'detail_description'})
+    SIDE_EFFECT = True
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def process_expose(self, expose):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        return expose
+
+
+def _run(config, chain):
+    async def run():
+        engine = AsyncEngine(config, max_threads=4, concurrency=8)
+        return [expose async for expose in engine.run(chain, config.target_urls())]
+    return asyncio.run(run())
+
+
+def test_native_crawler_fetches_on_the_event_loop(requested):
+    config = _config(lazy_details=True)
+    notifier = Notifier()
+    chain = ProcessorChain.planned([CrawlExposeDetails(config), notifier])
+    result = _run(config, chain)
+    assert sorted(expose['id'] for expose in result) == [0, 1, 2, 3, 4]
+    assert all(expose['detail_description'] == 'Great flat' for expose in result)
+    assert all(kind == 'async' for kind, _ in requested)
+    assert len(requested) == 6
+
+
+def test_side_effect_processors_run_one_at_a_time(requested):
+    config = _config(lazy_details=False)
+    notifier = Notifier()
+    _run(config, ProcessorChain([CrawlExposeDetails(config), notifier]))
+    assert notifier.peak == 1
+    assert SyncProcessorAdapter(notifier, None, 8).CONCURRENCY == 1
+
+
+def test_crawls_limited_to_max_workers(monkeypatch):
+    config = _config(max_workers=2)
+    active = peak = 0
+
+    async def acrawl(url, max_pages=None):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return []
+
+    async def run():
+        engine = AsyncEngine(config, max_threads=4, concurrency=8)
+        crawler = engine.crawlers['Kleinanzeigen']
+        monkeypatch.setattr(crawler, 'acrawl', acrawl)
+        urls = [f"{SEARCH_URL}?page={number}" for number in range(6)]
+        return [expose async for expose in engine.crawl(urls)]
+
+    asyncio.run(run())
+    assert peak == 2
+
+
+def test_native_crawler_works_on_sync_engine(requested):
+    crawler = Kleinanzeigen(_config())
+    exposes = crawler.crawl(SEARCH_URL)
+    assert len(exposes) == 5
+    expose = crawler.get_expose_details(exposes[0])
+    assert expose['detail_description'] == 'Great flat'
+    assert expose['detail_photos'] == ['https://img.example/1.jpg']
+    assert all(kind == 'sync' for kind, _ in requested)
+
+
+def test_immobilienscout_async_results(monkeypatch):
+    listing = {'totalResults': 1, 'resultListItems': [{
+        'type': 'EXPOSE_RESULT',
+        'item': {'id': '42', 'title': 'Flat', 'address': {'line': 'Berlin'},
+                 'attributes': [{'value': '900\xa0€'}, {'value': '60\xa0m²'},
+                                {'value': '2\xa0Zi.'}]}}]}
+
+    async def apost(url, **kwargs):
+        return httpx.Response(200, json=listing, request=httpx.Request('POST', url))
+
+    monkeypatch.setattr(http_client, 'apost', apost)
+    crawler = Immobilienscout(_config())
+    url = 'https://www.immobilienscout24.de/Suche/de/berlin/berlin/wohnung-mieten'
+    entries = asyncio.run(crawler.aget_results(url))
+    assert [(entry['id'], entry['price'], entry['size']) for entry in entries] == [(42, '900', '60')]
+
+
+class Passthrough(Processor):
+
+    def process_exposes(self, exposes):
+        yield from exposes
+
+
+def test_bridge_thread_is_joined_when_the_consumer_stops_early():
+    adapter = SyncProcessorAdapter(Passthrough(), None, 8)
+
+    async def exposes():
+        for number in range(100):
+            yield {'id': number}
+            await asyncio.sleep(0)
+
+    async def run():
+        results = adapter.process_exposes(exposes())
+        first = await anext(results)
+        await results.aclose()
+        return first
+
+    assert asyncio.run(run()) == {'id': 0}
+    assert not [thread for thread in threading.enumerate()
+                if thread.name == 'bridge-Passthrough']
+
+
+def test_sync_and_async_paging_stop_at_the_same_page():
+    crawler = Kleinanzeigen(_config(page_concurrency=2))
+    pages = [[{'id': number}] for number in range(6)]
+    stop = lambda page: page[0]['id'] == 3  # pylint: disable=unnecessary-lambda-assignment
+
+    async def afetch(page):
+        return page
+
+    fetched = crawler.fetch_pages(lambda page: page, pages, stop)
+    assert fetched == pages[:3]
+    assert asyncio.run(crawler.afetch_pages(afetch, pages, stop)) == fetched
+    assert crawler.collect_results(None, [{'id': 0}], fetched) == [{'id': 0}, {'id': 1}, {'id': 2}]
@@ -0,0 +1,71 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from flathunter.contactors.auto_contact import AutoContactProcessor
+from flathunter.idmaintainer import MemoryIdMaintainer
+from flathunter.utils.concurrency import ready_batches
+
+
+class RecordingIdMaintainer(MemoryIdMaintainer):
+
+    def __init__(self):
+        super().__init__()
+        self.prefetched = []
+
+    def prefetch_contacted(self, keys):
+        self.prefetched.append(list(keys))
+
+
+def _processor(id_watch):
+    config = SimpleNamespace(auto_contact_dry_run=lambda: True,
+                             auto_contact_delay_min=lambda: 0,
+                             auto_contact_delay_max=lambda: 0)
+    return AutoContactProcessor(config, id_watch)
+
+
+def test_exposes_are_not_held_back_for_a_batch():
+    id_watch = RecordingIdMaintainer()
+    first_done = threading.Event()
+
+    def exposes():
+        yield {'id': 1, 'crawler': 'kleinanzeigen'}
+        # The second expose only arrives once the first has been processed
+        assert first_done.wait(5)
+        yield {'id': 2, 'crawler': 'kleinanzeigen'}
+
+    processed = []
+    for expose in _processor(id_watch).process_exposes(exposes()):
+        processed.append(expose['id'])
+        first_done.set()
+
+    assert processed == [1, 2]
+    assert id_watch.prefetched == [[(1, 'kleinanzeigen')], [(2, 'kleinanzeigen')]]
+
+
+def test_available_exposes_are_prefetched_together():
+    id_watch = RecordingIdMaintainer()
+    exposes = [{'id': number, 'crawler': 'kleinanzeigen'} for number in range(3)]
+    ready = threading.Event()
+
+    def upstream():
+        yield from exposes
+        ready.set()
+
+    batches = ready_batches(upstream(), 2)
+    ready.wait(5)
+    assert [len(batch) for batch in batches] == [2, 1]
+
+    assert [expose['id'] for expose in _processor(id_watch).process_exposes(iter(exposes))] \
+        == [0, 1, 2]
+    assert sum(map(len, id_watch.prefetched)) == 3
+
+
+def test_upstream_errors_are_raised():
+    def upstream():
+        yield 1
+        raise ValueError('broken')
+
+    with pytest.raises(ValueError):
+        list(ready_batches(upstream(), 5))
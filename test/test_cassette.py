@@ -0,0 +1,50 @@
+import gzip
+
+import pytest
+
+from flathunter.cassette import RECORD, REPLAY, Cassette, CassetteMiss, redact_url, request_key
+
+TELEGRAM = "https://api.telegram.org/bot123456:AAH-secret_token/sendMessage"
+GEMINI = "https://generativelanguage.googleapis.com/v1beta/models/gemini:generateContent?key=SECRET"
+GMAPS = ("https://maps.googleapis.com/maps/api/distancematrix/json?origins=Berlin&destinations=Mitte"
+         "&mode=transit&sensor=true&key=SECRET&arrival_time={arrival}")
+
+
+def test_telegram_bot_token_redacted():
+    assert redact_url(TELEGRAM) == "https://api.telegram.org/REDACTED/sendMessage"
+
+
+def test_api_key_redacted():
+    assert 'SECRET' not in redact_url(GEMINI)
+    assert redact_url(GEMINI).endswith('?key=REDACTED')
+
+
+def test_arrival_time_not_in_key():
+    first = request_key('GET', GMAPS.format(arrival='1700000000'), {})
+    second = request_key('GET', GMAPS.format(arrival='1700604800'), {})
+    assert first == second
+    assert 'SECRET' not in first and 'arrival_time' not in first
+
+
+def test_password_in_body_does_not_change_key():
+    first = request_key('POST', 'https://example.com/login', {'json': {'login_password': 'a'}})
+    second = request_key('POST', 'https://example.com/login', {'json': {'login_password': 'b'}})
+    assert first == second
+
+
+def test_record_and_replay_without_credentials(tmp_path):
+    path = str(tmp_path / 'run.cassette.gz')
+    recorder = Cassette(path, RECORD)
+    recorder.record_response('POST', TELEGRAM, {'json': {'text': 'hi'}}, 200, {}, b'{"ok":true}')
+    recorder.record_response('GET', GMAPS.format(arrival='1'), {}, 200, {}, b'{}')
+    recorder.save()
+    with gzip.open(path, 'rt', encoding='utf-8') as cassette_file:
+        recorded = cassette_file.read()
+    assert 'SECRET' not in recorded and 'AAH-secret_token' not in recorded
+
+    player = Cassette(path, REPLAY)
+    other_token = "https://api.telegram.org/bot654321:other/sendMessage"
+    assert player.replay('POST', other_token, {'json': {'text': 'hi'}}).content == b'{"ok":true}'
+    assert player.replay('GET', GMAPS.format(arrival='2'), {}).status_code == 200
+    with pytest.raises(CassetteMiss):
+        player.replay('POST', TELEGRAM, {'json': {'text': 'other'}})
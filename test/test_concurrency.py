@@ -0,0 +1,214 @@
+import itertools
+import queue
+import threading
+import time
+
+import pytest
+import requests
+
+from flathunter.crawl_scheduler import CrawlScheduler
+from flathunter.utils import concurrency
+from flathunter.utils.concurrency import _FEED_DONE, _collect, stream_map, stream_map_keyed
+
+
+class Peak:
+    """Counts the calls running at once, overall and per key"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+
+    def __call__(self, key, seconds=0.01):
+        with self.lock:
+            self.active[key] = self.active.get(key, 0) + 1
+            self.active[None] = self.active.get(None, 0) + 1
+            for name in (key, None):
+                self.peak[name] = max(self.peak.get(name, 0), self.active[name])
+        time.sleep(seconds)
+        with self.lock:
+            self.active[key] -= 1
+            self.active[None] -= 1
+
+
+class RecordingExecutor(concurrency.ThreadPoolExecutor):
+    shutdowns = []
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.shutdowns.append((wait, cancel_futures))
+        super().shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+@pytest.fixture(name='shutdowns')
+def fixture_shutdowns(monkeypatch):
+    RecordingExecutor.shutdowns = []
+    monkeypatch.setattr(concurrency, 'ThreadPoolExecutor', RecordingExecutor)
+    return RecordingExecutor.shutdowns
+
+
+def _slow_first(number):
+    time.sleep(0.05 if number == 0 else 0.001)
+    return number
+
+
+def test_stream_map_keeps_the_input_order_if_ordered():
+    assert list(stream_map(_slow_first, range(5), max_workers=5, ordered=True)) == \
+        [0, 1, 2, 3, 4]
+
+
+def test_stream_map_yields_in_completion_order():
+    results = list(stream_map(_slow_first, range(5), max_workers=5))
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert results[-1] == 0
+
+
+def test_stream_map_caps_the_workers():
+    peak = Peak()
+    list(stream_map(lambda number: peak('all'), range(12), max_workers=3))
+    assert peak.peak[None] <= 3
+
+
+def test_stream_map_keyed_caps_each_key():
+    peak = Peak()
+    items = [('a', number) for number in range(8)] + [('b', number) for number in range(4)]
+    results = list(stream_map_keyed(
+        lambda item: peak(item[0]) or item, items, key=lambda item: item[0],
+        key_limit={'a': 2, 'b': 1}.get, max_workers=4, ordered=True))
+    assert results == items
+    assert peak.peak['a'] <= 2
+    assert peak.peak['b'] == 1
+    assert peak.peak[None] <= 3
+
+
+def test_stream_map_keyed_does_not_hold_up_other_keys():
+    finished = []
+
+    def crawl(item):
+        time.sleep(0.02 if item[0] == 'slow' else 0)
+        finished.append(item)
+        return item
+
+    items = [('slow', number) for number in range(4)] + [('fast', 0)]
+    list(stream_map_keyed(crawl, items, key=lambda item: item[0], key_limit=lambda key: 1,
+                          max_workers=2))
+    assert finished.index(('fast', 0)) < 2
+
+
+def _fail_on_three(number):
+    if number == 3:
+        raise ValueError(number)
+    return number
+
+
+@pytest.mark.parametrize('stream', [
+    lambda func, items: stream_map(func, items, max_workers=2),
+    lambda func, items: stream_map_keyed(func, items, key=lambda item: item % 2,
+                                         key_limit=lambda key: 1, max_workers=2)])
+def test_worker_exceptions_propagate(stream):
+    with pytest.raises(ValueError):
+        list(stream(_fail_on_three, range(6)))
+
+
+@pytest.mark.parametrize('stream', [
+    lambda func, items: stream_map(func, items, max_workers=2),
+    lambda func, items: stream_map_keyed(func, items, key=lambda item: item,
+                                         key_limit=lambda key: 1, max_workers=2)])
+def test_feeder_exceptions_propagate(stream):
+    def items():
+        yield 1
+        raise KeyError('upstream')
+
+    with pytest.raises(KeyError):
+        list(stream(lambda number: number, items()))
+
+
+@pytest.mark.parametrize('stream', [
+    lambda func, items: stream_map(func, items, max_workers=2, thread_name_prefix='early-'),
+    lambda func, items: stream_map_keyed(func, items, key=lambda item: item % 3,
+                                         key_limit=lambda key: 1, max_workers=2,
+                                         thread_name_prefix='early-')])
+def test_early_close_stops_the_feeder_and_the_pool(shutdowns, stream):
+    processed = []
+
+    def work(number):
+        time.sleep(0.001)
+        processed.append(number)
+        return number
+
+    results = stream(work, itertools.count())
+    assert next(results) is not None
+    results.close()
+    assert shutdowns == [(False, True)]
+    for thread in threading.enumerate():
+        if thread.name == 'early-feeder':
+            thread.join(timeout=1)
+            assert not thread.is_alive()
+    # the calls that were running at the close finish, no more are started
+    time.sleep(0.02)
+    count = len(processed)
+    time.sleep(0.02)
+    assert len(processed) == count
+
+
+def test_collect_reorders_and_waits_for_the_total(shutdowns):
+    results = queue.Queue()
+    for entry in [(2, True, 'c'), (_FEED_DONE, True, 3), (0, True, 'a'), (1, True, 'b')]:
+        results.put(entry)
+    stop = threading.Event()
+    assert list(_collect(results, True, stop, RecordingExecutor())) == ['a', 'b', 'c']
+    assert stop.is_set()
+    assert shutdowns == [(False, True)]
+
+
+def test_collect_raises_the_first_failure():
+    results = queue.Queue()
+    results.put((0, True, 'a'))
+    results.put((None, False, RuntimeError('feeder')))
+    stop = threading.Event()
+    collected = _collect(results, False, stop, concurrency.ThreadPoolExecutor())
+    assert next(collected) == 'a'
+    with pytest.raises(RuntimeError):
+        next(collected)
+    assert stop.is_set()
+
+
+class FakeSearcher:
+
+    def __init__(self, peak, fail=None):
+        self.peak = peak
+        self.fail = fail
+
+    def crawl(self, url, max_pages=None):
+        if self.fail is not None:
+            raise self.fail
+        host = url.split('/')[2]
+        self.peak(host, 0.05 if 'slow' in url else 0.01)
+        return [{'url': url}]
+
+
+def test_scheduler_caps_the_crawls_per_host():
+    peak = Peak()
+    searcher = FakeSearcher(peak)
+    jobs = [(searcher, f'https://{host}/search/{number}')
+            for host in ('a.example', 'b.example') for number in range(4)]
+    exposes = list(CrawlScheduler(max_workers=8, per_host_limit=2).run(jobs))
+    assert sorted(expose['url'] for expose in exposes) == sorted(url for _, url in jobs)
+    assert peak.peak['a.example'] <= 2
+    assert peak.peak['b.example'] <= 2
+
+
+def test_scheduler_yields_the_crawls_as_they_finish():
+    searcher = FakeSearcher(Peak())
+    jobs = [(searcher, 'https://a.example/slow'), (searcher, 'https://b.example/fast')]
+    exposes = list(CrawlScheduler(max_workers=2, per_host_limit=1).run(jobs))
+    assert [expose['url'] for expose in exposes] == \
+        ['https://b.example/fast', 'https://a.example/slow']
+
+
+def test_scheduler_skips_failed_crawls():
+    peak = Peak()
+    jobs = [(FakeSearcher(peak, requests.exceptions.ConnectionError()), 'https://a.example/1'),
+            (FakeSearcher(peak, ValueError('broken')), 'https://a.example/2'),
+            (FakeSearcher(peak), 'https://a.example/3')]
+    exposes = list(CrawlScheduler(max_workers=3, per_host_limit=3).run(jobs))
+    assert exposes == [{'url': 'https://a.example/3'}]
@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+from flathunter.detail_cache import DetailCache
+from flathunter.page_cache import CachedPage
+
+
+def _cache(path):
+    cache = DetailCache()
+    cache.configure(SimpleNamespace(detail_cache_path=lambda: str(path),
+                                    detail_cache_max_size=lambda: 1,
+                                    detail_cache_ttl=lambda crawler: 3600))
+    return cache
+
+
+def _stored_size(cache):
+    # pylint: disable=protected-access
+    return cache._db.execute("SELECT COALESCE(SUM(LENGTH(content)), 0) FROM pages").fetchone()[0]
+
+
+def test_size_is_kept_across_inserts_replacements_and_evictions(tmp_path):
+    cache = _cache(tmp_path / 'details.db')
+    for number in range(12):
+        cache.put(f'https://example.com/{number}', 'test', CachedPage('', 200, b'x' * 100_000))
+    cache.put('https://example.com/11', 'test', CachedPage('', 200, b'y' * 50_000))
+
+    assert cache._size == _stored_size(cache)  # pylint: disable=protected-access
+    assert cache._size <= 1024 * 1024  # pylint: disable=protected-access
+    assert cache.get('https://example.com/0', 'test') is None
+    assert cache.get('https://example.com/11', 'test').content == b'y' * 50_000
+
+
+def test_size_is_read_when_opened(tmp_path):
+    cache = _cache(tmp_path / 'details.db')
+    cache.put('https://example.com/1', 'test', CachedPage('', 200, b'x' * 1000))
+    cache.close()
+
+    assert _cache(tmp_path / 'details.db')._size == 1000  # pylint: disable=protected-access
@@ -0,0 +1,93 @@
+from flathunter.expose import Expose
+
+
+def _deferred_expose(calls):
+    expose = Expose({'id': 1, 'price': '500 €', 'size': '50 m²'})
+
+    def load(loaded):
+        calls.append(loaded['id'])
+        loaded['detail_description'] = 'Nice flat'
+        loaded['warmmiete'] = 600.0
+
+    expose.defer({'detail_description', 'detail_photos', 'warmmiete'}, load)
+    return expose
+
+
+def test_defer_does_not_run_loader():
+    calls = []
+    expose = _deferred_expose(calls)
+    assert calls == []
+    assert expose.deferred() == {'detail_description', 'detail_photos', 'warmmiete'}
+    assert expose.loaded() == {'id': 1, 'price': '500 €', 'size': '50 m²'}
+
+
+def test_defer_without_fields_is_noop():
+    expose = Expose({'id': 1})
+    expose.defer([], lambda loaded: None)
+    assert expose.deferred() == frozenset()
+
+
+def test_reading_other_field_does_not_resolve():
+    calls = []
+    expose = _deferred_expose(calls)
+    assert expose['price'] == '500 €'
+    assert 'size' in expose
+    assert expose.get('title') is None
+    assert calls == []
+
+
+def test_getitem_resolves_once():
+    calls = []
+    expose = _deferred_expose(calls)
+    assert expose['detail_description'] == 'Nice flat'
+    assert expose['warmmiete'] == 600.0
+    assert calls == [1]
+    assert expose.deferred() == frozenset()
+
+
+def test_contains_resolves_pending_field():
+    calls = []
+    expose = _deferred_expose(calls)
+    assert 'warmmiete' in expose
+    assert calls == [1]
+
+
+def test_deferred_field_the_loader_did_not_set():
+    calls = []
+    expose = _deferred_expose(calls)
+    assert 'detail_photos' not in expose
+    assert expose.get('detail_photos', []) == []
+    assert calls == [1]
+
+
+def test_resolve_ignores_fields_not_pending():
+    calls = []
+    expose = _deferred_expose(calls)
+    expose.resolve('price')
+    assert calls == []
+    expose.resolve('detail_photos')
+    assert calls == [1]
+
+
+def test_resolve_all():
+    calls = []
+    expose = _deferred_expose(calls)
+    expose.resolve_all()
+    expose.resolve_all()
+    assert calls == [1]
+    assert expose.loaded()['detail_description'] == 'Nice flat'
+
+
+def test_iteration_does_not_resolve():
+    calls = []
+    expose = _deferred_expose(calls)
+    assert set(expose) == {'id', 'price', 'size'}
+    assert calls == []
+
+
+def test_parsed_numbers():
+    expose = Expose({'price': '1.516,50 €', 'size': '50 m²', 'rooms': '2,5'})
+    assert expose.price_value == 1516.5
+    assert expose.size_value == 50
+    assert expose.rooms_value == 2.5
+    assert expose.price_per_sqm == 1516.5 / 50
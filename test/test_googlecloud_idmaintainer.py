@@ -0,0 +1,262 @@
+import datetime
+import operator
+from types import SimpleNamespace
+
+import pytest
+
+from flathunter import googlecloud_idmaintainer
+from flathunter.googlecloud_idmaintainer import GoogleCloudIdMaintainer
+from flathunter.seen_snapshot import LEGACY_MONTH, SeenSnapshot
+
+NOW = datetime.datetime.now(tz=datetime.timezone.utc)
+OLD = NOW - datetime.timedelta(days=100)
+CUTOFF_MONTH = f"{NOW - datetime.timedelta(days=30):%Y-%m}"
+OPERATORS = {'<': operator.lt, '<=': operator.le, '==': operator.eq}
+
+
+class FakeSnapshot:
+
+    def __init__(self, reference, data, fields=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.create_time = reference.created
+        self.update_time = reference.updated
+        self._data = data if fields is None or data is None else {
+            name: value for name, value in data.items() if name in fields}
+
+    def get(self, field):
+        return self._data[field]
+
+    def to_dict(self):
+        return None if self._data is None else dict(self._data)
+
+
+class FakeDocument:
+
+    def __init__(self, database, path, doc_id):
+        self.database = database
+        self.path = path
+        self.id = doc_id
+
+    @property
+    def created(self):
+        return self.database.times.get((self.path, self.id), (None, None))[0]
+
+    @property
+    def updated(self):
+        return self.database.times.get((self.path, self.id), (None, None))[1]
+
+    def get(self):
+        return FakeSnapshot(self, self.database.docs.get(self.path, {}).get(self.id))
+
+    def set(self, data, merge=False):
+        if merge:
+            data = dict(self.database.docs.get(self.path, {}).get(self.id, {}), **data)
+        self.database.write(self.path, self.id, data)
+
+
+class FakeQuery:
+
+    def __init__(self, database, path, filters=(), fields=None):
+        self.database = database
+        self.path = path
+        self.filters = filters
+        self.fields = fields
+
+    def where(self, filter):  # pylint: disable=redefined-builtin
+        return FakeQuery(self.database, self.path, self.filters + (filter,), self.fields)
+
+    def select(self, fields):
+        return FakeQuery(self.database, self.path, self.filters, fields)
+
+    def document(self, doc_id):
+        return FakeDocument(self.database, self.path, doc_id)
+
+    def stream(self):
+        self.database.streamed.append((self.path, tuple(
+            (item.field_path, item.op_string, item.value) for item in self.filters)))
+        for doc_id, data in list(self.database.docs.get(self.path, {}).items()):
+            if all(item.field_path in data
+                   and OPERATORS[item.op_string](data[item.field_path], item.value)
+                   for item in self.filters):
+                yield FakeSnapshot(self.document(doc_id), data, self.fields)
+
+
+class FakeBatch:
+
+    def __init__(self, database):
+        self.database = database
+        self.deletes = []
+
+    def delete(self, ref):
+        self.deletes.append(ref)
+
+    def commit(self):
+        for ref in self.deletes:
+            self.database.docs.get(ref.path, {}).pop(ref.id, None)
+
+
+class FakeFirestore:
+
+    def __init__(self):
+        self.docs = {}
+        self.times = {}
+        self.now = NOW
+        self.streamed = []
+        self.read = []
+        self.writes = []
+
+    def write(self, path, doc_id, data, created=None):
+        self.writes.append((path, doc_id))
+        created = created or self.now
+        self.docs.setdefault(path, {})[doc_id] = dict(data)
+        first = self.times.get((path, doc_id), (created,))[0]
+        self.times[(path, doc_id)] = (first, self.now)
+        self.now += datetime.timedelta(seconds=1)
+
+    def collection(self, path):
+        return FakeQuery(self, path)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, refs, field_paths=None):
+        for ref in refs:
+            self.read.append((ref.path, ref.id))
+            yield FakeSnapshot(ref, self.docs.get(ref.path, {}).get(ref.id), field_paths)
+
+
+@pytest.fixture(name='database')
+def fixture_database(monkeypatch):
+    database = FakeFirestore()
+    monkeypatch.setattr(googlecloud_idmaintainer.firebase_admin, 'initialize_app',
+                        lambda *args, **kwargs: None)
+    monkeypatch.setattr(googlecloud_idmaintainer.credentials, 'ApplicationDefault', lambda: None)
+    monkeypatch.setattr(googlecloud_idmaintainer.firestore, 'client', lambda: database)
+    return database
+
+
+def _maintainer(seen_snapshot=True):
+    return GoogleCloudIdMaintainer(SimpleNamespace(
+        google_cloud_project_id=lambda: 'test',
+        firestore_seen_snapshot=lambda: seen_snapshot,
+        firestore_seen_snapshot_file=lambda: None,
+        firestore_write_behind=lambda: False))
+
+
+def test_compaction_queries_by_month_and_scans_legacy_documents_once(database):
+    database.write('processed', '1', {'id': 1, 'month': f"{OLD:%Y-%m}"}, created=OLD)
+    database.write('processed', '2', {'id': 2, 'month': f"{NOW:%Y-%m}"})
+    database.write('processed', '3', {'id': 3}, created=OLD)
+
+    id_watch = _maintainer()
+    id_watch.apply_retention({'processed': 30})
+
+    assert set(database.docs['processed']) == {'2'}
+    assert ('processed', (('month', '<=', CUTOFF_MONTH),)) in database.streamed
+    assert set(database.docs['processed_archive']) == {f"{OLD:%Y-%m}.0"}
+    assert _maintainer().is_processed(3)
+
+    database.streamed.clear()
+    id_watch.apply_retention({'processed': 30})
+    assert database.streamed == [('processed', (('month', '<=', CUTOFF_MONTH),))]
+
+
+def test_compaction_reads_no_archive_and_snapshot(database):
+    database.write('processed_archive', '2026-01.0', {'month': '2026-01', 'hashes': b'', 'count': 0})
+
+    id_watch = _maintainer()
+    id_watch.apply_retention({'processed': 30})
+    id_watch.close()
+
+    assert ('processed_archive', ()) not in database.streamed
+    assert 'seen_ids' not in database.docs
+
+
+def test_archive_parts_are_merged_into_the_snapshot_once(database):
+    database.write('processed', '1', {'id': 1, 'month': f"{OLD:%Y-%m}"}, created=OLD)
+    _maintainer().apply_retention({'processed': 30})
+
+    id_watch = _maintainer()
+    assert id_watch.is_processed(1)
+    id_watch.close()
+    assert ('processed_archive', f"{OLD:%Y-%m}.0") in database.read
+
+    database.read.clear()
+    id_watch = _maintainer()
+    assert id_watch.is_processed(1)
+    assert not id_watch.is_processed(2)
+    assert ('processed_archive', f"{OLD:%Y-%m}.0") not in database.read
+
+
+def test_list_save_after_enriched_save_is_a_no_op(database):
+    listed = {'id': 1, 'title': 'Flat', 'price': '500', 'crawler': 'Fake'}
+    id_watch = _maintainer()
+    id_watch.save_expose(listed)
+    created_at = database.docs['exposes']['1']['created_at']
+    id_watch.save_expose(dict(listed, price='700', gemini_score=8, durations='10 min',
+                              detail_description='Nice flat'), enriched=True)
+
+    database.writes.clear()
+    id_watch = _maintainer()
+    id_watch.save_expose(listed)
+
+    assert not database.writes
+    stored = database.docs['exposes']['1']
+    assert (stored['price'], stored['gemini_score'], stored['durations']) == ('700', 8, '10 min')
+    assert stored['created_at'] == created_at
+
+
+def test_begin_run_reads_the_saved_fingerprints_again(database):
+    listed = {'id': 1, 'title': 'Flat', 'price': '500', 'crawler': 'Fake'}
+    id_watch = _maintainer()
+    id_watch.save_expose(listed)
+    # removed by another process, e.g. a cleanup job
+    del database.docs['exposes']['1']
+
+    id_watch.save_expose(listed)
+    assert '1' not in database.docs['exposes']
+    id_watch.begin_run()
+    id_watch.save_expose(listed)
+    assert database.docs['exposes']['1']['title'] == 'Flat'
+
+
+def test_snapshot_months_are_saved_in_parts_below_the_document_limit(database):
+    id_watch = _maintainer()
+    seen = id_watch._seen_snapshot()  # pylint: disable=protected-access
+    count = GoogleCloudIdMaintainer.PART_BYTES // 8 + 1000
+    for number in range(count):
+        seen.add(str(number), '2026-01')
+    seen.add('new', '2026-02')
+    id_watch.close()
+
+    docs = database.docs['seen_ids']
+    assert sorted(docs) == ['2026-01.0', '2026-01.1', '2026-02.0']
+    assert all(len(doc['hashes']) <= GoogleCloudIdMaintainer.PART_BYTES < 1024 * 1024 - 1024
+               for doc in docs.values())
+    assert len(docs['2026-01.1']['hashes']) == 1000 * 8
+
+    database.read.clear()
+    id_watch = _maintainer()
+    assert id_watch.is_processed(0) and id_watch.is_processed(count - 1)
+    assert not [path for path, _ in database.read if path == 'processed']
+
+    # only the month with a new ID is written again
+    database.writes.clear()
+    id_watch.mark_processed(count)
+    id_watch.close()
+    assert sorted(doc_id for path, doc_id in database.writes if path == 'seen_ids') == \
+        [f"{NOW:%Y-%m}.0"]
+
+
+def test_legacy_snapshot_shards_are_saved_by_month(database):
+    old = SeenSnapshot()
+    old.add('7')
+    database.write('seen_ids', 'processed-0', {'hashes': old.to_bytes()})
+
+    id_watch = _maintainer()
+    assert id_watch.is_processed(7)
+    id_watch.close()
+    assert sorted(database.docs['seen_ids']) == [f"{LEGACY_MONTH}.0"]
+    assert _maintainer().is_processed(7)
@@ -0,0 +1,137 @@
+import json
+
+from flathunter.abstract_processor import Processor
+from flathunter.expose import Expose
+from flathunter.idmaintainer import ExposeRecord, MemoryIdMaintainer, SqliteIdMaintainer, \
+    StoredExpose, decompress_fields
+from flathunter.processor import ProcessorChain, SaveAllExposesProcessor, \
+    SaveEnrichedExposesProcessor
+
+LISTED = {'id': 1, 'title': 'Flat', 'price': '500 €', 'crawler': 'Fake'}
+DETAILS = {'detail_description': 'Nice flat', 'detail_photos': ['a.jpg']}
+ENRICHED = dict(LISTED, price='700 €', gemini_score=8, durations='10 min', **DETAILS)
+
+
+def test_record_splits_heavy_fields():
+    record = ExposeRecord.of(dict(LISTED, **DETAILS))
+    assert record.fields == LISTED
+    assert record.heavy == DETAILS
+    assert record.heavy_fingerprint is not None
+
+
+def test_record_without_heavy_fields():
+    record = ExposeRecord.of(LISTED)
+    assert record.heavy == {}
+    assert record.heavy_fingerprint is None
+
+
+def test_record_does_not_load_deferred_fields():
+    expose = Expose(LISTED)
+    expose.defer({'detail_description'}, lambda loaded: loaded.update(DETAILS))
+    record = ExposeRecord.of(expose)
+    assert record.heavy == {}
+    assert expose.deferred() == {'detail_description'}
+
+
+def test_changes_of_new_expose():
+    assert ExposeRecord.of(LISTED).changes(None) == (True, False)
+    assert ExposeRecord.of(dict(LISTED, **DETAILS)).changes(None) == (True, True)
+
+
+def test_changes_of_unchanged_expose():
+    record = ExposeRecord.of(dict(LISTED, **DETAILS))
+    assert record.changes((record.fingerprint, record.heavy_fingerprint)) == (False, False)
+
+
+def test_changes_of_listed_fields():
+    stored = ExposeRecord.of(dict(LISTED, **DETAILS))
+    record = ExposeRecord.of(dict(LISTED, price='600 €', **DETAILS))
+    assert record.changes((stored.fingerprint, stored.heavy_fingerprint)) == (True, False)
+
+
+def test_changes_of_heavy_fields():
+    stored = ExposeRecord.of(dict(LISTED, **DETAILS))
+    record = ExposeRecord.of(dict(LISTED, detail_description='Renovated', detail_photos=['a.jpg']))
+    assert record.changes((stored.fingerprint, stored.heavy_fingerprint)) == (True, True)
+
+
+def test_missing_heavy_fields_are_no_change():
+    stored = ExposeRecord.of(dict(LISTED, **DETAILS))
+    record = ExposeRecord.of(LISTED)
+    assert record.changes((stored.fingerprint, stored.heavy_fingerprint)) == (False, False)
+
+
+def test_heavy_fields_added_later():
+    stored = ExposeRecord.of(LISTED)
+    record = ExposeRecord.of(dict(LISTED, **DETAILS))
+    assert record.changes((stored.fingerprint, stored.heavy_fingerprint)) == (True, True)
+
+
+def test_memory_save_keeps_details_of_later_save():
+    id_watch = MemoryIdMaintainer()
+    id_watch.save_expose(LISTED)
+    id_watch.save_expose(dict(LISTED, **DETAILS))
+    id_watch.save_expose(LISTED)
+    assert id_watch.exposes['1']['detail_description'] == 'Nice flat'
+
+
+def test_sqlite_save_stores_details_apart(tmp_path):
+    id_watch = SqliteIdMaintainer(str(tmp_path / 'flathunter.db'))
+    id_watch.save_expose(LISTED)
+    assert id_watch._query("SELECT COUNT(*) FROM expose_details")[0] == 0
+    id_watch.save_expose(dict(LISTED, **DETAILS))
+    data = id_watch._query("SELECT data FROM expose_details WHERE id = '1'")[0]
+    assert decompress_fields(data) == DETAILS
+
+
+def test_chain_saves_details_added_after_first_save():
+    class AddDetails(Processor):
+        def process_expose(self, expose):
+            expose.update(DETAILS)
+            return expose
+
+    id_watch = MemoryIdMaintainer()
+    chain = ProcessorChain([SaveAllExposesProcessor(None, id_watch), AddDetails(),
+                            SaveEnrichedExposesProcessor(None, id_watch)])
+    list(chain.process([Expose(LISTED)]))
+    assert id_watch.exposes['1']['detail_photos'] == ['a.jpg']
+
+
+def test_update_of_list_fields_leaves_out_enriched_fields():
+    listed = ExposeRecord.of(LISTED)
+    enriched = ExposeRecord.of(ENRICHED).update(listed.update(None).stored, enriched=True)
+    assert enriched.fields['price'] == '700 €'
+    assert ExposeRecord.of(LISTED).update(enriched.stored) is None
+    stored = StoredExpose(enriched.stored.fingerprint, enriched.stored.heavy_fingerprint,
+                          enriched.stored.enriched_fields - {'title'})
+    assert ExposeRecord.of(dict(LISTED, title='Renamed')).update(stored).fields == \
+        {'title': 'Renamed'}
+
+
+def test_memory_list_save_does_not_overwrite_enriched_save():
+    id_watch = MemoryIdMaintainer()
+    id_watch.save_expose(LISTED)
+    created_at = id_watch.exposes['1']['created_at']
+    id_watch.save_expose(ENRICHED, enriched=True)
+    id_watch.save_expose(LISTED)
+    saved = id_watch.exposes['1']
+    assert (saved['price'], saved['gemini_score'], saved['durations']) == ('700 €', 8, '10 min')
+    assert saved['created_at'] == created_at
+
+
+def test_sqlite_list_save_after_enriched_save_is_a_no_op(tmp_path):
+    path = str(tmp_path / 'flathunter.db')
+    id_watch = SqliteIdMaintainer(path)
+    id_watch.save_expose(LISTED)
+    created_at = id_watch._query("SELECT created_at FROM exposes")[0]
+    id_watch.save_expose(ENRICHED, enriched=True)
+    id_watch.close()
+
+    id_watch = SqliteIdMaintainer(path)
+    changes = id_watch._db.total_changes
+    id_watch.save_expose(LISTED)
+    assert id_watch._db.total_changes == changes
+    created, details = id_watch._query("SELECT created_at, details FROM exposes")
+    assert created == created_at
+    assert json.loads(details)['price'] == '700 €'
+    assert json.loads(details)['gemini_score'] == 8
@@ -0,0 +1,96 @@
+import threading
+
+from flathunter.abstract_processor import COST_FETCH, Processor
+from flathunter.default_processors import CrawlExposeDetails, LoadDeferredDetails
+from flathunter.expose import Expose
+from flathunter.processor import ProcessorChain, plan_stages
+
+
+class FakeSearcher:
+    def __init__(self, name='Fake', fields=frozenset({'detail_description', 'detail_photos'})):
+        self.name = name
+        self.DETAIL_FIELDS = fields
+        self.fetched = []
+        self.threads = set()
+
+    def get_name(self):
+        return self.name
+
+    def detail_concurrency(self):
+        return 2
+
+    def get_expose_details(self, expose):
+        self.fetched.append(expose['id'])
+        self.threads.add(threading.current_thread().name)
+        expose['detail_description'] = f"Description {expose['id']}"
+        if 'warmmiete' in self.DETAIL_FIELDS:
+            expose['warmmiete'] = 900.0
+        return expose
+
+
+class FakeConfig:
+    def __init__(self, searchers, lazy=True):
+        self.searchers = {searcher.get_name(): searcher for searcher in searchers}
+        self.lazy = lazy
+
+    def searcher_for_name(self, name):
+        return self.searchers.get(name)
+
+    def crawl_lazy_details(self):
+        return self.lazy
+
+    def crawl_detail_workers(self):
+        return 4
+
+    def crawl_detail_ordered(self):
+        return True
+
+
+class DropOdd(Processor):
+    REQUIRES = frozenset({'id'})
+    FILTER = True
+
+    def process_exposes(self, exposes):
+        return (expose for expose in exposes if expose['id'] % 2 == 0)
+
+
+class ReadsDescription(Processor):
+    COST = COST_FETCH
+    REQUIRES = frozenset({'detail_description'})
+    SIDE_EFFECT = True
+
+
+def _exposes(crawler='Fake', count=6):
+    return [Expose({'id': number, 'crawler': crawler}) for number in range(count)]
+
+
+def test_loader_stage_before_first_stage_needing_details():
+    details = CrawlExposeDetails(FakeConfig([FakeSearcher()]))
+    stages = plan_stages([details, DropOdd(), ReadsDescription()])
+    names = [type(stage.processor).__name__ for stage in stages]
+    assert names == ['DropOdd', 'CrawlExposeDetails', 'LoadDeferredDetails', 'ReadsDescription']
+
+
+def test_no_loader_stage_without_lazy_details():
+    details = CrawlExposeDetails(FakeConfig([FakeSearcher()], lazy=False))
+    stages = plan_stages([details, ReadsDescription()])
+    assert not any(isinstance(stage.processor, LoadDeferredDetails) for stage in stages)
+
+
+def test_details_only_fetched_for_exposes_reaching_the_stage():
+    searcher = FakeSearcher()
+    details = CrawlExposeDetails(FakeConfig([searcher]))
+    chain = ProcessorChain([details, DropOdd(), details.load_deferred(), ReadsDescription()])
+    result = list(chain.process(_exposes()))
+    assert [expose['id'] for expose in result] == [0, 2, 4]
+    assert sorted(searcher.fetched) == [0, 2, 4]
+    assert all(name.startswith('details') for name in searcher.threads)
+    assert all(not expose.deferred() for expose in result)
+
+
+def test_warmmiete_on_detail_page_is_fetched_right_away():
+    searcher = FakeSearcher(fields=frozenset({'detail_description', 'warmmiete'}))
+    details = CrawlExposeDetails(FakeConfig([searcher]))
+    result = list(details.process_exposes(_exposes(count=3)))
+    assert sorted(searcher.fetched) == [0, 1, 2]
+    assert all(expose.loaded()['price'] == '900' for expose in result)
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+import httpx
+import requests
+
+from flathunter.config import YamlConfig
+from flathunter.crawler.howoge import Howoge
+from flathunter.crawler.immobilienscout import Immobilienscout
+from flathunter.page_cache import page_cache
+
+HOWOGE_URL = 'https://www.howoge.de/wohnungssuche.html?tx_howrealestate_json_list[limit]=10'
+
+
+def _config(**crawl):
+    config = YamlConfig({'urls': [], 'crawl': crawl})
+    config.init_searchers()
+    return config
+
+
+def _json_response(url, data):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps(data).encode()  # pylint: disable=protected-access
+    response.url = url
+    return response
+
+
+def _howoge(monkeypatch, config, total=45):
+    crawler = Howoge(config)
+    pages = []
+
+    def post(url, data=None, **kwargs):
+        page = int(data.split('%5Bpage%5D=')[1].split('&')[0])
+        pages.append(page)
+        return _json_response(url, {'immocount': total, 'immoobjects': [
+            {'uid': page * 100 + number, 'link': f'/wohnung/{page}-{number}'}
+            for number in range(10)]})
+
+    monkeypatch.setattr('flathunter.crawler.howoge.http_client.post', post)
+    page_cache.clear()
+    return crawler, pages
+
+
+def test_howoge_crawls_the_first_page_by_default(monkeypatch):
+    crawler, pages = _howoge(monkeypatch, _config())
+    crawler.get_results(HOWOGE_URL)
+    assert pages == [1]
+
+
+def test_howoge_honours_max_pages(monkeypatch):
+    crawler, pages = _howoge(monkeypatch, _config(max_pages=3))
+    crawler.get_results(HOWOGE_URL)
+    assert sorted(pages) == [1, 2, 3]
+
+    crawler, pages = _howoge(monkeypatch, _config(max_pages=3))
+    crawler.get_results(HOWOGE_URL, max_pages=2)
+    assert sorted(pages) == [1, 2]
+
+
+IMMOSCOUT_URL = 'https://www.immobilienscout24.de/Suche/de/berlin/berlin/wohnung-mieten'
+
+
+def _immoscout_listing(page_no, total=120):
+    return {'totalResults': total, 'resultListItems': [{
+        'type': 'EXPOSE_RESULT',
+        'item': {'id': str(page_no * 100 + number), 'title': 'Flat',
+                 'address': {'line': 'Berlin'}, 'attributes': [{'value': '900\xa0€'}]}}
+        for number in range(3)]}
+
+
+def _page_no(url):
+    return int(url.split('pagenumber=')[1].split('&')[0])
+
+
+def test_immoscout_fetches_every_page_up_to_max_pages(monkeypatch):
+    pages = []
+
+    def post(url, **kwargs):
+        pages.append(_page_no(url))
+        return _json_response(url, _immoscout_listing(_page_no(url)))
+
+    monkeypatch.setattr('flathunter.crawler.immobilienscout.http_client.post', post)
+    page_cache.clear()
+    entries = Immobilienscout(_config(max_pages=5)).get_results(IMMOSCOUT_URL)
+    # 120 results are three pages of 50
+    assert sorted(pages) == [1, 2, 3]
+    assert len(entries) == 9
+
+
+def test_immoscout_fetches_the_pages_concurrently_on_the_async_engine(monkeypatch):
+    pages = []
+
+    async def apost(url, **kwargs):
+        pages.append(_page_no(url))
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json=_immoscout_listing(_page_no(url)),
+                              request=httpx.Request('POST', url))
+
+    monkeypatch.setattr('flathunter.crawler.immobilienscout.http_client.apost', apost)
+    page_cache.clear()
+    crawler = Immobilienscout(_config(max_pages=2, result_limit=500))
+    entries = asyncio.run(crawler.aget_results(IMMOSCOUT_URL))
+    assert sorted(pages) == [1, 2]
+    assert len(entries) == 6
+
+
+def test_immoscout_result_limit_caps_the_pages():
+    crawler = Immobilienscout(_config(max_pages=10, result_limit=120))
+    assert crawler.get_last_page(1000, None) == 3
+    assert Immobilienscout(_config()).get_last_page(1000, None) == 1
+
+
+def test_api_crawlers_skip_unchanged_pages_with_the_configured_page_limit(monkeypatch):
+    skipped = []
+
+    def fetch_page(self, url, state_key=None, request=None, skip_unchanged=True):
+        skipped.append(skip_unchanged)
+
+    monkeypatch.setattr(Howoge, 'fetch_page', fetch_page)
+    monkeypatch.setattr(Immobilienscout, 'fetch_page', fetch_page)
+    for config, expected in ((_config(), True), (_config(max_pages=3), False)):
+        skipped.clear()
+        Howoge(config).get_results(HOWOGE_URL)
+        Immobilienscout(config).get_results(IMMOSCOUT_URL)
+        assert skipped == [expected, expected]
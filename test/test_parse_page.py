@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import requests
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from flathunter.abstract_crawler import Crawler, page_encoding
+from flathunter.extractors import Extractor
+
+
+def _response(content, content_type='text/html'):
+    resp = requests.Response()
+    resp._content = content
+    resp.headers['Content-Type'] = content_type
+    resp.status_code = 200
+    return resp
+
+
+class FakeCrawler(Crawler):
+    EXTRACTOR = Extractor('div.result')
+
+    def __init__(self, parser='lxml'):
+        self.config = SimpleNamespace(crawl_parser=lambda: parser)
+
+
+def test_encoding_from_header():
+    assert page_encoding(_response(b'', 'text/html; charset=ISO-8859-1')) == 'iso8859-1'
+
+
+def test_encoding_from_meta_charset():
+    content = b'<html><head><meta charset="windows-1252"></head></html>'
+    assert page_encoding(_response(content)) == 'cp1252'
+
+
+def test_encoding_from_meta_http_equiv():
+    content = (b'<html><head><meta http-equiv="Content-Type" '
+               b'content="text/html; charset=iso-8859-15"></head></html>')
+    assert page_encoding(_response(content)) == 'iso8859-15'
+
+
+def test_encoding_defaults_to_utf8():
+    assert page_encoding(_response(b'<html></html>')) == 'utf-8'
+    assert page_encoding(_response(b'', 'text/html; charset=bogus')) == 'utf-8'
+
+
+def test_lxml_tree_decoded_with_meta_charset():
+    content = '<html><head><meta charset="iso-8859-1"></head><body><div>Straße</div></body></html>'
+    tree = FakeCrawler().parse_page(_response(content.encode('iso-8859-1')))
+    assert isinstance(tree, etree._Element)
+    assert tree.xpath('string(//div)') == 'Straße'
+
+
+def test_whitespace_body_is_not_parsed_with_lxml():
+    page = FakeCrawler().parse_page(_response(b'  \n  '))
+    assert isinstance(page, BeautifulSoup)
+    assert page.select('div') == []
+
+
+def test_bs4_parser_parses_the_whole_page():
+    content = b'<html><body><div class="result">A</div><div class="ad">B</div></body></html>'
+    soup = FakeCrawler(parser='bs4').parse_page(_response(content))
+    assert isinstance(soup, BeautifulSoup)
+    assert [div.get_text() for div in soup.select('div')] == ['A', 'B']
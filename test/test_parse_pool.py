@@ -0,0 +1,89 @@
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+import requests
+
+from flathunter.config import YamlConfig
+from flathunter.parse_pool import ParsePool
+
+SEARCH_URL = 'https://www.kleinanzeigen.de/s-wohnung-mieten/berlin/c203l3331'
+RESULTS = ('<html><head><meta charset="windows-1252"></head><body>'
+           '<div id="srchrslt-adtable">{}</div><div class="pagination-pages"><span class="pagination-current">1</span>'
+           '<a class="pagination-page" href="/s-wohnung-mieten/berlin/seite:2/c203l3331">2</a>'
+           '</div></body></html>').format(''.join(
+    f'<article class="aditem" data-adid="{number}"><a class="ellipsis" href="/s-anzeige/{number}">'
+    f'Wohnung {number} in Köpenick</a>'
+    f'<p class="aditem-main--middle--price-shipping--price">{500 + number} €</p>'
+    f'<p class="aditem-main--middle--tags">50 m² 2 Zi.</p>'
+    f'<div class="aditem-main--top--left">Berlin</div></article>' for number in range(5)))
+
+
+def _response():
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = RESULTS.encode('cp1252')  # pylint: disable=protected-access
+    resp.url = SEARCH_URL
+    return resp
+
+
+def _crawler(config):
+    return next(searcher for searcher in config.searchers()
+                if searcher.get_name() == 'Kleinanzeigen')
+
+
+@pytest.fixture(name='pool')
+def fixture_pool():
+    config = YamlConfig({'urls': [SEARCH_URL], 'crawl': {'parse_processes': 1, 'max_pages': 3}})
+    config.init_searchers()
+    pool = ParsePool()
+    pool.configure(config)
+    yield pool, _crawler(config)
+    pool.close()
+
+
+def test_pool_extracts_what_is_extracted_inline(pool):
+    pool, crawler = pool
+    assert pool.enabled
+    inline = crawler.extract_page(_response(), SEARCH_URL, 3)
+    assert inline[0][0]['title'] == 'Wohnung 0 in Köpenick'
+    assert inline[1]
+    assert pool.extract_page(crawler, _response(), SEARCH_URL, 3) == inline
+    assert pool.extract_page(crawler, _response()) == crawler.extract_page(_response())
+
+
+def test_pool_falls_back_to_inline_parsing(pool, monkeypatch):
+    pool, crawler = pool
+    inline = crawler.extract_page(_response(), SEARCH_URL, 3)
+
+    def broken(*args, **kwargs):
+        raise BrokenProcessPool('worker died')
+
+    monkeypatch.setattr(pool._executor, 'submit', broken)  # pylint: disable=protected-access
+    assert pool.extract_page(crawler, _response(), SEARCH_URL, 3) == inline
+    monkeypatch.undo()
+
+    # a pool that was shut down under the caller
+    pool._executor.shutdown()  # pylint: disable=protected-access
+    assert pool.extract_page(crawler, _response(), SEARCH_URL, 3) == inline
+
+
+def test_close_stops_the_workers(pool):
+    pool, crawler = pool
+    pool.extract_page(crawler, _response())
+    processes = list(pool._executor._processes.values())  # pylint: disable=protected-access
+    assert processes
+    pool.close()
+    assert not pool.enabled
+    assert not any(process.is_alive() for process in processes)
+    # without workers, pages are parsed in the calling thread
+    assert pool.extract_page(crawler, _response()) == crawler.extract_page(_response())
+
+
+def test_pool_is_disabled_without_processes():
+    config = YamlConfig({'urls': [SEARCH_URL]})
+    config.init_searchers()
+    pool = ParsePool()
+    pool.configure(config)
+    assert not pool.enabled
+    crawler = _crawler(config)
+    assert pool.extract_page(crawler, _response()) == crawler.extract_page(_response())
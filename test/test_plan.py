@@ -0,0 +1,92 @@
+from flathunter.abstract_processor import COST_API, COST_FETCH, COST_LLM, COST_STORE, Processor
+from flathunter.idmaintainer import MemoryIdMaintainer
+from flathunter.processor import ProcessorChain, SaveAllExposesProcessor, \
+    SaveEnrichedExposesProcessor, Stage, _hoist_position, plan_stages
+
+
+def stage(name, cost=0, requires=(), provides=(), side_effect=False, is_filter=False,
+          precheck=False):
+    """A processor class with the given planning hints"""
+    return type(name, (Processor,), {
+        'COST': cost, 'REQUIRES': frozenset(requires), 'PROVIDES': frozenset(provides),
+        'SIDE_EFFECT': side_effect, 'FILTER': is_filter, 'PRECHECK': precheck})()
+
+
+def _order(stages):
+    return [type(stage.processor).__name__ for stage in stages]
+
+
+def test_cheap_filter_runs_before_costlier_stages():
+    stages = plan_stages([stage('Details', COST_FETCH, provides={'detail_description'}),
+                          stage('Durations', COST_API, provides={'durations'}),
+                          stage('PriceFilter', requires={'price'}, is_filter=True)])
+    assert _order(stages) == ['PriceFilter', 'Details', 'Durations']
+    assert stages[0].note == 'moved before Details'
+
+
+def test_filter_stays_after_the_stage_providing_its_fields():
+    stages = plan_stages([stage('Details', COST_FETCH, provides={'warmmiete'}),
+                          stage('Durations', COST_API, provides={'durations'}),
+                          stage('RentFilter', requires={'warmmiete'}, is_filter=True)])
+    assert _order(stages) == ['Details', 'RentFilter', 'Durations']
+
+
+def test_filter_does_not_pass_stages_of_lower_or_equal_cost():
+    stages = plan_stages([stage('Geocode', COST_API, provides={'address'}),
+                          stage('Durations', COST_API, provides={'durations'}),
+                          stage('CostlyFilter', COST_API, is_filter=True)])
+    assert _order(stages) == ['Geocode', 'Durations', 'CostlyFilter']
+
+
+def test_filters_keep_their_relative_order():
+    stages = plan_stages([stage('Score', COST_LLM, provides={'score'}),
+                          stage('First', requires={'price'}, is_filter=True),
+                          stage('Second', requires={'size'}, is_filter=True)])
+    assert _order(stages) == ['First', 'Second', 'Score']
+
+
+def test_precheck_also_runs_ahead_of_its_provider():
+    stages = plan_stages([stage('Details', COST_FETCH, provides={'price'}),
+                          stage('Durations', COST_API, provides={'durations'}),
+                          stage('PriceFilter', requires={'price'}, is_filter=True,
+                                precheck=True)])
+    assert _order(stages) == ['PriceFilter', 'Details', 'PriceFilter', 'Durations']
+    assert stages[0].processor is stages[2].processor
+    assert stages[0].note == 'precheck on list-page data, before Details'
+
+
+def test_filters_are_never_hoisted_before_side_effects():
+    stages = plan_stages([stage('Notify', COST_FETCH, side_effect=True),
+                          stage('Durations', COST_API, provides={'durations'}),
+                          stage('PriceFilter', requires={'price'}, is_filter=True,
+                                precheck=True)])
+    assert _order(stages) == ['Notify', 'PriceFilter', 'Durations']
+
+
+def test_side_effect_filters_keep_their_place():
+    stages = plan_stages([stage('Durations', COST_API, provides={'durations'}),
+                          stage('Contact', is_filter=True, side_effect=True)])
+    assert _order(stages) == ['Durations', 'Contact']
+
+
+def test_hoist_position():
+    stages = [Stage(stage('Save', COST_STORE, side_effect=True)),
+              Stage(stage('Details', COST_FETCH, provides={'price'})),
+              Stage(stage('Durations', COST_API, provides={'durations'}))]
+    price_filter = stage('PriceFilter', requires={'price'}, is_filter=True)
+    assert _hoist_position(stages, price_filter, precheck=False) == 2
+    assert _hoist_position(stages, price_filter, precheck=True) == 1
+    assert _hoist_position(stages[:1], price_filter, precheck=True) == 1
+    assert _hoist_position([], price_filter, precheck=False) == 0
+
+
+def test_save_stages_are_cheaper_than_fetches_and_stay_in_place():
+    id_watch = MemoryIdMaintainer()
+    save = SaveAllExposesProcessor(None, id_watch)
+    save_enriched = SaveEnrichedExposesProcessor(None, id_watch)
+    assert save.COST == save_enriched.COST == COST_STORE < COST_FETCH
+    chain = ProcessorChain.planned([
+        save, stage('Details', COST_FETCH, provides={'detail_description'}),
+        stage('PriceFilter', requires={'price'}, is_filter=True), save_enriched])
+    assert [type(processor).__name__ for processor in chain.processors] == \
+        ['SaveAllExposesProcessor', 'PriceFilter', 'Details', 'SaveEnrichedExposesProcessor']
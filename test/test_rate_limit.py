@@ -0,0 +1,103 @@
+import io
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from flathunter import rate_limit
+from flathunter.http_client import HttpClient
+from flathunter.rate_limit import HostLimiter, HostPolicy, retries_method
+
+
+@pytest.fixture(name='clock')
+def fixture_clock(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(rate_limit, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_bucket_refills_at_the_rate(clock):
+    limiter = HostLimiter('example.com', HostPolicy(rate=4, burst=2, concurrency=8))
+    assert limiter._try_acquire() == 0  # pylint: disable=protected-access
+    assert limiter._try_acquire() == 0  # pylint: disable=protected-access
+    assert limiter._try_acquire() == 0.25  # pylint: disable=protected-access
+    clock.now += 0.25
+    assert limiter._try_acquire() == 0  # pylint: disable=protected-access
+
+
+def test_concurrency_is_capped_by_the_limit(clock):
+    limiter = HostLimiter('example.com', HostPolicy(burst=10, concurrency=2))
+    limiter.acquire()
+    limiter.acquire()
+    assert limiter._try_acquire() is None  # pylint: disable=protected-access
+    limiter.release(200)
+    assert limiter._try_acquire() == 0  # pylint: disable=protected-access
+    assert clock.now == 100.0
+
+
+@pytest.mark.parametrize('status', sorted(rate_limit.THROTTLE_STATUSES) + [500, 503])
+def test_throttling_halves_the_limit(clock, status):
+    limiter = HostLimiter('example.com', HostPolicy(concurrency=8))
+    limiter.acquire()
+    pause = limiter.release(status)
+    assert limiter.limit == 4
+    assert pause == (2.0 if status == 429 else 0.0)
+
+
+def test_backoff_grows_with_repeated_429_and_honours_retry_after(clock):
+    limiter = HostLimiter('example.com', HostPolicy(concurrency=8, max_retry_after=60))
+    limiter.acquire()
+    assert limiter.release(429) == 2.0
+    clock.now += 2
+    limiter.acquire()
+    assert limiter.release(429) == 4.0
+    clock.now += 4
+    limiter.acquire()
+    assert limiter.release(429, retry_after=7) == 7
+    assert limiter.limit == 1
+    assert limiter._try_acquire() == pytest.approx(7)  # pylint: disable=protected-access
+
+
+def test_success_grows_the_limit_up_to_the_maximum(clock):
+    limiter = HostLimiter('example.com', HostPolicy(concurrency=1, max_concurrency=2, burst=100))
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(200)
+    assert limiter.limit == 2
+
+
+def test_retry_decision():
+    limiter = HostLimiter('example.com', HostPolicy(retries=2, max_retry_after=60))
+    assert limiter.should_retry(429, 0, 0)
+    assert limiter.should_retry(503, 30, 1)
+    assert not limiter.should_retry(503, 0, 2)
+    assert not limiter.should_retry(500, 0, 0)
+    assert not limiter.should_retry(429, 61, 0)
+    assert retries_method('GET') and retries_method('head')
+    assert not retries_method('POST')
+    assert retries_method('POST', retry=True)
+    assert not retries_method('GET', retry=False)
+
+
+class UnavailableSession:
+
+    def __init__(self):
+        self.sent = 0
+
+    def request(self, method, url, **kwargs):
+        self.sent += 1
+        response = requests.Response()
+        response.status_code = 503
+        response.raw = io.BytesIO(b'')
+        response.url = url
+        return response
+
+
+@pytest.mark.parametrize('method, retry, sent', [
+    ('GET', None, 3), ('POST', None, 1), ('POST', True, 3), ('GET', False, 1)])
+def test_only_idempotent_requests_are_retried(method, retry, sent):
+    session = UnavailableSession()
+    response = HttpClient().request(method, 'https://retry.example.com/', session=session,
+                                    retry=retry)
+    assert response.status_code == 503
+    assert session.sent == sent
@@ -0,0 +1,50 @@
+from flathunter.seen_snapshot import LEGACY_MONTH, MonthlySeenSnapshot, SeenSnapshot
+
+
+def test_lookups_cover_every_month():
+    seen = MonthlySeenSnapshot()
+    seen.add('1', '2026-01')
+    seen.add('2', '2026-02')
+    seen.add('1', '2026-02')
+    assert '1' in seen and '2' in seen and '3' not in seen
+    assert len(seen) == 2
+    assert seen.dirty_months() == ['2026-01', '2026-02']
+
+
+def test_parts_split_a_month_at_whole_hashes():
+    seen = MonthlySeenSnapshot()
+    for number in range(10):
+        seen.add(str(number), '2026-01')
+    parts = seen.parts('2026-01', 30)
+    assert [len(part) for part in parts] == [24, 24, 24, 8]
+    assert seen.dirty_months() == []
+    assert seen.parts('2026-03', 30) == [b'']
+
+
+def test_file_round_trips_the_months(tmp_path):
+    path = str(tmp_path / 'seen.bin')
+    seen = MonthlySeenSnapshot()
+    seen.add('1', '2026-01')
+    seen.add('2', '2026-02')
+    seen.save_file(path)
+
+    other = MonthlySeenSnapshot()
+    other.add('3', '2026-02')
+    other.save_file(path)
+
+    loaded = MonthlySeenSnapshot()
+    loaded.load_file(path)
+    assert all(doc_id in loaded for doc_id in '123')
+    assert '2' in loaded.month('2026-02') and '1' not in loaded.month('2026-02')
+
+
+def test_flat_file_is_loaded_into_the_legacy_month(tmp_path):
+    path = tmp_path / 'seen.bin'
+    flat = SeenSnapshot()
+    flat.add('1')
+    path.write_bytes(flat.to_bytes())
+
+    seen = MonthlySeenSnapshot()
+    seen.load_file(str(path))
+    assert '1' in seen.month(LEGACY_MONTH)
+    assert seen.dirty_months() == [LEGACY_MONTH]
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+from bs4 import BeautifulSoup
+
+from flathunter.contactors import wggesucht
+from flathunter.contactors.wggesucht import WgGesuchtContactor
+
+LISTING = ('<input name="ad_type" value="0"><input name="ad_id" value="123">'
+           '<input name="csrf_token" value="ANONYMOUS"><input name="user_id" value="">')
+HOMEPAGE = b'<html><head><meta name="csrf-token" content="SESSION"></head></html>'
+
+
+def _contactor(monkeypatch, cached_page):
+    requested = []
+
+    def get(url, session=None, timeout=None):
+        requested.append(url)
+        return SimpleNamespace(content=HOMEPAGE)
+
+    monkeypatch.setattr(wggesucht.http_client, 'get', get)
+    monkeypatch.setattr(wggesucht.page_cache, 'get', lambda url: cached_page)
+    config = SimpleNamespace(auto_contact_wg_gesucht=lambda: {})
+    contactor = WgGesuchtContactor(config)
+    contactor._user_id = '9'
+    return contactor, requested
+
+
+def test_session_tokens_not_taken_from_cached_page(monkeypatch):
+    page = SimpleNamespace(soup=BeautifulSoup(LISTING, 'lxml'))
+    contactor, requested = _contactor(monkeypatch, page)
+    tokens = contactor._get_form_tokens('https://www.wg-gesucht.de/wohnung.123.html')
+    assert tokens == {'ad_type': '0', 'ad_id': '123', 'user_id': '9', 'csrf_token': 'SESSION'}
+    assert requested == ['https://www.wg-gesucht.de/']
+
+
+def test_session_csrf_token_loaded_once_per_login(monkeypatch):
+    page = SimpleNamespace(soup=BeautifulSoup(LISTING, 'lxml'))
+    contactor, requested = _contactor(monkeypatch, page)
+    contactor._get_form_tokens('https://www.wg-gesucht.de/wohnung.123.html')
+    contactor._get_form_tokens('https://www.wg-gesucht.de/wohnung.124.html')
+    assert requested == ['https://www.wg-gesucht.de/']
+
+
+def test_listing_reloaded_with_session_without_cached_page(monkeypatch):
+    contactor, requested = _contactor(monkeypatch, None)
+    url = 'https://www.wg-gesucht.de/wohnung.123.html'
+    contactor._get_form_tokens(url)
+    assert requested == [url]
@@ -0,0 +1,84 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from flathunter.crawler import wggesucht
+from flathunter.crawler.wggesucht import WgGesuchtSessions
+
+SEARCH = 'https://www.wg-gesucht.de/wg-zimmer-in-Berlin.8.0.1.{}.html?offer_filter=1'
+OTHER_SEARCH = 'https://www.wg-gesucht.de/wohnungen-in-Berlin.8.2.1.0.html'
+EXPOSE = 'https://www.wg-gesucht.de/wg-zimmer-in-Berlin-Mitte.1234.html'
+
+
+@pytest.fixture(name='requested')
+def fixture_requested(monkeypatch):
+    requested = []
+
+    def get(url, session=None, **kwargs):
+        requested.append((url, session))
+        # the site sets the filter cookies of a search on its first request
+        if not session.cookies.get('filters'):
+            session.cookies.set('filters', url, domain='www.wg-gesucht.de', path='/')
+        return SimpleNamespace(url=url, status_code=200)
+
+    monkeypatch.setattr(wggesucht.http_client, 'get', get)
+    return requested
+
+
+def test_search_primes_once_and_reuses_its_session(requested):
+    sessions = WgGesuchtSessions({})
+    sessions.search_page(SEARCH.format(0))
+    sessions.search_page(SEARCH.format(1))
+    assert [url for url, _ in requested] == \
+        [SEARCH.format(0), SEARCH.format(0), SEARCH.format(1)]
+    session = requested[0][1]
+    assert all(used is session for _, used in requested)
+    assert session.cookies.get('filters') == SEARCH.format(0)
+
+    sessions.search_page(OTHER_SEARCH)
+    assert len(requested) == 5
+    assert requested[3][1] is requested[4][1] is not session
+
+
+def test_expose_pages_share_the_detail_session(requested):
+    sessions = WgGesuchtSessions({})
+    sessions.search_page(SEARCH.format(0))
+    sessions.get(EXPOSE)
+    sessions.get(EXPOSE)
+    detail_session = requested[-1][1]
+    assert requested[-2][1] is detail_session
+    assert detail_session is not requested[0][1]
+    # pylint: disable-next=protected-access
+    assert sessions._session(WgGesuchtSessions.DETAIL_KEY) is detail_session
+
+
+def test_cookie_file_round_trips_the_primed_searches(requested, tmp_path):
+    cookie_file = tmp_path / 'cookies.json'
+    WgGesuchtSessions({}, str(cookie_file)).search_page(SEARCH.format(0))
+    assert list(json.loads(cookie_file.read_text(encoding='utf-8'))) == [SEARCH.format(0)]
+
+    requested.clear()
+    sessions = WgGesuchtSessions({}, str(cookie_file))
+    sessions.search_page(SEARCH.format(2))
+    # the stored cookies are used, the search is not primed again
+    assert [url for url, _ in requested] == [SEARCH.format(2)]
+    assert requested[0][1].cookies.get('filters') == SEARCH.format(0)
+
+
+def test_expired_cookies_are_not_reused(requested, tmp_path):
+    cookie_file = tmp_path / 'cookies.json'
+    cookie_file.write_text(json.dumps({SEARCH.format(0): {
+        'saved': time.time() - 3600,
+        'cookies': [{'name': 'filters', 'value': 'old', 'domain': 'www.wg-gesucht.de',
+                     'path': '/', 'expires': None}]}}), encoding='utf-8')
+    WgGesuchtSessions({}, str(cookie_file), max_age=60).search_page(SEARCH.format(0))
+    assert len(requested) == 2
+
+
+def test_unreadable_cookie_file_is_ignored(requested, tmp_path):
+    cookie_file = tmp_path / 'cookies.json'
+    cookie_file.write_text('{not json', encoding='utf-8')
+    WgGesuchtSessions({}, str(cookie_file)).search_page(SEARCH.format(0))
+    assert len(requested) == 2